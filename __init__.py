@@ -1,5 +1,8 @@
 from .plot import plot_item_frame, plot_frame, write_plots, make_plot_gallery, animate
 from .iplot import Iplot
 from . import data
+from . import fileio
 from . import geometry
+from . import resample
+from . import expressions
 from .geometry import Dimension
@@ -1,5 +1,18 @@
 from clawpack import pyclaw
+import bisect
+import collections
+import itertools
+from concurrent import futures
 import os
+import re
+import shutil
+import tempfile
+import time
+import weakref
+import numpy as np
+from . import fileio
+from . import geometry
+from . import resample
 
 class TimeSeries(dict):
     r"""A TimeSeries represents a time series of Solution objects.
@@ -12,9 +25,9 @@ class TimeSeries(dict):
         1. from file, based on a path and extension; or
         2. from a controller or list of frames in memory.
 
-        For now, it is assumed that frames are numbered from 0 to N and that
-        all frames exist.  This could be made more general by modifying
-        `list_frames` and `_get_num_data_files`.
+        The frames present are found by scanning the names of the files in
+        the output directory once (see `rescan`); they need not be numbered
+        consecutively.
 
         A TimeSeries can be initialized simply by providing a path
         to a set of output files:
@@ -29,47 +42,847 @@ class TimeSeries(dict):
             [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
             >>> ts._data_format
             'hdf5'
+
+        Frames can also be looked up by time.  The output times are read from
+        the file headers the first time they are needed, without loading
+        the frames themselves:
+
+            >>> ts.frame_time(3)
+            0.18
+            >>> ts.at_time(0.2)
+            3
+            >>> ts.between(0.1, 0.3)
+            [2, 3, 4, 5]
+
+        Loaded frames are kept in a least-recently-used cache.  By default the
+        cache is unbounded; it can be limited by number of frames and/or by
+        the total size (in bytes) of the `q` and `aux` arrays of the cached
+        frames.  When a limit is exceeded, the least recently used frames are
+        evicted (pinned frames are never evicted):
+
+            >>> ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/',
+            ...                              max_frames=2)
+            >>> for frame_num in [0, 1, 0, 2]:
+            ...     frame = ts[frame_num]
+            >>> sorted(ts.keys())
+            ['0', '2']
+            >>> ts.hits, ts.misses, ts.evictions
+            (1, 3, 1)
+
+        When frames are read from file, the next `prefetch` frames (in the
+        direction of the most recent step) can be loaded in the background
+        while the current frame is being used.  Prefetched frames are held
+        outside the cache, so they never evict the frames in use, and are
+        moved into the cache when they are requested.  The background
+        threads are shut down by `close`, or on leaving a `with` block:
+
+            >>> with griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/',
+            ...                              prefetch=2) as ts:
+            ...     frame = ts[0]
+            ...     ts.cache_info()['pending']
+            ['1', '2']
     """
     @property
     def list_frames(self):
         if hasattr(self,'_frame_list'):
             return list(range(len(self._frame_list)))
         else:
-            # Maybe we should get the actual file indices instead
-            return list(range(_get_num_data_files(self._data_path,self._data_format)))
+            if self._frame_files is None:
+                self.rescan()
+            return self._frame_numbers
+
+    @property
+    def from_file(self):
+        r"""True if frames are read from file rather than held in memory."""
+        return hasattr(self, '_data_path')
+
+    def rescan(self):
+        r"""Scan the output directory for frames.  This is done automatically
+            the first time the frames are listed; call it again to pick up
+            frames written since.
+        """
+        self._frame_files = _scan_frames(self._data_path,self._data_format)
+        self._frame_numbers = sorted(self._frame_files)
+        for frame_num in list(self._frame_times):
+            if frame_num not in self._frame_files:
+                del self._frame_times[frame_num]
+        self._time_index = None
+
+    def follow(self, interval=1., timeout=None):
+        r"""Watch the output directory of a running simulation and yield the
+            numbers of new frames as they are completed.  Each new frame is
+            added to `list_frames` before it is yielded.
+
+            A frame counts as complete once all of its files have been
+            written: for ASCII output, the fort.t file must be readable and
+            the fort.q file must contain all the patches it announces; for
+            other formats, the data file must be unchanged between two
+            checks.  The directory is watched with inotify if the optional
+            package `inotify_simple` is installed, and by checking its
+            modification time every `interval` seconds otherwise.  Iteration
+            stops once no new frame has appeared for `timeout` seconds (or
+            never, if `timeout` is None).
+
+            For instance, to plot each frame as it is written:
+
+                for frame_num in ts.follow():   # doctest: +SKIP
+                    griddle.plot_frame(plot_spec, frame_num)
+        """
+        if not hasattr(self, '_data_path'):
+            raise Exception('Only a TimeSeries read from files can follow new output.')
+        known = set(self.list_frames)
+        stamps = {}  # frame number -> (size, mtime) at the previous check
+        watcher = _DirectoryWatcher(self._data_path, interval)
+        last_new = time.time()
+        candidates = {}
+        try:
+            while True:
+                if watcher.changed() or candidates:
+                    found = _scan_frames(self._data_path, self._data_format)
+                    candidates = {n: fname for n, fname in found.items()
+                                  if n not in known}
+                    new = sorted(n for n, fname in candidates.items()
+                                 if _frame_complete(n, fname, self._data_path,
+                                                    self._data_format, stamps))
+                    for frame_num in new:
+                        known.add(frame_num)
+                        del candidates[frame_num]
+                        self._frame_files[frame_num] = found[frame_num]
+                        self._frame_numbers = sorted(self._frame_files)
+                        self._time_index = None
+                        last_new = time.time()
+                        yield frame_num
+                if timeout is not None and time.time() - last_new > timeout:
+                    return
+                watcher.wait()
+        finally:
+            watcher.close()
+
+    def watch(self, callback, interval=1., timeout=None):
+        r"""Call `callback(frame_num)` for each new frame of a running
+            simulation; see `follow`.
+        """
+        for frame_num in self.follow(interval, timeout):
+            callback(frame_num)
+
+    def frame_file(self, frame_num):
+        r"""Return the name of the data file of frame `frame_num`."""
+        if not self.from_file:
+            raise Exception('Frames held in memory have no data files.')
+        self.list_frames
+        return self._frame_files[int(frame_num)]
+
+    def _frame_source(self, frame_num):
+        r"""Return the path passed to the readers of frame `frame_num`: its
+            data file for formats whose file names are discovered by
+            `_scan_frames`, and the data directory otherwise.
+        """
+        if self._data_format in file_readers:
+            return self.frame_file(frame_num)
+        return self._data_path
+
+    def frame_time(self, frame_num):
+        r"""Return the output time of frame `frame_num`.  For frames read
+            from file, only the file header is read.
+        """
+        frame_num = int(frame_num)
+        if hasattr(self,'_frame_list'):
+            return self._frame_list[frame_num].t
+        if frame_num not in self._frame_times:
+            self._frame_times[frame_num] = _read_time(frame_num,
+                                                      self._frame_source(frame_num),
+                                                      self._data_format)
+        return self._frame_times[frame_num]
+
+    @property
+    def times(self):
+        r"""(ndarray) - Output times of the frames in `list_frames`"""
+        return np.array([self.frame_time(n) for n in self.list_frames])
+
+    def at_time(self, t):
+        r"""Return the number of the frame whose output time is closest to t."""
+        frame_numbers, times = self._get_time_index()
+        if len(times) == 0:
+            raise ValueError('The time series has no frames.')
+        i = np.searchsorted(times, t)
+        if i == len(times) or (i > 0 and t - times[i-1] <= times[i] - t):
+            i -= 1
+        return frame_numbers[i]
+
+    def between(self, t0, t1):
+        r"""Return the numbers of the frames with output times in [t0, t1],
+            in order of time.
+        """
+        frame_numbers, times = self._get_time_index()
+        if len(times) == 0:
+            raise ValueError('The time series has no frames.')
+        start = np.searchsorted(times, t0, side='left')
+        stop = np.searchsorted(times, t1, side='right')
+        return list(frame_numbers[start:stop])
+
+    def _get_time_index(self):
+        r"""Return the frame numbers and times, sorted by time."""
+        if getattr(self, '_time_index', None) is None:
+            frame_numbers = np.array(self.list_frames)
+            times = self.times
+            order = np.argsort(times, kind='stable')
+            self._time_index = ([int(n) for n in frame_numbers[order]],
+                                times[order])
+        return self._time_index
 
     def __getitem__(self, key):
         """Accept either integers or strings as keys.
            Load the requested frame if it is not cached already.
         """
-        if type(key) is int:
-            key = str(key)
+        key = _frame_key(key)
         try:
-            return dict.__getitem__(self, key)
+            frame = dict.__getitem__(self, key)
+            self.hits += 1
+            self._lru.move_to_end(key)
         except KeyError:
+            pending = self._pending.pop(key, None)
             try:
-                self[key] = self._get_frame(int(key))
-                return dict.__getitem__(self, key)
-            except:
+                if pending is not None and not pending.cancelled():
+                    frame = pending.result()
+                    self.prefetched += 1
+                else:
+                    frame = self._get_frame(int(key))
+            except Exception:
+                # Errors reading a frame that exists (such as an empty
+                # window) are not mistaken for a missing frame.
+                if int(key) in self.list_frames:
+                    raise
                 print('Frame %s does not exist' % key)
+                return None
+            self.misses += 1
+            self._cache_frame(key, frame)
+        self._schedule_prefetch(int(key))
+        return frame
+
+    def __setitem__(self, key, frame):
+        """Store a frame in the cache, like a loaded one: it counts
+           towards the cache limits and may be evicted.
+        """
+        key = _frame_key(key)
+        self._cancel_pending(key)
+        self._cache_frame(key, frame)
+
+    def update(self, *args, **kwargs):
+        for key, frame in dict(*args, **kwargs).items():
+            self[key] = frame
+
+    def setdefault(self, key, default=None):
+        key = _frame_key(key)
+        if key not in self:
+            self[key] = default
+        return dict.get(self, key, default)
+
+    def __delitem__(self, key):
+        key = _frame_key(key)
+        self._forget(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        key = _frame_key(key)
+        self._cancel_pending(key)
+        if key in self:
+            self._forget(key)
+        return dict.pop(self, key, *default)
+
+    def clear(self):
+        self.cancel_prefetch()
+        for frame in self.values():
+            derived_fields.invalidate(frame)
+        dict.clear(self)
+        self._lru.clear()
+        self._pinned.clear()
+        self._previews.clear()
+        self.nbytes = 0
+
+    def pin(self, key):
+        r"""Keep frame `key` in the cache regardless of the cache limits.
+            The frame is loaded if necessary.
+        """
+        key = _frame_key(key)
+        if self[key] is not None:
+            self._pinned.add(key)
+
+    def unpin(self, key):
+        r"""Allow frame `key` to be evicted from the cache again."""
+        self._pinned.discard(_frame_key(key))
+        self._evict()
+
+    def cache_info(self):
+        r"""Return a dictionary of cache statistics."""
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'prefetched': self.prefetched,
+                'pending': sorted(self._pending, key=int),
+                'frames': len(self._lru),
+                'nbytes': self.nbytes,
+                'pinned': sorted(self._pinned, key=int),
+                'max_frames': self.max_frames,
+                'max_bytes': self.max_bytes}
+
+    def load_all(self, frames=None, workers=None):
+        r"""Load `frames` (by default, all frames in `list_frames`) into the
+            cache, parsing them in `workers` processes (by default, one per
+            CPU).  Frames that are already cached are skipped.
+
+            Each worker writes the values of a frame to a temporary `.npy`
+            file and sends back its patch table and the file name (see
+            `griddle.fileio.sidecar.pack`).  The arrays of the loaded states
+            are views into a memory map of that file, so the data is neither
+            pickled nor copied again after it is parsed.  Note that frames
+            beyond `max_frames` or `max_bytes` are evicted as usual.
+
+            Returns a dictionary reporting the number of frames and bytes
+            loaded, the time taken and the throughput in frames/s and MB/s.
+        """
+        if frames is None:
+            frames = self.list_frames
+        keys = [_frame_key(frame_num) for frame_num in frames]
+        keys = [key for key in keys if not dict.__contains__(self, key)]
+        for key in keys:
+            self._cancel_pending(key)
+        start = time.time()
+        nbytes = 0
+        if not hasattr(self, '_data_path') or workers == 1:
+            loaded = ((key, self._get_frame(int(key))) for key in keys)
+            for key, frame in loaded:
+                self._cache_frame(key, frame)
+                nbytes += _frame_nbytes(frame)
+        else:
+            directory = tempfile.mkdtemp(prefix='griddle')
+            try:
+                with futures.ProcessPoolExecutor(workers) as executor:
+                    packed = executor.map(_load_packed,
+                                          [int(key) for key in keys],
+                                          [self._frame_source(int(key))
+                                           for key in keys],
+                                          [self._data_format]*len(keys),
+                                          [self.read_options]*len(keys),
+                                          [directory]*len(keys))
+                    for key, frame in zip(keys, packed):
+                        frame = fileio.sidecar.unpack(frame)
+                        self._cache_frame(key, frame)
+                        nbytes += _frame_nbytes(frame)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+        self.misses += len(keys)
+        seconds = max(time.time() - start, 1e-9)
+        return {'frames': len(keys), 'bytes': nbytes, 'seconds': seconds,
+                'frames_per_second': len(keys)/seconds,
+                'mb_per_second': nbytes/seconds/2.**20}
+
+    def reductions(self, frames=None, workers=None):
+        r"""Return the minimum, maximum, mean and integral of each component
+            of q for `frames` (by default, all frames), and over the series.
+
+            The result is a dictionary holding the arrays 'frames' and 't',
+            and arrays 'min', 'max', 'mean' and 'integral' of shape
+            (len(frames), num_eqn).  Its entry 'series' is a dictionary
+            of arrays of shape (num_eqn,): the extrema over all frames, the
+            average of the frame means and the time integral (by the
+            trapezoidal rule) of the frame integrals.
+
+            Means and integrals only count the finest data available at each
+            point: cells covered by patches of the next level are excluded.
+            Reductions are always computed from the full data of a frame,
+            whatever the field and window restrictions of the series.
+
+            Frames read from files are reduced in `workers` processes (see
+            `load_all`), and the results are cached in memory and in files
+            in the `_griddle` subdirectory, stamped with the modification
+            time of the data.  The frames of a series held in memory are
+            reduced in this process, and `workers` is ignored.
+
+                >>> amr = TimeSeries('./test_data/_amrclaw_2d_acoustics/')
+                >>> ts = TimeSeries([amr[n] for n in range(3)])
+                >>> r = ts.reductions()
+                >>> r['max'][:, 0].round(3)
+                array([2.   , 1.124, 1.316])
+                >>> r['integral'][:, 0].round(4)
+                array([1.2566, 1.2566, 1.2566])
+                >>> r['series']['max'].round(3)
+                array([2.   , 0.555, 0.555])
+        """
+        if frames is None:
+            frames = self.list_frames
+        frames = [int(frame_num) for frame_num in frames]
+        missing = [n for n in frames if n not in self._reductions]
+        if not hasattr(self, '_data_path'):
+            for frame_num in missing:
+                self._reductions[frame_num] = \
+                    _frame_reductions(self._get_frame(frame_num))
+        else:
+            options = self._unrestricted_options()
+            for frame_num in list(missing):
+                cached = fileio.cache.load(self._reductions_file(frame_num),
+                                           self._source_files(frame_num))
+                if cached is not None:
+                    self._reductions[frame_num] = (float(cached['t']),
+                                                   cached['values'])
+                    missing.remove(frame_num)
+            if workers == 1:
+                self._store_reductions(
+                    missing, (_reduce_frame(n, self._frame_source(n),
+                                            self._data_format, options)
+                              for n in missing))
+            else:
+                with futures.ProcessPoolExecutor(workers) as executor:
+                    self._store_reductions(missing, executor.map(
+                        _reduce_frame, missing,
+                        [self._frame_source(n) for n in missing],
+                        [self._data_format]*len(missing),
+                        [options]*len(missing)))
+
+        t = np.array([self._reductions[n][0] for n in frames])
+        values = np.array([self._reductions[n][1] for n in frames])
+        result = {'frames': np.array(frames), 't': t}
+        for i, name in enumerate(reduction_names):
+            result[name] = values[:, i]
+        result['series'] = {'min': result['min'].min(axis=0),
+                            'max': result['max'].max(axis=0),
+                            'mean': result['mean'].mean(axis=0),
+                            'integral': _trapezoid(result['integral'], t)}
+        return result
+
+    def _store_reductions(self, frames, computed):
+        r"""Keep the reductions `computed` of `frames`, in memory and in
+            files.
+        """
+        for frame_num, (t, values) in zip(frames, computed):
+            self._reductions[frame_num] = (t, values)
+            fileio.cache.save(self._reductions_file(frame_num),
+                              self._source_files(frame_num),
+                              t=t, values=values)
+
+    def _unrestricted_options(self, fields=None):
+        r"""Return the read options without the loading window and field
+            restrictions of the series, loading only `fields` (all
+            components if None) instead.
+        """
+        options = dict((key, value) for key, value in self.read_options.items()
+                       if key not in ('fields', 'bbox', 'max_level'))
+        if fields is not None:
+            options['fields'] = sorted(set(fields))
+        return options
+
+    def _source_files(self, frame_num):
+        r"""Return the names of all files that frame `frame_num` is read
+            from, for stamping files derived from it.
+        """
+        if self._data_format == 'ascii':
+            return fileio.ascii.source_files(int(frame_num), self._data_path)
+        return [self.frame_file(frame_num)]
+
+    def _reductions_file(self, frame_num):
+        fname = self.frame_file(frame_num)
+        name = '%s.%s.reductions.npz' % (os.path.basename(fname), frame_num)
+        return fileio.cache.cache_file(os.path.dirname(fname), name)
+
+    def probe(self, points, fields=None, start=None, stop=None, stride=1,
+              prefetch=2):
+        r"""Return the values of q at `points`, an array of shape
+            (num_points, num_dim) (or a 1D array of x values for 1D data), in
+            the frames chosen as by `iter_frames(start, stop, stride)`.
+
+            Each point is evaluated on the finest patch that contains it,
+            by multilinear interpolation between cell centers (values are
+            held constant beyond the outermost centers).  Points outside all
+            patches give NaN.  On mapped grids, the points are physical
+            coordinates and are mapped back with `griddle.geometry.Grid.mapp2c`.
+            Frames are streamed as by `iter_frames`, so at most `prefetch` of
+            them are in memory at a time.
+
+            Frames are read with all patches and only the components
+            `fields`, regardless of `set_window` and `require_fields`;
+            cached frames are used when they hold that data.
+
+            Returns an array of shape (num_frames, num_points, num_fields),
+            where the fields are the components of q listed in `fields`
+            (by default, all of them).
+
+                >>> ts = TimeSeries('./test_data/_amrclaw_2d_acoustics/')
+                >>> ts.probe([[0., 0.], [0.5, -0.5]], fields=[0], stop=3).shape
+                (3, 2, 1)
+        """
+        points = np.asarray(points, dtype=float)
+        if points.ndim == 1:
+            points = points[:, np.newaxis]
+        frames = self._iter_frames(start, stop, stride, prefetch,
+                                   self._probe_loader(fields))
+        values = [_probe_frame(frame, points, fields) for frame_num, frame in
+                  frames]
+        return np.array(values)
+
+    def _probe_loader(self, fields):
+        r"""Return a function that loads a frame with all patches and at
+            least the components `fields` without caching it, taking it from
+            the cache if the cached frames are complete enough.
+        """
+        if not self.from_file:
+            return self._stream_frame
+        use_cache = self.bbox is None and self.max_level is None and \
+            (self.fields is None or
+             (fields is not None and set(fields) <= self.fields))
+        options = self._unrestricted_options(fields)
+        def load(frame_num):
+            frame = dict.get(self, _frame_key(frame_num)) if use_cache else None
+            if frame is None:
+                frame = _read_frame(frame_num, self._frame_source(frame_num),
+                                    self._data_format, options)
+            return frame
+        return load
+
+    def line_out(self, begin, end, num_points=100, **kwargs):
+        r"""Return the points of a line from `begin` to `end` and the values
+            of q along it; see `probe` for the arguments and the shape of the
+            values.
+        """
+        weights = np.linspace(0., 1., num_points)[:, np.newaxis]
+        begin = np.atleast_1d(np.asarray(begin, dtype=float))
+        end = np.atleast_1d(np.asarray(end, dtype=float))
+        points = (1. - weights)*begin + weights*end
+        return points, self.probe(points, **kwargs)
+
+    def preview(self, frame_num, field=0, num_levels=3, frame=None):
+        r"""Return a multi-resolution preview of a field of a frame: a
+            dictionary holding the corners 'lower' and 'upper' of the
+            frame, the 'levels' of a `griddle.resample.Pyramid` of its
+            composite at the resolution of the finest cells and of its
+            averages over blocks of 2, 4, 8, ... pixels (`num_levels`
+            coarser levels), and their 'shapes'.  The frame is composited
+            when a level is first used.
+
+            Previews of cached frames are kept until the frame leaves the
+            cache.  `frame` may be passed if it has been loaded already
+            (e.g., by `iter_frames`); otherwise it is loaded by indexing.
+        """
+        key = (_frame_key(frame_num), field, num_levels)
+        if key not in self._previews:
+            if frame is None:
+                frame = self[frame_num]
+            elif not dict.__contains__(self, key[0]):
+                return _make_preview(frame, field, num_levels)
+            self._previews[key] = _make_preview(frame, field, num_levels)
+        return self._previews[key]
+
+    def iter_frames(self, start=None, stop=None, stride=1, prefetch=2):
+        r"""Yield pairs `(frame_num, frame)` in order, for the frames in
+            `list_frames` with `start <= frame_num < stop`, taking every
+            `stride`-th of them.
+
+            Unlike indexing, this does not add frames to the cache: at most
+            `prefetch` frames are held at a time, namely the frame being
+            processed by the caller and the following `prefetch - 1` frames,
+            which are loaded in the background meanwhile.  Frames that are
+            already cached are taken from the cache.
+
+                >>> ts = TimeSeries('./test_data/_amrclaw_2d_acoustics/')
+                >>> [(n, frame.t) for n, frame in ts.iter_frames(2, 7, 2)]
+                [(2, 0.1), (4, 0.2), (6, 0.3)]
+                >>> len(ts)
+                0
+        """
+        return self._iter_frames(start, stop, stride, prefetch,
+                                 self._stream_frame)
+
+    def _iter_frames(self, start, stop, stride, prefetch, load):
+        r"""Implement `iter_frames`, loading frames with `load(frame_num)`."""
+        frame_numbers = [n for n in self.list_frames
+                         if (start is None or n >= start) and
+                            (stop is None or n < stop)][::stride]
+        executor = None
+        if prefetch > 1 and hasattr(self, '_data_path'):
+            executor = futures.ThreadPoolExecutor(self.prefetch_workers)
+        pending = collections.deque()
+        submitted = 0
+        try:
+            for i, frame_num in enumerate(frame_numbers):
+                if executor is None:
+                    frame = load(frame_num)
+                else:
+                    while submitted < min(i + prefetch, len(frame_numbers)):
+                        pending.append(executor.submit(load,
+                                                       frame_numbers[submitted]))
+                        submitted += 1
+                    frame = pending.popleft().result()
+                yield frame_num, frame
+                frame = None
+        finally:
+            if executor is not None:
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+    def _stream_frame(self, frame_num):
+        r"""Return a frame from the cache if it is there, and load it without
+            caching it otherwise.
+        """
+        frame = dict.get(self, _frame_key(frame_num))
+        if frame is None:
+            frame = self._get_frame(frame_num)
+        return frame
+
+    def frame_index(self, frame_num):
+        r"""Return the header-only patch index of a frame, without loading
+            its data.  See `griddle.fileio.ascii.read_index`.
+
+            For frames held in memory, the index is built from the patches
+            of the frame, and its 'offset' and 'nbytes' count values of q
+            rather than bytes (see `griddle.fileio.sidecar.index_states`).
+        """
+        key = _frame_key(frame_num)
+        if not hasattr(self, '_data_path'):
+            frame = self[key]
+            if frame is None:
+                raise KeyError('Frame %s does not exist' % key)
+            return {'t': frame.t, 'num_eqn': frame.states[0].num_eqn,
+                    'num_aux': frame.states[0].num_aux,
+                    'num_dim': frame.states[0].patch.num_dim,
+                    'patches': fileio.sidecar.index_states(frame.states)}
+        if self._data_format != 'ascii':
+            raise Exception('Patch indices are only available for ASCII data.')
+        if key not in self._frame_indices:
+            self._frame_indices[key] = \
+                fileio.ascii.read_index(int(key), path=self._data_path,
+                                        persist=self.persist_index)
+        return self._frame_indices[key]
+
+    def require_fields(self, fields):
+        r"""Load only the components `fields` of q when frames are read from
+            file; the other components are filled with NaN.  If `fields` is
+            None, all components are loaded.  Cached frames are discarded if
+            they may lack any of the requested components.
+        """
+        if fields is not None:
+            fields = set(fields)
+        if fields == self.fields:
+            return
+        if self.fields is not None and (fields is None or not fields <= self.fields):
+            self.clear()
+        self.fields = fields
+        if fields is None:
+            self.read_options.pop('fields', None)
+        else:
+            self.read_options['fields'] = sorted(fields)
+
+    def set_window(self, bbox=None, max_level=None):
+        r"""Load only the patches that intersect the bounding box `bbox` and
+            whose level is at most `max_level` when frames are read from file.
+            `bbox` is a list of (lower, upper) pairs, one per dimension (see
+            `griddle.fileio.ascii.select_patches`).  Cached frames are
+            discarded when the window changes.  The bounding box is ignored
+            for mapped grids.  Frames held in memory cannot be windowed.
+        """
+        self._apply_window(bbox, max_level)
+        self._user_window = (self.bbox, self.max_level)
+
+    def narrow_window(self, bbox=None, max_level=None):
+        r"""Load only the patches in both the window set with `set_window`
+            (or when the series was created) and the window given by `bbox`
+            and `max_level`.  The window set with `set_window` is kept, so
+            later calls may widen the window up to it again.  Plots use this
+            to load only the visible patches.
+        """
+        self._apply_window(*_intersect_windows(self._user_window,
+                                               (bbox, max_level)))
+
+    def _apply_window(self, bbox, max_level):
+        if not self.from_file:
+            if bbox is None and max_level is None:
+                return
+            raise Exception('Loading windows only apply to frames read '
+                            'from file.')
+        if bbox is not None:
+            bbox = [None if limits is None else tuple(limits) for limits in bbox]
+        if bbox == self.bbox and max_level == self.max_level:
+            return
+        self.clear()
+        self.bbox = bbox
+        self.max_level = max_level
+        for key, value in (('bbox', bbox), ('max_level', max_level)):
+            if value is None:
+                self.read_options.pop(key, None)
+            else:
+                self.read_options[key] = value
+
+    def cancel_prefetch(self, keep=()):
+        r"""Cancel background loads of all frames except those in `keep`.
+            Loads that have already started are allowed to finish, but
+            their results are discarded.
+        """
+        keep = [_frame_key(key) for key in keep]
+        for key in list(self._pending):
+            if key not in keep:
+                self._cancel_pending(key)
+
+    def close(self):
+        r"""Cancel background loads and shut down the prefetch threads.  They
+            are started again if more frames are requested.
+        """
+        self.cancel_prefetch()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown(wait=False)
+
+    def _cancel_pending(self, key):
+        future = self._pending.pop(key, None)
+        if future is not None:
+            future.cancel()
 
-    def __init__(self,path_or_list,file_format=None):
+    def _schedule_prefetch(self, frame_num):
+        r"""Start loading the `prefetch` frames following `frame_num` in the
+            current direction of travel.  Pending loads outside this window
+            (e.g., after a jump) are cancelled.
+        """
+        last_frame, self._last_frame = self._last_frame, frame_num
+        if not self.prefetch or not hasattr(self, '_data_path'):
+            return
+        if last_frame is not None and frame_num != last_frame:
+            self._direction = 1 if frame_num > last_frame else -1
+        # The frames that follow in the direction of travel
+        frame_numbers = self.list_frames
+        if self._direction > 0:
+            start = bisect.bisect_right(frame_numbers, frame_num)
+            window = frame_numbers[start:start+self.prefetch]
+        else:
+            stop = bisect.bisect_left(frame_numbers, frame_num)
+            window = frame_numbers[max(stop-self.prefetch, 0):stop][::-1]
+        window = [_frame_key(n) for n in window]
+        self.cancel_prefetch(keep=window)
+
+        if self._executor is None:
+            self._executor = futures.ThreadPoolExecutor(self.prefetch_workers)
+        for key in window:
+            if key not in self and key not in self._pending:
+                self._pending[key] = self._executor.submit(self._get_frame,
+                                                           int(key))
+
+    def _cache_frame(self, key, frame):
+        r"""Store a newly loaded frame and evict old frames if the cache
+            limits are exceeded.
+        """
+        if key in self:
+            self._forget(key)
+        dict.__setitem__(self, key, frame)
+        self._lru[key] = _frame_nbytes(frame)
+        self.nbytes += self._lru[key]
+        self._evict(keep=key)
+
+    def _forget(self, key):
+        r"""Remove the cache bookkeeping for `key`, and the derived fields
+            computed from the frame.
+        """
+        frame = dict.get(self, key)
+        if frame is not None:
+            # invalidate(None) would discard the derived fields of all frames
+            derived_fields.invalidate(frame)
+        self.nbytes -= self._lru.pop(key, 0)
+        self._pinned.discard(key)
+        for preview_key in [k for k in self._previews if k[0] == key]:
+            del self._previews[preview_key]
+
+    def _over_budget(self):
+        if self.max_frames is not None and len(self._lru) > self.max_frames:
+            return True
+        if self.max_bytes is not None and self.nbytes > self.max_bytes:
+            return True
+        return False
+
+    def _evict(self, keep=None):
+        r"""Evict least recently used frames until the cache fits within
+            `max_frames` and `max_bytes`.  Pinned frames and the frame `keep`
+            are never evicted.
+        """
+        candidates = [key for key in self._lru
+                      if key not in self._pinned and key != keep]
+        for key in candidates:
+            if not self._over_budget():
+                break
+            self._forget(key)
+            dict.__delitem__(self, key)
+            self.evictions += 1
+
+    def __init__(self,path_or_list,file_format=None,max_frames=None,max_bytes=None,
+                 prefetch=0,prefetch_workers=1,persist_index=False,sidecars=False,
+                 fields=None,bbox=None,max_level=None):
         """Set up the function _get_frame, which loads individual
            frames (either from memory or from file).
+
+           Optional arguments `max_frames` and `max_bytes` bound the
+           number of cached frames and their total array size.  If
+           `prefetch` is positive, that many frames ahead of the most
+           recently requested one are loaded on `prefetch_workers`
+           background threads.  If `persist_index` is True, patch indices
+           are saved alongside the data (see `frame_index`).  If `sidecars`
+           is True, ASCII frames are converted to binary sidecar files the
+           first time they are read, and memory-mapped from them afterwards
+           (see `griddle.fileio.sidecar`).  `fields` restricts loading to
+           the given components of q (see `require_fields`), and `bbox` and
+           `max_level` restrict it to a subset of the patches (see
+           `set_window`).
         """
         super(TimeSeries, self).__init__()
 
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self._lru = collections.OrderedDict()  # frame key -> size in bytes
+        self._pinned = set()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.prefetch = prefetch
+        self.prefetch_workers = prefetch_workers
+        self.prefetched = 0
+        self._pending = {}  # frame key -> Future
+        self._executor = None
+        self._last_frame = None
+        self._direction = 1
+
+        self.persist_index = persist_index
+        self._frame_indices = {}
+        self.read_options = {}
+        self.fields = None
+
+        self._frame_times = {}
+        self._time_index = None
+        self._reductions = {}  # frame number -> (t, array of reductions)
+        self._previews = {}  # (frame key, field, num_levels) -> pyramid
+
         if type(path_or_list) == str:
             # It's a path
             self._data_path = path_or_list
+            self._frame_files = None
             if file_format is None:
                 self._data_format = _get_data_format(self._data_path)
             else:
                 self._data_format = file_format
+            if self._data_format == 'ascii':
+                if sidecars:
+                    self.read_options['sidecar'] = True
+                if persist_index:
+                    self.read_options['persist_index'] = True
             self._get_frame = lambda frame_num: \
-                                      pyclaw.Solution(frame_num,
-                                                      path=self._data_path,
-                                                      file_format=self._data_format)
+                                      _read_frame(frame_num,
+                                                  self._frame_source(frame_num),
+                                                  self._data_format,
+                                                  self.read_options)
         elif hasattr(path_or_list, '__getitem__'):
             # It's a list of frames
             self._frame_list = path_or_list
@@ -78,24 +891,446 @@ class TimeSeries(dict):
             raise Exception('TimeSeries must be initialized \
                     with a path or list of frames.')
 
+        if fields is not None:
+            self.require_fields(fields)
+        self.bbox = None
+        self.max_level = None
+        self._user_window = (None, None)
+        self.set_window(bbox, max_level)
+
+
+class DerivedFieldCache(object):
+    r"""Memoize derived fields, i.e. functions of a State such as vorticity
+        or pressure, so that each is computed once per state however many
+        plot items show it.
+
+        Values are stored per state and keyed by the field function, or by
+        its declared name (see `derived_field`).  States are held by weak
+        reference, so values disappear with their frame; TimeSeries also
+        invalidates the values of a frame explicitly when the frame is
+        evicted or reloaded.
+
+            >>> calls = []
+            >>> @derived_field('speed')
+            ... def speed(state):
+            ...     calls.append(state)
+            ...     return abs(state.q[0])
+            >>> frame = TimeSeries('./test_data/_amrclaw_2d_acoustics/')[0]
+            >>> cache = DerivedFieldCache()
+            >>> values = [cache.get(state, speed) for state in frame.states]
+            >>> values = [cache.get(state, speed) for state in frame.states]
+            >>> len(calls) == len(frame.states), cache.hits == len(frame.states)
+            (True, True)
+    """
+    def __init__(self):
+        self._values = weakref.WeakKeyDictionary()  # state -> {key: values}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, state, field):
+        r"""Return `field(state)`, computing it only if it is not cached."""
+        key = getattr(field, 'field_name', field)
+        try:
+            values = self._values.setdefault(state, {})
+        except TypeError:
+            # States that cannot be referenced weakly are not cached
+            return field(state)
+        if key in values:
+            self.hits += 1
+        else:
+            self.misses += 1
+            values[key] = field(state)
+        return values[key]
+
+    def contains(self, state, field):
+        r"""Check whether `field` is cached for `state`."""
+        try:
+            return getattr(field, 'field_name', field) in self._values.get(state, {})
+        except TypeError:
+            return False
+
+    def put(self, state, field, values):
+        r"""Store precomputed values of `field` for `state`."""
+        try:
+            self._values.setdefault(state, {})[getattr(field, 'field_name', field)] = values
+        except TypeError:
+            pass
+
+    def invalidate(self, frame=None, field=None):
+        r"""Discard the cached values of `field` (by default, all fields) for
+            the states of `frame` (by default, all states).
+        """
+        if frame is None:
+            states = list(self._values.keys())
+        else:
+            states = getattr(frame, 'states', [])
+        key = getattr(field, 'field_name', field)
+        for state in states:
+            if field is None:
+                self._values.pop(state, None)
+            elif state in self._values:
+                self._values[state].pop(key, None)
+
+
+def derived_field(name):
+    r"""Decorator declaring the name of a derived field.  Functions with the
+        same name share cached values (see `DerivedFieldCache`), so a field
+        may be redefined, e.g. as a lambda in each plot item, without being
+        recomputed.
+    """
+    def declare(function):
+        function.field_name = name
+        return function
+    return declare
+
+
+# The cache shared by all plot items
+derived_fields = DerivedFieldCache()
+
+
+def _frame_key(key):
+    r"""Frames are stored under string keys; accept integers too."""
+    if type(key) is int:
+        key = str(key)
+    return key
+
 
-def _get_num_data_files(path,file_format):
-    r"""Count the number of output files of type file_format in directory
-        specified by path.
+def _frame_nbytes(frame):
+    r"""Return the memory used by the `q` and `aux` arrays of all states
+        in a frame (solution).
     """
-    files = os.listdir(path)
-    file_string = file_substrings[file_format]
-    data_files = [file_string in filename for filename in files]
-    return data_files.count(True)
+    nbytes = 0
+    for state in getattr(frame, 'states', []):
+        for array in (state.q, state.aux):
+            if array is not None:
+                nbytes += array.nbytes
+    return nbytes
+
+
+def _intersect_windows(first, second):
+    r"""Return the intersection of two loading windows, each a pair
+        `(bbox, max_level)` as for `TimeSeries.set_window`.
+    """
+    (bbox1, level1), (bbox2, level2) = first, second
+    levels = [level for level in (level1, level2) if level is not None]
+    max_level = min(levels) if levels else None
+    if bbox1 is None or bbox2 is None:
+        return (bbox2 if bbox1 is None else bbox1), max_level
+    num_dim = max(len(bbox1), len(bbox2))
+    bbox = []
+    for d in range(num_dim):
+        limits = [box[d] for box in (bbox1, bbox2)
+                  if d < len(box) and box[d] is not None]
+        if not limits:
+            bbox.append(None)
+        else:
+            bbox.append((max(lower for lower, upper in limits),
+                         min(upper for lower, upper in limits)))
+    return bbox, max_level
+
+
+def _read_frame(frame_num,path,file_format,options={}):
+    r"""Read a single frame from file, using a griddle reader if one exists
+        for `file_format` and PyClaw otherwise.  `options` are passed to
+        griddle readers only.
+    """
+    if file_format in readers:
+        return readers[file_format](frame_num,path=path,**options)
+    return pyclaw.Solution(frame_num,path=path,file_format=file_format)
+
+
+def _load_packed(frame_num,path,file_format,options,directory):
+    r"""Read a frame in a worker process and pack it for sending back, with
+        its values in a file in `directory`.
+    """
+    return fileio.sidecar.pack(_read_frame(frame_num,path,file_format,options),
+                               directory)
+
+
+def _reduce_frame(frame_num,path,file_format,options):
+    r"""Read a frame (in a worker process) and compute its reductions."""
+    return _frame_reductions(_read_frame(frame_num,path,file_format,options))
+
+
+def _frame_reductions(frame):
+    r"""Return the time of a frame and an array of shape (4, num_eqn) holding
+        the minimum, maximum, mean and integral of each component of q.
+        Means and integrals exclude cells covered by finer patches, and
+        weight cells by their physical volume.
+    """
+    states = frame.states
+    num_eqn = states[0].num_eqn
+    values = np.empty((len(reduction_names), num_eqn))
+    values[0] = np.inf
+    values[1] = -np.inf
+    integral = np.zeros(num_eqn)
+    volume = 0.
+    for state, finer in zip(states, _finer_patches(states)):
+        patch = state.patch
+        q = state.q
+        axes = tuple(range(1, q.ndim))
+        values[0] = np.minimum(values[0], q.min(axis=axes))
+        values[1] = np.maximum(values[1], q.max(axis=axes))
+        uncovered = ~_covered_cells(patch, finer)
+        cell_volumes = _cell_volumes(state)
+        if np.isscalar(cell_volumes):
+            integral += q[:, uncovered].sum(axis=1)*cell_volumes
+            volume += uncovered.sum()*cell_volumes
+        else:
+            weights = cell_volumes[uncovered]
+            integral += (q[:, uncovered]*weights).sum(axis=1)
+            volume += weights.sum()
+    values[2] = integral/volume
+    values[3] = integral
+    return frame.t, values
+
+
+def _cell_volumes(state):
+    r"""Return the physical volume of the cells of a state: a scalar for
+        unmapped grids, and otherwise an array of the lengths (1D), areas
+        (2D) or approximate volumes (3D) of the mapped cells.
+    """
+    grid = state.grid
+    if geometry.is_identity_map(grid.mapc2p):
+        return np.prod(state.patch.delta)
+    nodes = np.stack([np.asarray(x, dtype=float) for x in grid.p_nodes],
+                     axis=-1)
+    if nodes.ndim == 2:
+        return np.abs(np.diff(nodes[:, 0]))
+    if nodes.ndim == 3:
+        # Half the cross product of the diagonals of each quadrilateral
+        d1 = nodes[1:, 1:] - nodes[:-1, :-1]
+        d2 = nodes[:-1, 1:] - nodes[1:, :-1]
+        return 0.5*np.abs(d1[..., 0]*d2[..., 1] - d1[..., 1]*d2[..., 0])
+    # Determinant of the edge vectors of each hexahedron, averaged over
+    # the four parallel edges in each direction
+    edges = []
+    for axis in range(3):
+        edge = np.diff(nodes, axis=axis)
+        for other in range(3):
+            if other != axis:
+                edge = 0.5*(np.take(edge, range(edge.shape[other] - 1), other) +
+                            np.take(edge, range(1, edge.shape[other]), other))
+        edges.append(edge)
+    return np.abs(np.linalg.det(np.stack(edges, axis=-1)))
+
+
+def _finer_patches(states):
+    r"""Return, for each state, the patches of the next level that intersect
+        its patch.  The patches of each level are indexed once (see
+        `geometry.PatchIndex`), so that each patch is only tested against
+        its neighbours.
+    """
+    levels = {}
+    for state in states:
+        levels.setdefault(state.patch.level, []).append(state.patch)
+    indices = {level: geometry.PatchIndex(patches)
+               for level, patches in levels.items()}
+    finer = []
+    for state in states:
+        patch = state.patch
+        level = patch.level + 1
+        if level not in levels:
+            finer.append([])
+            continue
+        hits = indices[level].query_box(patch.lower_global,
+                                        patch.upper_global)
+        finer.append([levels[level][i] for i in hits])
+    return finer
+
+
+def _covered_cells(patch, others):
+    r"""Return a boolean array marking the cells of `patch` whose centers lie
+        within any of the patches `others`.
+    """
+    centers = [lower + (np.arange(n) + 0.5)*delta for lower, n, delta in
+               zip(patch.lower_global, patch.num_cells_global, patch.delta)]
+    covered = np.zeros(patch.num_cells_global, dtype=bool)
+    for other in others:
+        masks = [(c > lower) & (c < upper) for c, lower, upper in
+                 zip(centers, other.lower_global, other.upper_global)]
+        covered[np.ix_(*masks)] = True
+    return covered
+
+
+def _trapezoid(values, t):
+    r"""Integrate `values` (of shape (len(t), ...)) in time."""
+    if len(t) < 2:
+        return np.zeros(values.shape[1:])
+    order = np.argsort(t)
+    values, t = values[order], t[order]
+    dt = np.diff(t).reshape((-1,) + (1,)*(values.ndim - 1))
+    return (0.5*dt*(values[1:] + values[:-1])).sum(axis=0)
+
+
+def _make_preview(frame, field, num_levels):
+    r"""Compute the preview pyramid of a field of a frame; see
+        TimeSeries.preview.
+    """
+    patches = [state.patch for state in frame.states]
+    lower = np.min([patch.lower_global for patch in patches], axis=0)
+    upper = np.max([patch.upper_global for patch in patches], axis=0)
+    levels = resample.Pyramid(frame, lower, upper, field, num_levels)
+    return {'lower': lower, 'upper': upper, 'shapes': levels.shapes,
+            'levels': levels}
+
+
+def _probe_frame(frame, points, fields=None):
+    r"""Interpolate q at `points` (of shape (num_points, num_dim)) on the
+        finest patch of `frame` containing each point.
+    """
+    states = frame.states
+    mapc2p = states[0].grid.mapc2p
+    if not geometry.is_identity_map(mapc2p):
+        points = _computational_points(states, mapc2p, points)
+    index = geometry.PatchIndex([state.patch for state in states])
+    valid = ~np.isnan(points).any(axis=1)
+    finest = np.full(len(points), -1)
+    if valid.any():
+        finest[valid] = index.locate(points[valid])
+    found = finest >= 0
+
+    num_fields = states[0].num_eqn if fields is None else len(fields)
+    values = np.full((len(points), num_fields), np.nan)
+    for j in np.unique(finest[found]):
+        which = np.nonzero(found & (finest == j))[0]
+        q = states[j].q if fields is None else states[j].q[list(fields)]
+        values[which] = _interpolate(q, states[j].patch, points[which]).T
+    return values
+
+
+def _computational_points(states, mapc2p, points):
+    r"""Map physical `points` (of shape (num_points, num_dim)) back to the
+        computational coordinates of the mapped grid of `states`, on a grid
+        spanning all patches at the resolution of the coarsest one.  Points
+        that cannot be mapped back are NaN.
+    """
+    patches = [state.patch for state in states]
+    lower = np.min([patch.lower_global for patch in patches], axis=0)
+    upper = np.max([patch.upper_global for patch in patches], axis=0)
+    delta = np.max([patch.delta for patch in patches], axis=0)
+    num_cells = np.maximum(np.round((upper - lower)/delta).astype(int), 1)
+    grid = geometry.Grid([geometry.Dimension(lo, up, int(n), name=name)
+                          for lo, up, n, name in
+                          zip(lower, upper, num_cells, 'xyz')])
+    grid.mapc2p = mapc2p
+    return np.stack(grid.mapp2c(*points.T), axis=1)
+
+
+def _interpolate(q, patch, points):
+    r"""Interpolate the cell-centered values q (of shape (num_var, n1, ...,
+        nd)) of `patch` multilinearly at `points`, which lie in the patch.
+        Returns an array of shape (num_var, num_points).
+    """
+    num_cells = np.array(patch.num_cells_global)
+    # Position in units of cells, relative to the first cell center
+    s = (points - np.array(patch.lower_global))/np.array(patch.delta) - 0.5
+    i0 = np.clip(np.floor(s).astype(int), 0, np.maximum(num_cells - 2, 0))
+    i1 = np.minimum(i0 + 1, num_cells - 1)
+    w = np.clip(s - i0, 0., 1.)
+    values = np.zeros((q.shape[0], len(points)))
+    for corner in itertools.product((0, 1), repeat=points.shape[1]):
+        index = tuple(np.where(c, i1[:, d], i0[:, d]) for d, c in enumerate(corner))
+        weight = np.prod([w[:, d] if c else 1. - w[:, d]
+                          for d, c in enumerate(corner)], axis=0)
+        values += weight*q[(slice(None),) + index]
+    return values
+
+
+def _scan_frames(path,file_format):
+    r"""Return a dictionary mapping frame numbers to the names of the data
+        files of type file_format in directory path.
+    """
+    if file_format in frame_scanners:
+        return frame_scanners[file_format](path)
+    pattern = re.compile(frame_patterns[file_format])
+    frame_files = {}
+    for filename in os.listdir(path):
+        match = pattern.match(filename)
+        if match:
+            frame_files[int(match.group(1))] = os.path.join(path,filename)
+    return frame_files
+
+
+def _frame_complete(frame_num,fname,path,file_format,stamps):
+    r"""Check whether all files of a frame have been completely written.
+        `stamps` holds the (size, mtime) of data files at the previous
+        check and is updated.
+    """
+    if file_format == 'ascii':
+        try:
+            index = fileio.ascii.read_index(frame_num, path=path)
+        except (IOError, OSError, ValueError, IndexError):
+            return False
+        patches = index['patches']
+        return len(patches) == 0 or \
+            patches['offset'][-1] + patches['nbytes'][-1] <= os.path.getsize(fname)
+    try:
+        stat = os.stat(fname)
+    except OSError:
+        return False
+    stamp = (stat.st_size, stat.st_mtime)
+    previous, stamps[frame_num] = stamps.get(frame_num), stamp
+    return stat.st_size > 0 and stamp == previous
+
+
+class _DirectoryWatcher(object):
+    r"""Detect changes in a directory, using inotify if the package
+        `inotify_simple` is available and directory mtime polling otherwise.
+    """
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self._mtime = None
+        self._events = True  # Check the directory on the first call
+        try:
+            from inotify_simple import INotify, flags
+            self._inotify = INotify()
+            self._inotify.add_watch(path, flags.CLOSE_WRITE | flags.MOVED_TO |
+                                          flags.CREATE | flags.MODIFY)
+        except (ImportError, OSError):
+            self._inotify = None
+
+    def changed(self):
+        r"""Return True if the directory may have changed since the last call."""
+        if self._inotify is not None:
+            changed, self._events = self._events, False
+            return changed
+        mtime = os.stat(self.path).st_mtime_ns
+        changed, self._mtime = mtime != self._mtime, mtime
+        return changed
+
+    def wait(self):
+        r"""Wait for a change in the directory, or at most `interval` seconds."""
+        if self._inotify is not None:
+            if self._inotify.read(timeout=int(1000*self.interval)):
+                self._events = True
+        else:
+            time.sleep(self.interval)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+
+
+def _read_time(frame_num,path,file_format):
+    r"""Read the output time of a frame, from the file header if possible."""
+    if file_format in time_readers:
+        return time_readers[file_format](frame_num,path=path)
+    return _read_frame(frame_num,path,file_format).t
 
 
 def _get_data_format(path):
     r"""Figure out which file format to read.
 
         Check which of the known file types are present in directory specified
-        by `path`.  If multiple types are present, ask user which to use.
+        by `path` (or, if `path` is a file, which type it is).  If multiple
+        types are present, ask user which to use.
     """
-    files = os.listdir(path)
+    if os.path.isfile(path):
+        files = [os.path.basename(path)]
+    else:
+        files = os.listdir(path)
     file_types_present = []
     for file_type, string in file_substrings.items():
         if any([string in filename for filename in files]):
@@ -109,9 +1344,35 @@ def _get_data_format(path):
                         """+file_types_present)
 
 
+# Per-field reductions computed by TimeSeries.reductions
+reduction_names = ('min', 'max', 'mean', 'integral')
+
 file_substrings = {'ascii': 'fort.q',  # should be 'extensions'
                    'hdf5': 'hdf',
-                   'petsc': 'ptc'}
+                   'petsc': 'ptc',
+                   'archive': fileio.archive.extension}
+
+# File names of individual frames; the group is the frame number
+frame_patterns = {'ascii': r'fort\.q(\d+)$',
+                  'hdf5': r'\D*(\d+)\.hdf5?$',
+                  'petsc': r'.*\.ptc(\d+)$'}
+
+# Formats whose readers are given the data file of a frame rather than the
+# data directory, since its name is not fixed
+file_readers = ('hdf5',)
+
+# Formats that griddle reads natively; others are read by PyClaw
+readers = {'ascii': fileio.ascii.read,
+           'hdf5': fileio.hdf5.read,
+           'archive': fileio.archive.read}
+
+# Functions that read only the output time of a frame
+time_readers = {'ascii': fileio.ascii.read_time,
+                'hdf5': fileio.hdf5.read_time,
+                'archive': fileio.archive.read_time}
+
+# Formats whose frames are listed by a function rather than file names
+frame_scanners = {'archive': fileio.archive.scan_frames}
 
 if __name__ == "__main__":
     import doctest
@@ -0,0 +1,217 @@
+r"""
+griddle.expressions: derived fields written as NumPy expressions.
+
+An expression is a string in terms of the components of q (and aux), the
+cell centers and the cell widths.  It is evaluated for all patches of a
+frame that have the same shape at once, by stacking their arrays, so the
+cost does not grow with the number of patches:
+
+    >>> import griddle
+    >>> from griddle.expressions import Expression
+    >>> frame = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/')[5]
+    >>> speed = Expression('sqrt(u**2 + v**2)', names={'u': 1, 'v': 2})
+    >>> values = speed.evaluate(frame)
+    >>> len(values) == len(frame.states), values[0].shape == frame.states[0].q.shape[1:]
+    (True, True)
+
+The following names may be used in an expression:
+
+    - `q` and `aux`: the arrays of the patches, so that `q[0]` is the
+      first component of q; components may also be given names with the
+      `names` (for q) and `aux_names` (for aux) arguments;
+    - `x`, `y`, `z`: the (physical) coordinates of the cell centers;
+    - `dx`, `dy`, `dz`: the (computational) cell widths;
+    - `t`: the time of the frame;
+    - the NumPy functions listed in `functions`, and `np` itself.
+
+Only the components of q and aux that an expression uses are stacked, and
+when it refers to q only through constant indices (or names), the
+components it needs are known in advance, so that plots can load only
+those:
+
+    >>> speed.fields
+    [1, 2]
+    >>> Expression('q[0]*exp(-t)').fields
+    [0]
+
+Expressions may be used as the field of a plot item, either as Expression
+objects or as plain strings (see griddle.plot).
+"""
+import ast
+import functools
+import numpy as np
+
+functions = {'np': np, 'pi': np.pi, 'sqrt': np.sqrt, 'exp': np.exp,
+             'log': np.log, 'log10': np.log10, 'abs': np.abs, 'sin': np.sin,
+             'cos': np.cos, 'tan': np.tan, 'arctan2': np.arctan2,
+             'minimum': np.minimum, 'maximum': np.maximum, 'where': np.where}
+
+coordinate_names = ('x', 'y', 'z')
+width_names = ('dx', 'dy', 'dz')
+
+
+class Expression(object):
+    r"""A derived field defined by the NumPy expression `expression`.
+
+        `names` and `aux_names` map names used in the expression to indices
+        of components of q and aux.  Expressions are callable with a
+        State, like other derived fields, and are cached under the name
+        `name` (by default, the expression itself together with `names`
+        and `aux_names`; see griddle.data.DerivedFieldCache).
+    """
+    def __init__(self, expression, names=None, aux_names=None, name=None):
+        self.expression = expression
+        self.names = dict(names or {})
+        self.aux_names = dict(aux_names or {})
+        if name is None:
+            name = expression
+            if self.names or self.aux_names:
+                name = (expression, tuple(sorted(self.names.items())),
+                        tuple(sorted(self.aux_names.items())))
+        self.field_name = name
+        self._code = compile(expression, '<expression>', 'eval')
+        self._uses = set(self._code.co_names)
+        tree = ast.parse(expression, mode='eval')
+        self._subscripts = {'q': _constant_subscripts(tree, 'q'),
+                            'aux': _constant_subscripts(tree, 'aux')}
+
+    def __call__(self, state):
+        return self.evaluate_states([state])[0]
+
+    def __str__(self):
+        return self.expression
+
+    @property
+    def fields(self):
+        r"""(list) - Indices of the components of q used by the expression,
+            or None if it may use any of them (e.g. if it slices q).
+        """
+        used = self._used_components('q', self.names)
+        return None if used is None else sorted(used)
+
+    def _used_components(self, array_name, names):
+        r"""Return the set of indices of the components of `array_name` that
+            the expression uses directly or through `names`, or None if it
+            uses the whole array.
+        """
+        subscripts = self._subscripts[array_name]
+        if array_name in self._uses and subscripts is None:
+            return None
+        used = set(m for name, m in names.items() if name in self._uses)
+        if array_name in self._uses:
+            used.update(subscripts)
+        return used
+
+    def evaluate(self, frame):
+        r"""Return the list of values of the expression on each patch of
+            `frame` (a pyclaw.Solution).
+        """
+        return self.evaluate_states(frame.states)
+
+    def evaluate_states(self, states):
+        r"""Return the list of values of the expression on each of `states`.
+            States whose arrays have the same shape are evaluated together.
+        """
+        values = [None]*len(states)
+        groups = {}
+        for i, state in enumerate(states):
+            aux_shape = None if state.aux is None else state.aux.shape
+            groups.setdefault((state.q.shape, aux_shape), []).append(i)
+        for members in groups.values():
+            group = [states[i] for i in members]
+            result = np.broadcast_to(eval(self._code, {'__builtins__': {}},
+                                          self._namespace(group)),
+                                     (len(group),) + group[0].q.shape[1:])
+            for i, patch_values in zip(members, result):
+                values[i] = patch_values
+        return values
+
+    def _namespace(self, states):
+        r"""Return the values of the names used by the expression for a group
+            of states with arrays of the same shape, stacked along a new
+            axis following the component axis.
+        """
+        namespace = dict(functions)
+        uses = self._uses
+        for array_name, names in (('q', self.names), ('aux', self.aux_names)):
+            used = self._used_components(array_name, names)
+            if used is None:
+                stacked = np.stack([getattr(state, array_name)
+                                    for state in states], axis=1)
+            elif used:
+                # Only the components that are used, indexed like the array
+                stacked = dict((m, np.stack([getattr(state, array_name)[m]
+                                             for state in states]))
+                               for m in used)
+            else:
+                continue
+            namespace[array_name] = stacked
+            for name, m in names.items():
+                if name in uses:
+                    namespace[name] = stacked[m]
+        num_dim = states[0].q.ndim - 1
+        if uses.intersection(coordinate_names[:num_dim]):
+            centers = [state.grid.p_centers for state in states]
+            for d in range(num_dim):
+                namespace[coordinate_names[d]] = np.stack([c[d] for c in centers])
+        if uses.intersection(width_names[:num_dim]):
+            shape = (len(states),) + (1,)*num_dim
+            deltas = np.array([state.patch.delta for state in states])
+            for d in range(num_dim):
+                namespace[width_names[d]] = deltas[:, d].reshape(shape)
+        if 't' in uses:
+            namespace['t'] = states[0].t
+        return namespace
+
+
+def _constant_subscripts(tree, array_name):
+    r"""Return the set of constant integer indices of `array_name` in the
+        syntax tree `tree`, or None if it is used in any other way.
+    """
+    subscripts = set()
+    num_uses = 0
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == array_name:
+            num_uses += 1
+        elif isinstance(node, ast.Subscript) and \
+             isinstance(node.value, ast.Name) and node.value.id == array_name:
+            index = node.slice
+            if isinstance(index, getattr(ast, 'Index', ())):
+                index = index.value  # Python < 3.9
+            if isinstance(index, ast.Constant) and \
+               type(index.value) is int and index.value >= 0:
+                subscripts.add(index.value)
+                num_uses -= 1
+    return subscripts if num_uses == 0 else None
+
+
+def precompute(states, field, cache):
+    r"""If `field` is an Expression (or a list of fields containing some),
+        evaluate it on all `states` at once and store the values in the
+        griddle.data.DerivedFieldCache `cache`.
+    """
+    fields = field if isinstance(field, (list, tuple)) else [field]
+    for f in fields:
+        if isinstance(f, Expression) and \
+           not all(cache.contains(state, f) for state in states):
+            for state, values in zip(states, f.evaluate_states(states)):
+                cache.put(state, f, values)
+
+
+def as_field(field):
+    r"""Convert strings (including those in a list or tuple) to Expressions;
+        return other fields unchanged.
+    """
+    if isinstance(field, str):
+        return _parse_expression(field)
+    if isinstance(field, (list, tuple)):
+        return type(field)(as_field(f) for f in field)
+    return field
+
+
+@functools.lru_cache(maxsize=128)
+def _parse_expression(field):
+    r"""Return the Expression of a string, reusing those of recently used
+        strings so that their derived values are cached under one key.
+    """
+    return Expression(field)
@@ -0,0 +1,9 @@
+r"""
+griddle.fileio: readers for the output formats of Clawpack solvers.
+"""
+from . import cache
+from . import ascii
+from . import sidecar
+from . import hdf5
+from . import archive
+from . import gauges
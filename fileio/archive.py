@@ -0,0 +1,184 @@
+r"""
+Griddle archives: all frames of a run in one chunked, compressed HDF5 file.
+
+An archive (a file whose name ends in `.griddle.h5`) contains
+
+    - a dataset 'frames', the frame/time index, with one row
+      (frame, t, num_patches) per frame;
+    - for each frame, a group 'frameNNNN' holding the patch table of the
+      frame (dataset 'patches', see `griddle.fileio.ascii.index_dtype`),
+      one dataset 'qNNNN' (and 'auxNNNN') per patch, of shape
+      (num_var, n1, ..., nd), and the problem data and mapping of the
+      frame, pickled in the attribute 'pickle' (as in PyClaw's fort.pkl
+      files, the mapping is stored by reference).
+
+Each dataset is compressed and chunked by field, so that one field of one
+patch at one frame is a single chunk, and is read with a single chunked
+read:
+
+    >>> import os, tempfile
+    >>> from griddle import data
+    >>> from griddle.fileio import archive
+    >>> ts = data.TimeSeries('./test_data/_amrclaw_2d_acoustics/')
+    >>> fname = os.path.join(tempfile.mkdtemp(), 'acoustics.griddle.h5')
+    >>> archive.write(ts, fname, stop=6, stride=5)   # Frames 0 and 5
+    >>> archive.read_time(5, fname)
+    0.25
+    >>> sol = archive.read(5, fname, fields=[0], max_level=1)
+    >>> len(sol.states), sol.states[0].q.shape
+    (1, (3, 50, 50))
+
+A `griddle.data.TimeSeries` reads archives when given the name of the
+archive or of a directory containing one.
+"""
+import os
+import pickle
+import numpy as np
+from clawpack import pyclaw
+from .. import geometry
+from .ascii import window_patches, _make_patch, _make_state, _row_header
+from .hdf5 import read_dataset
+from .sidecar import index_states
+
+extension = '.griddle.h5'
+
+frames_dtype = np.dtype([('frame', int), ('t', float), ('num_patches', int)])
+
+
+def archive_file(path):
+    r"""Return the name of the archive `path`, or of the only archive in the
+        directory `path`.
+    """
+    if os.path.isfile(path):
+        return path
+    names = sorted(name for name in os.listdir(path) if name.endswith(extension))
+    if len(names) != 1:
+        raise IOError('Expected one griddle archive in %s, found %s.'
+                      % (path, len(names)))
+    return os.path.join(path, names[0])
+
+
+def write(time_series, fname, start=None, stop=None, stride=1,
+          compression='gzip', compression_opts=4):
+    r"""Write the frames of `time_series` to the archive `fname`, appending
+        to it if it exists.  The frames are chosen and streamed as by
+        `TimeSeries.iter_frames(start, stop, stride)`, and are written as
+        loaded: clear any field or window restrictions of `time_series`
+        first to archive the full data.
+    """
+    for frame_num, solution in time_series.iter_frames(start, stop, stride):
+        append(fname, frame_num, solution, compression, compression_opts)
+
+
+def append(fname, frame, solution, compression='gzip', compression_opts=4):
+    r"""Add frame number `frame`, a pyclaw.Solution, to the archive `fname`,
+        replacing that frame if it is already present.
+    """
+    import h5py
+    states = solution.states
+    with h5py.File(fname, 'a') as f:
+        if 'frames' not in f:
+            f.create_dataset('frames', shape=(0,), maxshape=(None,),
+                             dtype=frames_dtype, chunks=True)
+        index = f['frames']
+        name = _group_name(frame)
+        if name in f:
+            del f[name]
+            keep = index[...][index['frame'] != frame]
+            index.resize((len(keep),))
+            index[...] = keep
+        group = f.create_group(name)
+        group.create_dataset('patches', data=index_states(states))
+        mapc2p = states[0].grid.mapc2p
+        values = {'problem_data': states[0].problem_data,
+                  'mapc2p': None if geometry.is_identity_map(mapc2p) else mapc2p}
+        group.attrs['pickle'] = np.void(pickle.dumps(values))
+        for i, state in enumerate(states):
+            for kind, values in (('q', state.q), ('aux', state.aux)):
+                if values is None or values.size == 0:
+                    continue
+                group.create_dataset('%s%s' % (kind, str(i).zfill(4)),
+                                     data=values,
+                                     chunks=(1,) + values.shape[1:],
+                                     compression=compression,
+                                     compression_opts=compression_opts,
+                                     shuffle=True)
+        index.resize((len(index) + 1,))
+        index[-1] = (frame, solution.t, len(states))
+
+
+def read(frame, path='./', read_aux=True, fields=None, bbox=None,
+         max_level=None):
+    r"""Read frame `frame` from a griddle archive and return it as a
+        pyclaw.Solution.  `path` is the archive or a directory containing
+        it.
+
+        If `fields` is a list of indices, only those components of q are
+        read; the others are filled with NaN.  If a bounding box `bbox` or a
+        `max_level` is given, only the patches selected by
+        `griddle.fileio.ascii.select_patches` are read (`bbox` is ignored
+        for mapped grids).
+    """
+    import h5py
+    with h5py.File(archive_file(path), 'r') as f:
+        t = float(_frame_row(f, frame)['t'])
+        group = f[_group_name(frame)]
+        problem_data, mapc2p = None, None
+        if 'pickle' in group.attrs:
+            values = pickle.loads(group.attrs['pickle'].tobytes())
+            problem_data, mapc2p = values['problem_data'], values['mapc2p']
+        if not geometry.is_identity_map(mapc2p):
+            bbox = None  # Patch extents are computational coordinates
+        patches = group['patches'][...]
+        selected = window_patches(patches, bbox, max_level, frame)
+        states = []
+        for i in selected:
+            q = group['q%s' % str(i).zfill(4)]
+            aux_name = 'aux%s' % str(i).zfill(4)
+            num_aux = group[aux_name].shape[0] if aux_name in group else 0
+            aux = None
+            if num_aux > 0 and read_aux:
+                aux = read_dataset(group[aux_name])
+            state = _make_state(_make_patch(_row_header(patches[i])), t,
+                                read_dataset(q, fields), num_aux, aux)
+            if problem_data is not None:
+                state.problem_data = problem_data
+            if mapc2p is not None:
+                state.grid.mapc2p = mapc2p
+            states.append(state)
+
+    solution = pyclaw.Solution()
+    solution.states = states
+    solution.domain = pyclaw.geometry.Domain([state.patch for state in states])
+    return solution
+
+
+def read_time(frame, path='./'):
+    r"""Read the output time of a frame from the frame index."""
+    import h5py
+    with h5py.File(archive_file(path), 'r') as f:
+        return float(_frame_row(f, frame)['t'])
+
+
+def scan_frames(path):
+    r"""Return a dictionary mapping the frame numbers in an archive to the
+        name of the archive.
+    """
+    import h5py
+    fname = archive_file(path)
+    with h5py.File(fname, 'r') as f:
+        if 'frames' not in f:
+            return {}
+        return {int(frame): fname for frame in f['frames']['frame']}
+
+
+def _frame_row(f, frame):
+    index = f['frames'][...]
+    rows = index[index['frame'] == frame]
+    if len(rows) == 0:
+        raise IOError('Frame %s is not in archive %s' % (frame, f.filename))
+    return rows[-1]
+
+
+def _group_name(frame):
+    return 'frame%s' % str(frame).zfill(4)
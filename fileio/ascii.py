@@ -0,0 +1,472 @@
+r"""
+Routines for reading Clawpack ASCII output (fort.t and fort.q files).
+
+Unlike `clawpack.pyclaw.fileio.ascii`, which parses the values of each patch
+line by line, these routines only parse the short patch headers in Python:
+the data block of each patch is located from its header and converted by a
+single call to NumPy's text parser.
+The resulting Solution objects are identical to those produced by
+`pyclaw.Solution(frame, file_format='ascii')`:
+
+    >>> from griddle.fileio import ascii
+    >>> sol = ascii.read(5, path='./test_data/_amrclaw_2d_acoustics/')
+    >>> len(sol.states), sol.t
+    (20, 0.25)
+    >>> sol.states[0].q.shape
+    (3, 50, 50)
+"""
+import os
+import pickle
+import numpy as np
+from clawpack import pyclaw
+from . import cache
+from ..geometry import dimension_names, is_identity_map, patch_table_dtype
+
+
+# Labels of the first lines of each patch header
+header_labels = ('grid_number', 'AMR_level')
+
+
+def read(frame, path='./', file_prefix='fort', read_aux=True, sidecar=False,
+         fields=None, bbox=None, max_level=None, persist_index=False):
+    r"""Read frame `frame` from the ASCII files in directory `path` and
+        return it as a pyclaw.Solution.
+
+        If `fields` is a list of indices, only those components of q are
+        converted; the others are filled with NaN (see `new_field_array`).
+
+        If a bounding box `bbox` or a `max_level` is given, only the patches
+        selected by `select_patches` are read.  They are located with the
+        header-only index of the frame (see `read_index`; `persist_index`
+        is passed on to it), and the data of other patches is never read.
+        Since `bbox` is in physical coordinates, it is ignored for mapped
+        grids (see `window_patches`).
+
+        If the fort.t file indicates that the data is not ASCII, the frame
+        is read by PyClaw instead.
+
+        If `sidecar` is True, the frame is read from its binary sidecar
+        (see `griddle.fileio.sidecar`) when an up-to-date one exists;
+        otherwise the text files are parsed and the sidecar is written.
+        Sidecars are memory-mapped, so unused fields are never read from
+        them.
+    """
+    if sidecar:
+        from . import sidecar as sidecar_module
+        sources = source_files(frame, path, file_prefix)
+        solution = sidecar_module.read(frame, path, sources, file_prefix,
+                                       bbox, max_level, read_aux)
+        if solution is None:
+            solution = read(frame, path, file_prefix, read_aux)
+            sidecar_module.write(solution, frame, path, sources, file_prefix,
+                                 write_aux=read_aux)
+            if bbox is not None or max_level is not None:
+                solution = sidecar_module.read(frame, path, sources,
+                                               file_prefix, bbox, max_level,
+                                               read_aux)
+        return solution
+
+    t, num_eqn, nstates, num_aux, num_dim, num_ghost, file_format = \
+        read_t(frame, path, file_prefix)
+    if file_format not in (None, 'ascii'):
+        return pyclaw.Solution(frame, path=path, file_format=file_format,
+                               file_prefix=file_prefix, read_aux=read_aux)
+
+    problem_data, mapc2p = _read_pickle(frame, path, file_prefix)
+
+    q_fname = _file_name(path, file_prefix, 'q', frame)
+    if not is_identity_map(mapc2p):
+        bbox = None  # Patch extents are computational coordinates
+    if bbox is None and max_level is None:
+        selected = None
+        patches = read_patches(q_fname, num_dim, num_eqn, nstates, fields)
+    else:
+        index = read_index(frame, path, file_prefix, persist=persist_index)
+        selected = window_patches(index['patches'], bbox, max_level, frame)
+        patches = [(_row_header(index['patches'][i]), read_patch(index, i, fields))
+                   for i in selected]
+
+    states = []
+    for header, q in patches:
+        state = _make_state(_make_patch(header), t, q, num_aux)
+        state.problem_data = problem_data
+        if mapc2p is not None:
+            state.grid.mapc2p = mapc2p
+        states.append(state)
+
+    if num_aux > 0 and read_aux:
+        aux_fname = _aux_file_name(path, file_prefix, frame)
+        if aux_fname is not None:
+            aux_patches = read_patches(aux_fname, num_dim, num_aux, nstates)
+            if selected is not None:
+                aux_patches = [aux_patches[i] for i in selected]
+            for state, (header, aux) in zip(states, aux_patches):
+                if header['level'] != state.patch.level:
+                    raise IOError('Patch level in aux file header did not '
+                                  'match patch %s.' % state.patch.patch_index)
+                state.aux = aux
+
+    solution = pyclaw.Solution()
+    solution.states = states
+    solution.domain = pyclaw.geometry.Domain([state.patch for state in states])
+    return solution
+
+
+def read_t(frame, path='./', file_prefix='fort'):
+    r"""Read the fort.t file of frame `frame`.
+
+        Returns (t, num_eqn, nstates, num_aux, num_dim, num_ghost, file_format),
+        like `pyclaw.fileio.ascii.read_t`.  Older files do not record
+        num_ghost or file_format; these are returned as 0 and None.
+    """
+    with open(_file_name(path, file_prefix, 't', frame)) as f:
+        values = [line.split()[0] for line in f if line.strip()]
+    t = float(values[0])
+    num_eqn, nstates, num_aux, num_dim = [int(v) for v in values[1:5]]
+    num_ghost = int(values[5]) if len(values) > 5 else 0
+    file_format = values[6] if len(values) > 6 else None
+    return t, num_eqn, nstates, num_aux, num_dim, num_ghost, file_format
+
+
+def read_time(frame, path='./', file_prefix='fort'):
+    r"""Read only the output time of a frame from its fort.t file."""
+    with open(_file_name(path, file_prefix, 't', frame)) as f:
+        return float(f.readline().split()[0])
+
+
+def read_patches(fname, num_dim, num_var, nstates=None, fields=None):
+    r"""Read all patches in a fort.q (or fort.a) file.
+
+        Returns a list of (header, q) pairs, where header is a dictionary
+        with keys 'patch_index', 'level', 'num_cells', 'lower' and 'delta',
+        and q has shape (num_var, num_cells[0], ..., num_cells[num_dim-1]).
+        If `fields` is given, only those components of q are kept.
+
+        The end of each data block is found as in `read_index`, and the
+        block is converted with a single call to NumPy's text parser.
+    """
+    patches = []
+    with open(fname, 'rb') as f:
+        while len(patches) != nstates and not (nstates is None and _at_end(f)):
+            header = _read_header_lines(f, num_dim)
+            start = f.tell()
+            nbytes = _skip_data(f, header['num_cells'], num_var, num_dim)
+            f.seek(start)
+            values = _parse_values(f.read(nbytes), num_var, header['num_cells'],
+                                   fname)
+            patches.append((header, _select_fields(values, fields)))
+    return patches
+
+
+def new_field_array(num_var, num_cells):
+    r"""Return an array of shape (num_var, num_cells[0], ...) in which each
+        component is stored contiguously, filled with NaN so that components
+        that are never filled in cannot be mistaken for data.
+    """
+    shape = (num_var,) + tuple(num_cells)[::-1]
+    array = np.full(shape, np.nan)
+    return array.transpose((0,) + tuple(range(len(num_cells), 0, -1)))
+
+
+def index_dtype(num_dim):
+    r"""Record type of one row of a patch index table: a row of a
+        `griddle.geometry.patch_table`, followed by the location of the
+        values of the patch.
+    """
+    return np.dtype(patch_table_dtype(num_dim).descr +
+                    [('offset', 'i8'), ('nbytes', 'i8')])
+
+
+def read_index(frame, path='./', file_prefix='fort', persist=False):
+    r"""Read only the patch headers of a frame.
+
+        Returns a dictionary with the frame metadata from fort.t ('t',
+        'num_eqn', 'num_aux', 'num_dim') and a structured array 'patches'
+        with one row per patch (see `index_dtype`).  The 'offset' and
+        'nbytes' fields give the location of each patch's values in the
+        fort.q file, so that single patches can be read with `read_patch`.
+
+        The data blocks are skipped rather than read: values are written
+        in fixed-width lines, so the size of a block follows from the length
+        of its first line and of the blank lines separating rows.  The
+        position of the next header is checked, and blocks that do not have
+        this layout are skipped by counting values.
+
+        If `persist` is True, the index is saved in the `_griddle`
+        subdirectory of `path` and reused until the fort.q or fort.t file
+        changes:
+
+            >>> from griddle.fileio import ascii
+            >>> index = ascii.read_index(5, path='./test_data/_amrclaw_2d_acoustics/')
+            >>> index['t'], len(index['patches'])
+            (0.25, 20)
+            >>> index['patches']['level'][:3]
+            array([1, 2, 2])
+    """
+    t_fname = _file_name(path, file_prefix, 't', frame)
+    q_fname = _file_name(path, file_prefix, 'q', frame)
+    index_fname = cache.cache_file(path, '%s.q%s.index.npz'
+                                   % (file_prefix, str(frame).zfill(4)))
+    if persist:
+        stored = cache.load(index_fname, [q_fname, t_fname])
+        if stored is not None:
+            return _unpack_index(stored, q_fname)
+
+    t, num_eqn, nstates, num_aux, num_dim, num_ghost, file_format = \
+        read_t(frame, path, file_prefix)
+    patches = np.zeros(nstates, dtype=index_dtype(num_dim))
+    with open(q_fname, 'rb') as f:
+        for row in patches:
+            header = _read_header_lines(f, num_dim)
+            for key in ('patch_index', 'level', 'num_cells', 'lower', 'delta'):
+                row[key] = header[key]
+            row['offset'] = f.tell()
+            row['nbytes'] = _skip_data(f, header['num_cells'], num_eqn, num_dim)
+    patches['upper'] = patches['lower'] + patches['num_cells']*patches['delta']
+
+    index = {'t': t, 'num_eqn': num_eqn, 'num_aux': num_aux,
+             'num_dim': num_dim, 'patches': patches}
+    if persist:
+        cache.save(index_fname, [q_fname, t_fname], **index)
+    index['file_name'] = q_fname
+    return index
+
+
+def read_patch(index, i, fields=None):
+    r"""Read the values of patch `i` of a frame, using its index.  If
+        `fields` is given, only those components of q are converted.
+    """
+    row = index['patches'][i]
+    with open(index['file_name'], 'rb') as f:
+        f.seek(row['offset'])
+        block = f.read(row['nbytes'])
+    values = _parse_values(block, index['num_eqn'], row['num_cells'].tolist(),
+                           index['file_name'])
+    return _select_fields(values, fields)
+
+
+def select_patches(patches, bbox=None, max_level=None):
+    r"""Return a boolean array marking the rows of a patch table (see
+        `index_dtype`) that intersect the bounding box `bbox` and have
+        level at most `max_level`.
+
+        `bbox` is a list of (lower, upper) pairs, one per dimension, in the
+        form of matplotlib's xlim and ylim; trailing dimensions may be
+        omitted, and None may be passed for a dimension to leave it
+        unbounded.
+
+            >>> from griddle.fileio import ascii
+            >>> index = ascii.read_index(5, path='./test_data/_amrclaw_2d_acoustics/')
+            >>> int(ascii.select_patches(index['patches'], max_level=1).sum())
+            1
+            >>> int(ascii.select_patches(index['patches'], bbox=[(0.9, 1.)]).sum())
+            7
+    """
+    selected = np.ones(len(patches), dtype=bool)
+    if max_level is not None:
+        selected &= patches['level'] <= max_level
+    if bbox is not None:
+        for d, limits in enumerate(bbox):
+            if limits is None:
+                continue
+            low, high = min(limits), max(limits)
+            selected &= (patches['upper'][:, d] > low) & (patches['lower'][:, d] < high)
+    return selected
+
+
+def window_patches(patches, bbox, max_level, frame):
+    r"""Return the indices of the rows of a patch table selected by
+        `select_patches`, raising IOError if there are none.  Callers pass
+        bbox=None for mapped grids, whose patch extents are computational
+        coordinates.
+    """
+    selected = np.nonzero(select_patches(patches, bbox, max_level))[0]
+    if len(selected) == 0:
+        raise IOError('No patches of frame %s lie in the window bbox=%s, '
+                      'max_level=%s.' % (frame, bbox, max_level))
+    return selected
+
+
+def _parse_values(block, num_var, num_cells, fname):
+    r"""Convert the text of a data block to an array of shape (num_var,
+        num_cells[0], ...).
+    """
+    if b'D' in block:
+        block = block.replace(b'D', b'E')  # Fortran double precision exponents
+    values = np.fromstring(block, sep=' ')
+    size = num_var*int(np.prod(num_cells))
+    if values.size != size:
+        raise IOError('Expected %s values in a patch of %s, found %s'
+                      % (size, fname, values.size))
+    return values.reshape([num_var] + list(num_cells), order='F')
+
+
+def _select_fields(values, fields):
+    r"""Return `values`, or only its components `fields` (see
+        `new_field_array`) if `fields` is given.
+    """
+    if fields is None:
+        return values
+    q = new_field_array(values.shape[0], values.shape[1:])
+    for m in fields:
+        q[m] = values[m]
+    return q
+
+
+def _make_state(patch, t, q, num_aux=0, aux=None):
+    r"""Return a pyclaw.State on `patch` holding the arrays `q` and `aux`,
+        without allocating arrays that would be replaced.  If the patch has
+        aux values (num_aux > 0) that were not read, aux is filled with NaN.
+    """
+    state = pyclaw.State(patch, 0)
+    state.t = t
+    state.q = q
+    if aux is None and num_aux > 0:
+        aux = np.full((num_aux,) + tuple(patch.num_cells_global), np.nan,
+                      order='F')
+    state.aux = aux
+    return state
+
+
+def _row_header(row):
+    r"""Convert a row of a patch table to a header dictionary."""
+    return {key: row[key].tolist() for key in
+            ('patch_index', 'level', 'num_cells', 'lower', 'delta')}
+
+
+def _unpack_index(stored, q_fname):
+    index = {key: stored[key][()] for key in ('t', 'num_eqn', 'num_aux', 'num_dim')}
+    index['t'] = float(index['t'])
+    for key in ('num_eqn', 'num_aux', 'num_dim'):
+        index[key] = int(index[key])
+    index['patches'] = stored['patches']
+    index['file_name'] = q_fname
+    return index
+
+
+def _read_header_lines(f, num_dim):
+    r"""Read a patch header from a file opened in binary mode, skipping
+        blank lines.
+    """
+    tokens = []
+    while len(tokens) < 2*(2 + 3*num_dim):
+        line = f.readline()
+        if not line:
+            raise IOError('Unexpected end of file in %s' % f.name)
+        tokens.extend(line.split())
+    # Skip the blank line that ends the header
+    position = f.tell()
+    if f.readline().strip():
+        f.seek(position)
+    return _parse_header([token.decode() for token in tokens], num_dim)
+
+
+def _skip_data(f, num_cells, num_var, num_dim):
+    r"""Move the file position from the start of a data block to its end,
+        and return the size of the block in bytes.
+    """
+    start = f.tell()
+    line_length = len(f.readline())
+    f.seek(start)
+    if len(f.readline().split()) == num_var:
+        # One line per cell, with a blank line after each row (and plane)
+        size = num_cells[0]*line_length
+        for n in num_cells[1:]:
+            f.seek(start + size)
+            size = n*(size + len(f.readline()))
+        f.seek(start + size)
+        if _at_header_or_end(f):
+            return size
+    # Fall back to counting values
+    f.seek(start)
+    remaining = num_var*int(np.prod(num_cells))
+    while remaining > 0:
+        line = f.readline()
+        if not line:
+            raise IOError('Unexpected end of file in %s' % f.name)
+        remaining -= len(line.split())
+    return f.tell() - start
+
+
+def _at_end(f):
+    r"""Check whether only blank lines remain, without moving the file
+        position.
+    """
+    position = f.tell()
+    line = f.readline()
+    while line and not line.strip():
+        line = f.readline()
+    f.seek(position)
+    return not line
+
+
+def _at_header_or_end(f):
+    r"""Check whether the next non-blank lines are the first lines of a patch
+        header (see `header_labels`), without moving the file position.
+    """
+    position = f.tell()
+    lines = []
+    while len(lines) < 2:
+        line = f.readline()
+        if not line:
+            break
+        if line.strip():
+            lines.append(line.split())
+    f.seek(position)
+    if not lines:
+        return True  # End of file
+    return len(lines) == 2 and all(
+        len(tokens) == 2 and tokens[0].isdigit() and tokens[1].decode() == label
+        for tokens, label in zip(lines, header_labels))
+
+
+def _parse_header(tokens, num_dim):
+    r"""Convert the tokens of a patch header to a dictionary."""
+    values = tokens[0::2]
+    return {'patch_index': int(values[0]),
+            'level': int(values[1]),
+            'num_cells': [int(v) for v in values[2:2+num_dim]],
+            'lower': [float(v) for v in values[2+num_dim:2+2*num_dim]],
+            'delta': [float(v) for v in values[2+2*num_dim:2+3*num_dim]]}
+
+
+def _make_patch(header):
+    r"""Construct a pyclaw.geometry.Patch from a header dictionary."""
+    dimensions = []
+    for name, n, lower, d in zip(dimension_names, header['num_cells'],
+                                 header['lower'], header['delta']):
+        dimensions.append(pyclaw.Dimension(lower, lower + n*d, n, name=name))
+    patch = pyclaw.geometry.Patch(dimensions)
+    patch.patch_index = header['patch_index']
+    patch.level = header['level']
+    return patch
+
+
+def source_files(frame, path='./', file_prefix='fort'):
+    r"""Return the names of the fort.q and fort.t files of a frame."""
+    return [_file_name(path, file_prefix, kind, frame) for kind in ('q', 't')]
+
+
+def _file_name(path, file_prefix, kind, frame):
+    return os.path.join(path, '%s.%s%s' % (file_prefix, kind, str(frame).zfill(4)))
+
+
+def _aux_file_name(path, file_prefix, frame):
+    r"""Aux data is read from the file for this frame if it exists;
+        otherwise the aux data of frame 0 is assumed to be valid.
+    """
+    for fname in (_file_name(path, file_prefix, 'a', frame),
+                  _file_name(path, file_prefix, 'a', 0)):
+        if os.path.exists(fname):
+            return fname
+    return None
+
+
+def _read_pickle(frame, path, file_prefix):
+    r"""Return the problem_data and mapc2p stored by PyClaw, if any."""
+    fname = os.path.join(path, '%s.pkl' % file_prefix) + str(frame).zfill(4)
+    if not os.path.exists(fname):
+        return None, None
+    with open(fname, 'rb') as f:
+        value_dict = pickle.load(f)
+    return value_dict.get('problem_data'), value_dict.get('mapc2p')
@@ -0,0 +1,84 @@
+r"""
+Persistent caches stored alongside output data.
+
+Cached files live in a `_griddle` subdirectory of the output directory.
+Each cache file records the modification time and size of the source files
+it was derived from; it is ignored if any of them has changed since:
+
+    >>> import os, tempfile
+    >>> from griddle.fileio import cache
+    >>> path = tempfile.mkdtemp()
+    >>> source = os.path.join(path, 'fort.q0000')
+    >>> with open(source, 'w') as f:
+    ...     _ = f.write('data')
+    >>> fname = cache.cache_file(path, 'fort.q0000.npz')
+    >>> cache.save(fname, [source], values=[1., 2.])
+    True
+    >>> cache.load(fname, [source])['values']
+    array([1., 2.])
+    >>> with open(source, 'w') as f:
+    ...     _ = f.write('new data')
+    >>> cache.load(fname, [source]) is None
+    True
+"""
+import os
+import numpy as np
+
+cache_dir_name = '_griddle'
+
+
+def cache_file(path, name):
+    r"""Return the name of cache file `name` for output directory `path`."""
+    return os.path.join(path, cache_dir_name, name)
+
+
+def file_stamps(source_files):
+    r"""Return an array of (mtime, size) for each file in `source_files`."""
+    return np.array([(os.path.getmtime(f), os.path.getsize(f))
+                     for f in source_files], dtype=float)
+
+
+def is_fresh(fname, source_files, stamps=None):
+    r"""Check whether cache file `fname` exists and was derived from the
+        current versions of `source_files`.  The stamps stored in the cache
+        may be passed in to avoid reading them again.
+    """
+    if stamps is None:
+        if not os.path.exists(fname):
+            return False
+        with np.load(fname) as data:
+            stamps = data['_stamps']
+    try:
+        current = file_stamps(source_files)
+    except OSError:
+        return False
+    return np.array_equal(stamps, current)
+
+
+def save(fname, source_files, **arrays):
+    r"""Write `arrays` to cache file `fname`, stamped with the current
+        mtime and size of `source_files`.  Returns False if the cache
+        could not be written (e.g., in a read-only directory).
+    """
+    try:
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        stamps = file_stamps(source_files)
+        # Write to a temporary file so that readers never see partial data
+        tmp_fname = fname + '.tmp.npz'
+        np.savez(tmp_fname, _stamps=stamps, **arrays)
+        os.replace(tmp_fname, fname)
+    except OSError:
+        return False
+    return True
+
+
+def load(fname, source_files):
+    r"""Return the arrays stored in cache file `fname` as a dictionary, or
+        None if the file does not exist or is out of date.
+    """
+    if not os.path.exists(fname):
+        return None
+    with np.load(fname) as data:
+        if not is_fresh(fname, source_files, stamps=data['_stamps']):
+            return None
+        return {key: data[key] for key in data.files if key != '_stamps'}
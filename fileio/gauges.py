@@ -0,0 +1,87 @@
+r"""
+Reading gauge output (fort.gauge files) of AMRClaw and GeoClaw.
+
+Each line of a fort.gauge file holds the gauge number, the AMR level, the
+time and the values of q at the gauge, for all gauges interleaved in time.
+The whole file is converted with a single call to NumPy and then split by
+gauge, so that the records of each gauge are contiguous:
+
+    >>> from griddle.fileio import gauges
+    >>> data = gauges.read('./test_data/_amrclaw_2d_acoustics/', persist=False)
+    >>> sorted(data)
+    [0, 1, 2]
+    >>> gauge = data[1]
+    >>> gauge['t'].shape, gauge['level'].shape, gauge['q'].shape
+    ((141,), (141,), (3, 141))
+
+The split records are cached in binary form in the `_griddle` subdirectory
+(see `griddle.fileio.cache`), and read from there while the fort.gauge file
+is unchanged.
+"""
+import os
+import numpy as np
+from . import cache
+
+
+def read(path='./', file_name='fort.gauge', persist=True):
+    r"""Read the gauge file `file_name` in directory `path`.
+
+        Returns a dictionary mapping each gauge number to a dictionary with
+        the arrays 't' and 'level', of shape (num_records,), and 'q', of
+        shape (num_var, num_records), in the order they appear in the file.
+        If `persist` is True, the records are cached in binary form.
+    """
+    fname = os.path.join(path, file_name)
+    cache_fname = cache.cache_file(path, file_name + '.npz')
+    stored = cache.load(cache_fname, [fname]) if persist else None
+    if stored is None:
+        stored = read_records(fname)
+        if persist:
+            cache.save(cache_fname, [fname], **stored)
+    return split(stored['records'], stored['gauge_ids'], stored['starts'])
+
+
+def read_records(fname):
+    r"""Read all records in a gauge file and sort them by gauge number.
+
+        Returns a dictionary with the sorted `records`, an array of shape
+        (num_records, 3 + num_var) whose columns are the gauge number, level,
+        time and values of q; the distinct `gauge_ids`; and the index in
+        `records` of the first record of each gauge, `starts`.  Lines
+        starting with '#' are skipped.
+    """
+    with open(fname) as f:
+        text = f.read()
+    if '#' in text:
+        # Skip header and comment lines
+        text = ''.join(line for line in text.splitlines(True)
+                       if not line.lstrip().startswith('#'))
+    first_line = next((line for line in text.splitlines() if line.strip()), '')
+    num_columns = len(first_line.split())
+    if num_columns == 0:
+        raise IOError('No gauge records in %s' % fname)
+    values = np.array(text.replace('D', 'E').split(), dtype=float)
+    if values.size % num_columns != 0:
+        raise IOError('Incomplete gauge record in %s' % fname)
+    records = values.reshape((-1, num_columns))
+    # A stable sort keeps the records of each gauge in time order
+    order = np.argsort(records[:, 0], kind='stable')
+    records = records[order]
+    gauge_ids, starts = np.unique(records[:, 0].astype(int), return_index=True)
+    return {'records': records, 'gauge_ids': gauge_ids, 'starts': starts}
+
+
+def split(records, gauge_ids, starts):
+    r"""Split the sorted records of `read_records` by gauge.  The arrays 't'
+        and 'q' of each gauge are views into `records`; 'level' is a (small)
+        integer copy of its column.
+    """
+    stops = list(starts[1:]) + [len(records)]
+    gauges = {}
+    for gauge_id, start, stop in zip(gauge_ids, starts, stops):
+        block = records[start:stop]
+        gauges[int(gauge_id)] = {'level': block[:, 1].astype(int),
+                                 't': block[:, 2],
+                                 'q': block[:, 3:].T}
+    return gauges
+
@@ -0,0 +1,102 @@
+r"""
+Routines for reading PyClaw HDF5 output (claw*.hdf files).
+
+Each patch is stored in its own group, with the patch geometry in the group
+attributes and the values in a dataset 'q' of shape (num_eqn, n1, ..., nd).
+Datasets are sliced lazily, so that reading a subset of the fields only
+reads those parts of the file:
+
+    >>> from griddle.fileio import hdf5
+    >>> sol = hdf5.read(3, path='./test_data/_pyclaw_3d_shocktube/', fields=[0])
+    >>> sol.t, sol.states[0].q.shape
+    (0.18, (5, 64, 16, 16))
+"""
+import os
+import numpy as np
+from clawpack import pyclaw
+from .ascii import index_dtype, new_field_array, select_patches, _make_state
+
+
+def read(frame, path='./', file_prefix='claw', read_aux=True, fields=None,
+         bbox=None, max_level=None):
+    r"""Read frame `frame` from an HDF5 file in directory `path` and return
+        it as a pyclaw.Solution.  `path` may also be the file itself.
+
+        If `fields` is a list of indices, only those components of q are
+        read; the others are filled with NaN.  If a bounding box `bbox` or a
+        `max_level` is given, the datasets of patches that are not selected
+        by `griddle.fileio.ascii.select_patches` are not read.
+    """
+    import h5py
+    fname = _file_name(frame, path, file_prefix)
+    states = []
+    with h5py.File(fname, 'r') as f:
+        for group in f.values():
+            attrs = group.attrs
+            names = np.array(attrs['dimensions']).astype(str)
+            if bbox is not None or max_level is not None:
+                row = np.zeros(1, dtype=index_dtype(len(names)))
+                row['level'] = attrs['level']
+                row['lower'] = [attrs['%s.lower' % name] for name in names]
+                row['upper'] = [attrs['%s.upper' % name] for name in names]
+                if not select_patches(row, bbox, max_level)[0]:
+                    continue
+            dimensions = []
+            for name in names:
+                dim = pyclaw.Dimension(attrs['%s.lower' % name],
+                                       attrs['%s.upper' % name],
+                                       attrs['%s.num_cells' % name],
+                                       name=name)
+                if attrs.get('%s.units' % name, None):
+                    dim.units = attrs['%s.units' % name]
+                dimensions.append(dim)
+            patch = pyclaw.geometry.Patch(dimensions)
+            patch.patch_index = int(attrs['patch_index'])
+            patch.level = int(attrs['level'])
+
+            aux = None
+            if read_aux and group.get('aux', None) is not None:
+                aux = read_dataset(group['aux'])
+            states.append(_make_state(patch, float(attrs['t']),
+                                      read_dataset(group['q'], fields),
+                                      int(attrs['num_aux']), aux))
+
+    if len(states) == 0:
+        raise IOError('No patches of frame %s lie in the requested window.'
+                      % frame)
+    solution = pyclaw.Solution()
+    solution.states = states
+    solution.domain = pyclaw.geometry.Domain([state.patch for state in states])
+    return solution
+
+
+def read_time(frame, path='./', file_prefix='claw'):
+    r"""Read only the output time of a frame from the attributes of its
+        first patch.
+    """
+    import h5py
+    fname = _file_name(frame, path, file_prefix)
+    with h5py.File(fname, 'r') as f:
+        for group in f.values():
+            return float(group.attrs['t'])
+
+
+def _file_name(frame, path, file_prefix):
+    r"""Return the name of the file of a frame; `path` is either the file
+        or the directory containing it.
+    """
+    if os.path.isfile(path):
+        return path
+    return os.path.join(path, '%s%s.hdf' % (file_prefix, str(frame).zfill(4)))
+
+
+def read_dataset(dataset, fields=None):
+    r"""Read an HDF5 dataset of shape (num_var, n1, ..., nd), or only the
+        components listed in `fields`.
+    """
+    if fields is None:
+        return np.asfortranarray(dataset[...])
+    values = new_field_array(dataset.shape[0], dataset.shape[1:])
+    for m in fields:
+        values[m] = dataset[m, ...]
+    return values
@@ -0,0 +1,297 @@
+r"""
+Binary sidecar files holding the arrays of a frame in memory-mappable form.
+
+A sidecar consists of a `.npy` file with the values of all patches of a
+frame, one after the other, and a small metadata file with the patch table
+(see `griddle.fileio.ascii.index_dtype`) and the fort.t values.  Both live
+in the `_griddle` subdirectory of the output directory.  The metadata file
+is stamped with the modification time and size of the source files, so the
+sidecar is ignored once the source data changes.
+
+Within a patch the values are stored field by field, so that the values of
+one field of one patch occupy a single contiguous range of the file.  When
+a sidecar is read, each `state.q` is a view into a memory map of the `.npy`
+file (opened copy-on-write), and only the pages that are actually used are
+read from disk:
+
+    >>> import os, shutil, tempfile
+    >>> from griddle.fileio import ascii, sidecar
+    >>> path = tempfile.mkdtemp()
+    >>> for name in ['fort.q0005', 'fort.t0005']:
+    ...     _ = shutil.copy('./test_data/_amrclaw_2d_acoustics/'+name, path)
+    >>> sol = ascii.read(5, path=path)
+    >>> sidecar.write(sol, 5, path, source_files=ascii.source_files(5, path))
+    True
+    >>> mapped = sidecar.read(5, path, source_files=ascii.source_files(5, path))
+    >>> bool((mapped.states[3].q == sol.states[3].q).all())
+    True
+    >>> sidecar.read_field(5, path, 3, 0).shape
+    (50, 50)
+
+The same layout is used to send frames between processes: `pack` turns a
+frame into a patch table and one contiguous array of values (or, given a
+directory, a temporary `.npy` file of values), and `unpack` rebuilds the
+frame with views into that array (or a memory map of the file).
+
+    >>> packed = sidecar.pack(sol)
+    >>> packed['q'].shape
+    (60108,)
+    >>> bool((sidecar.unpack(packed).states[3].q == sol.states[3].q).all())
+    True
+"""
+import os
+import tempfile
+import numpy as np
+from clawpack import pyclaw
+from . import cache
+from .ascii import index_dtype, window_patches, _make_patch, _make_state, \
+    _read_pickle, _row_header
+from .. import geometry
+from .ascii import source_files as ascii_source_files
+
+
+def file_names(frame, path, file_prefix='fort'):
+    r"""Return the names of the metadata, q and aux files of a sidecar."""
+    base = cache.cache_file(path, '%s.q%s' % (file_prefix, str(frame).zfill(4)))
+    return base + '.meta.npz', base + '.q.npy', base + '.aux.npy'
+
+
+def write(solution, frame, path, source_files, file_prefix='fort',
+          write_aux=True):
+    r"""Write the sidecar of `solution`, derived from `source_files`.
+        The aux values are only written if `write_aux` is True (they should
+        not be if they were not read).  Returns False if the sidecar could
+        not be written.
+    """
+    meta_fname, q_fname, aux_fname = file_names(frame, path, file_prefix)
+    states = solution.states
+    patches = index_states(states)
+    num_dim = states[0].patch.num_dim
+    num_eqn = states[0].num_eqn
+    num_aux = states[0].num_aux
+
+    try:
+        os.makedirs(os.path.dirname(q_fname), exist_ok=True)
+        _write_values(q_fname, [state.q for state in states])
+        aux_stored = num_aux > 0 and write_aux
+        if aux_stored:
+            _write_values(aux_fname, [state.aux for state in states])
+    except OSError:
+        return False
+    return cache.save(meta_fname, source_files, patches=patches,
+                      t=solution.t, num_eqn=num_eqn, num_aux=num_aux,
+                      num_dim=num_dim, aux_stored=aux_stored)
+
+
+def read(frame, path, source_files, file_prefix='fort', bbox=None,
+         max_level=None, read_aux=True):
+    r"""Return the frame stored in the sidecar as a pyclaw.Solution whose
+        arrays are memory-mapped, or None if there is no up-to-date sidecar
+        (or if `read_aux` is True and the sidecar lacks the aux values).
+        Only the patches selected by `griddle.fileio.ascii.select_patches`
+        are included (`bbox` is ignored for mapped grids).  The problem data
+        and mapping of the frame are read from the PyClaw pickle file, as
+        for text output.
+    """
+    meta = read_metadata(frame, path, source_files, file_prefix)
+    if meta is None:
+        return None
+    if read_aux and meta['num_aux'] > 0 and not meta['aux_stored']:
+        return None
+    problem_data, mapc2p = _read_pickle(frame, path, file_prefix)
+    if not geometry.is_identity_map(mapc2p):
+        bbox = None  # Patch extents are computational coordinates
+    selected = window_patches(meta['patches'], bbox, max_level, frame)
+    meta_fname, q_fname, aux_fname = file_names(frame, path, file_prefix)
+    q_values = np.load(q_fname, mmap_mode='c')
+    aux_values = None
+    if read_aux and meta['aux_stored']:
+        aux_values = np.load(aux_fname, mmap_mode='c')
+    meta['patches'] = meta['patches'][selected]
+    solution = _make_solution(meta, q_values, aux_values)
+    for state in solution.states:
+        state.problem_data = problem_data
+        if mapc2p is not None:
+            state.grid.mapc2p = mapc2p
+    return solution
+
+
+def index_states(states):
+    r"""Return the patch index (see `griddle.fileio.ascii.index_dtype`) of
+        a list of states: their `griddle.geometry.patch_table`, with offsets
+        and sizes counted in values of q.
+    """
+    table = geometry.patch_table([state.patch for state in states])
+    patches = np.zeros(len(states), dtype=index_dtype(states[0].patch.num_dim))
+    for name in table.dtype.names:
+        patches[name] = table[name]
+    sizes = np.prod(patches['num_cells'], axis=1)
+    patches['nbytes'] = states[0].num_eqn*sizes
+    patches['offset'] = np.cumsum(patches['nbytes']) - patches['nbytes']
+    return patches
+
+
+def pack(solution, directory=None):
+    r"""Return a frame as a dictionary of plain values and arrays: the patch
+        table, the values of q (and aux) of all patches in one array each,
+        and the time, problem data and mapping of the frame.
+
+        If `directory` is given, the values are instead written to new
+        `.npy` files in it, and the dictionary holds their names, so that
+        pickling it does not copy the values.
+    """
+    states = solution.states
+    num_aux = states[0].num_aux
+    packed = {'patches': index_states(states), 't': solution.t,
+              'num_eqn': states[0].num_eqn, 'num_aux': num_aux,
+              'num_dim': states[0].patch.num_dim,
+              'problem_data': states[0].problem_data,
+              'mapc2p': states[0].grid.mapc2p,
+              'q': _pack_values([state.q for state in states], directory),
+              'aux': None}
+    if num_aux > 0 and all(state.aux is not None for state in states):
+        packed['aux'] = _pack_values([state.aux for state in states],
+                                     directory)
+    return packed
+
+
+def unpack(packed):
+    r"""Rebuild a pyclaw.Solution from the output of `pack`.  The arrays of
+        the states are views into `packed['q']` and `packed['aux']`.  Files
+        written by `pack` are memory-mapped (copy-on-write) and removed.
+    """
+    q_values, aux_values = [_unpack_values(packed[name])
+                            for name in ('q', 'aux')]
+    solution = _make_solution(packed, q_values, aux_values)
+    for state in solution.states:
+        state.problem_data = packed['problem_data']
+        state.grid.mapc2p = packed['mapc2p']
+    return solution
+
+
+def _make_solution(meta, q_values, aux_values=None):
+    r"""Build a pyclaw.Solution whose arrays are views into `q_values` and
+        `aux_values`, laid out as described by the patch table of `meta`.
+    """
+    num_eqn, num_aux = meta['num_eqn'], meta['num_aux']
+    states = []
+    for row in meta['patches']:
+        aux = None
+        if aux_values is not None:
+            aux_row = row.copy()
+            aux_row['offset'] = row['offset']//num_eqn*num_aux
+            aux = _patch_values(aux_values, aux_row, num_aux)
+        states.append(_make_state(_make_patch(_row_header(row)), meta['t'],
+                                  _patch_values(q_values, row, num_eqn),
+                                  num_aux, aux))
+
+    solution = pyclaw.Solution()
+    solution.states = states
+    solution.domain = pyclaw.geometry.Domain([state.patch for state in states])
+    return solution
+
+
+def read_metadata(frame, path, source_files=None, file_prefix='fort'):
+    r"""Return the metadata of a sidecar, or None if it does not exist or
+        (when `source_files` is given) is out of date.
+    """
+    meta_fname = file_names(frame, path, file_prefix)[0]
+    if source_files is None:
+        if not os.path.exists(meta_fname):
+            return None
+        with np.load(meta_fname) as data:
+            stored = {key: data[key] for key in data.files}
+    else:
+        stored = cache.load(meta_fname, source_files)
+        if stored is None:
+            return None
+    meta = {'t': float(stored['t']), 'patches': stored['patches']}
+    for key in ('num_eqn', 'num_aux', 'num_dim'):
+        meta[key] = int(stored[key])
+    meta['aux_stored'] = bool(stored['aux_stored']) if 'aux_stored' in stored \
+        else meta['num_aux'] > 0
+    return meta
+
+
+def read_field(frame, path, patch, field, file_prefix='fort',
+               source_files=None):
+    r"""Return the values of one field of one patch from a sidecar.  Only
+        the bytes holding those values are read.  The sidecar must be up to
+        date with `source_files` (by default, the fort.q and fort.t files
+        of the frame).
+    """
+    if source_files is None:
+        source_files = ascii_source_files(frame, path, file_prefix)
+    meta = read_metadata(frame, path, source_files, file_prefix)
+    if meta is None:
+        raise IOError('No up-to-date sidecar for frame %s in %s' % (frame, path))
+    q_values = np.load(file_names(frame, path, file_prefix)[1], mmap_mode='r')
+    q = _patch_values(q_values, meta['patches'][patch], meta['num_eqn'])
+    return np.array(q[field])
+
+
+def _write_values(fname, arrays):
+    r"""Write the arrays of all patches, field by field, to one .npy file."""
+    size = sum(array.size for array in arrays)
+    tmp_fname = fname + '.tmp.npy'
+    values = np.lib.format.open_memmap(tmp_fname, mode='w+', dtype=float,
+                                       shape=(size,))
+    start = 0
+    for array in arrays:
+        values[start:start+array.size] = _field_major(array).ravel()
+        start += array.size
+    values.flush()
+    del values
+    os.replace(tmp_fname, fname)
+
+
+def _pack_values(arrays, directory=None):
+    r"""Concatenate arrays with `_concatenate`, or write them to a new file
+        in `directory` and return its name.
+    """
+    if directory is None:
+        return _concatenate(arrays)
+    handle, fname = tempfile.mkstemp(suffix='.npy', dir=directory)
+    os.close(handle)
+    _write_values(fname, arrays)
+    return fname
+
+
+def _unpack_values(values):
+    r"""Return packed values, mapping and removing them if they are a file.
+        The mapping stays valid after the file is removed.
+    """
+    if not isinstance(values, str):
+        return values
+    mapped = np.load(values, mmap_mode='c')
+    os.remove(values)
+    return mapped
+
+
+def _concatenate(arrays):
+    r"""Store the arrays of all patches, field by field, in one array."""
+    values = np.empty(sum(array.size for array in arrays))
+    start = 0
+    for array in arrays:
+        values[start:start+array.size] = _field_major(array).ravel()
+        start += array.size
+    return values
+
+
+def _field_major(array):
+    r"""Reorder an array of shape (num_var, n1, ..., nd) so that a C-order
+        ravel stores each field contiguously in Fortran order.
+    """
+    num_dim = array.ndim - 1
+    return array.transpose((0,) + tuple(range(num_dim, 0, -1)))
+
+
+def _patch_values(values, row, num_var):
+    r"""Return a view of the values of one patch, with shape
+        (num_var, n1, ..., nd).
+    """
+    num_cells = tuple(row['num_cells'].tolist())
+    size = num_var*int(np.prod(num_cells))
+    block = values[row['offset']:row['offset']+size]
+    block = block.reshape((num_var,) + num_cells[::-1])
+    return _field_major(block)
@@ -4,6 +4,7 @@ Module defining geometry objects.
 
 from __future__ import absolute_import
 from __future__ import print_function
+import collections
 import numpy as np
 
 import six
@@ -28,6 +29,139 @@ identity_map={'1': identity_map_1d,
               '2': identity_map_2d,
               '3': identity_map_3d}
 
+# Bumped whenever the geometry of an existing Dimension or Patch changes, so
+# that tables derived from patches (see Domain.table) can tell in O(1) whether
+# they are up to date
+_geometry_version = 0
+
+def _geometry_changed():
+    global _geometry_version
+    _geometry_version += 1
+
+def is_identity_map(mapc2p):
+    r"""
+    Check whether mapc2p is absent (None) or is one of the identity maps of
+    griddle or PyClaw, so that physical and computational coordinates
+    coincide.
+    """
+    if mapc2p is None or mapc2p in list(identity_map.values()):
+        return True
+    try:
+        from clawpack.pyclaw import geometry as pyclaw_geometry
+    except ImportError:
+        return False
+    return mapc2p in list(pyclaw_geometry.identity_map.values())
+
+def _coordinate_list(function):
+    r"""
+    Wrap a mapping so that it returns a list of arrays, one per dimension,
+    also in 1D, where mappings may return a single array.
+    """
+    def wrapped(*p):
+        result = function(*p)
+        if len(p) == 1 and np.ndim(result) == np.ndim(p[0]):
+            result = [result]
+        return [np.asarray(r) for r in result]
+    return wrapped
+
+# ============================================================================
+#  Shared coordinate arrays
+# ============================================================================
+# Patches of AMR output often have the same extent in some dimension, and
+# the same extents recur from frame to frame, so 1D coordinate arrays are
+# interned: dimensions with equal (lower, upper, num_cells) share one
+# read-only array.
+_coordinate_arrays = collections.OrderedDict()
+max_interned_arrays = 4096
+
+def interned_coordinates(kind,lower,upper,num_cells):
+    r"""
+    Return the (read-only) array of cell 'centers' or 'nodes' of a
+    dimension, shared with all dimensions with the same extent and number
+    of cells.
+    """
+    key = (kind,lower,upper,num_cells)
+    try:
+        array = _coordinate_arrays[key]
+        _coordinate_arrays.move_to_end(key)
+    except KeyError:
+        delta = (upper-lower) / float(num_cells)
+        if kind == 'nodes':
+            array = lower + np.arange(num_cells+1)*delta
+        else:
+            array = lower + (np.arange(num_cells)+0.5)*delta
+        array.flags.writeable = False
+        _coordinate_arrays[key] = array
+        if len(_coordinate_arrays) > max_interned_arrays:
+            _coordinate_arrays.popitem(last=False)
+    return array
+
+def _broadcast_coordinates(arrays):
+    r"""
+    Return N-D coordinate arrays for the 1D coordinate arrays of each
+    dimension.  These are read-only views of the 1D arrays (as from a sparse
+    meshgrid, broadcast to the full shape), so no memory is used until a
+    caller makes a dense copy.
+    """
+    shape = tuple(len(array) for array in arrays)
+    views = []
+    for i,array in enumerate(arrays):
+        sparse_shape = [1]*len(arrays)
+        sparse_shape[i] = len(array)
+        views.append(np.broadcast_to(array.reshape(sparse_shape),shape))
+    return views
+
+
+class MappingMemo(object):
+    r"""
+    Process-wide memo of the physical coordinates computed by mapc2p
+    functions, keyed by the mapping function and the geometry of the grid.
+    Patches with identical extents (common in AMR output, from frame to
+    frame) are then mapped only once.
+
+    The memo is disabled by default, since it assumes mappings are pure
+    functions of the coordinates; enable it with ``mapc2p_memo.enabled =
+    True``.  Memoized arrays are shared between grids, so they are
+    read-only.  Identity mappings are never memoized.
+    """
+    def __init__(self,max_entries=256):
+        self.enabled = False
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._values = collections.OrderedDict()
+
+    def map(self,grid,kind,num_ghost,coordinates):
+        r"""
+        Return grid.mapc2p(*coordinates), where coordinates are the
+        computational cell 'centers' or 'nodes' of grid with num_ghost ghost
+        cells.
+        """
+        mapc2p = grid.mapc2p
+        if not self.enabled or is_identity_map(mapc2p):
+            return mapc2p(*coordinates)
+        key = (mapc2p,kind,num_ghost,
+               tuple((dim.lower,dim.upper,dim.num_cells) for dim in grid.dimensions))
+        try:
+            mapped = self._values[key]
+            self._values.move_to_end(key)
+            self.hits += 1
+        except KeyError:
+            mapped = mapc2p(*coordinates)
+            for array in (mapped if isinstance(mapped,(tuple,list)) else [mapped]):
+                if isinstance(array,np.ndarray):
+                    array.flags.writeable = False
+            self._values[key] = mapped
+            self.misses += 1
+            if len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+        return mapped
+
+    def clear(self):
+        self._values.clear()
+
+mapc2p_memo = MappingMemo()
+
 class Grid(object):
     r"""
     Representation of a single grid.
@@ -90,7 +224,9 @@ class Grid(object):
     Properties beginning with 'c' refer to the computational (unmapped) domain, while
     properties beginning with 'p' refer to the physical (mapped) domain.  For grids with
     no mapping, the two are identical.  Also note the difference between 'center' and
-    'centers'.
+    'centers'.  The computational coordinate arrays are read-only views of the 1D
+    arrays of the dimensions, which take no memory of their own; use np.array()
+    to get a dense, writeable copy.
 
         >>> import numpy as np
         >>> np.set_printoptions(precision=2)  # avoid doctest issues with roundoff
@@ -208,8 +344,25 @@ class Grid(object):
     @mapc2p.setter
     def mapc2p(self,mapc2p):
         self._mapc2p = mapc2p
+        self._mapp2c = None
         self._clear_cached_values()
 
+    @property
+    def mapp2c(self):
+        r"""(func) - Inverse of :attr:`mapc2p`: the analytic inverse, if one
+        has been set, or else :meth:`_solve_mapp2c`.  In every case it
+        returns a list of arrays, one per dimension.  Setting mapc2p resets
+        it."""
+        if self._mapp2c is not None:
+            return _coordinate_list(self._mapp2c)
+        if is_identity_map(self.mapc2p):
+            return _coordinate_list(identity_map[str(self.num_dim)])
+        return self._solve_mapp2c
+
+    @mapp2c.setter
+    def mapp2c(self,mapp2c):
+        self._mapp2c = mapp2c
+
     # ========== Class Methods ===============================================
     def __init__(self,dimensions):
         r"""
@@ -237,6 +390,13 @@ class Grid(object):
         self._p_nodes = None
         self._c_centers = None
         self._c_nodes = None
+        # Coordinates including ghost cells, by number of ghost cells
+        self._c_centers_with_ghost = {}
+        self._c_nodes_with_ghost = {}
+        self._p_centers_with_ghost = {}
+        self._p_nodes_with_ghost = {}
+        self._inverse_table = None
+        self._mapp2c = None
 
         # Dimension parsing
         if isinstance(dimensions,Dimension):
@@ -254,6 +414,11 @@ class Grid(object):
         self._p_nodes = None
         self._c_centers = None
         self._c_nodes = None
+        self._c_centers_with_ghost = {}
+        self._c_nodes_with_ghost = {}
+        self._p_centers_with_ghost = {}
+        self._p_nodes_with_ghost = {}
+        self._inverse_table = None
 
     # ========== Dimension Manipulation ======================================
     def add_dimension(self,dimension):
@@ -310,10 +475,7 @@ class Grid(object):
         """
         if recompute or (self._c_centers is None) or \
            any([c is None for c in self.get_dim_attribute('_centers')]):
-            index = np.indices(self.num_cells)
-            self._c_centers = []
-            for i,center_array in enumerate(self.get_dim_attribute('centers')):
-                self._c_centers.append(center_array[index[i,...]])
+            self._c_centers = _broadcast_coordinates(self.get_dim_attribute('centers'))
 
     def _compute_c_nodes(self, recompute=False):
         r"""Calculate the coordinates of the nodes in the computational domain.
@@ -323,10 +485,7 @@ class Grid(object):
         """
         if recompute or (self._c_nodes is None) or \
            any([c is None for c in self.get_dim_attribute('_nodes')]):
-            index = np.indices(n+1 for n in self.num_cells)
-            self._c_nodes = []
-            for i,edge_array in enumerate(self.get_dim_attribute('nodes')):
-                self._c_nodes.append(edge_array[index[i,...]])
+            self._c_nodes = _broadcast_coordinates(self.get_dim_attribute('nodes'))
 
     def _compute_p_centers(self, recompute=False):
         r"""Calculate the coordinates of the centers in the physical domain.
@@ -337,7 +496,7 @@ class Grid(object):
         if recompute or (self._p_centers is None) or \
            any([c is None for c in self.get_dim_attribute('_centers')]):
             self._compute_c_centers(recompute=recompute)
-            self._p_centers = self.mapc2p(*self._c_centers)
+            self._p_centers = mapc2p_memo.map(self,'centers',0,self._c_centers)
 
     def _compute_p_nodes(self, recompute=False):
         r"""Calculate the coordinates of the nodes (corners) in the physical domain.
@@ -348,7 +507,7 @@ class Grid(object):
         if recompute or (self._p_nodes is None) or \
            any([c is None for c in self.get_dim_attribute('_nodes')]):
             self._compute_c_nodes(recompute=recompute)
-            self._p_nodes = self.mapc2p(*self._c_nodes)
+            self._p_nodes = mapc2p_memo.map(self,'nodes',0,self._c_nodes)
 
     def c_center(self,ind):
         r"""Compute center of computational cell with index ind."""
@@ -368,12 +527,12 @@ class Grid(object):
         :Input:
          - *num_ghost* - (int) Number of ghost cell layers
         """
-        index = np.indices(n+2*num_ghost for n in self.num_cells)
-        centers = []
-        for i,dim in enumerate(self.dimensions):
-            center_array = dim.centers_with_ghost(num_ghost)
-            centers.append(center_array[index[i,...]])
-        return centers
+        if num_ghost not in self._c_centers_with_ghost or \
+           any([num_ghost not in dim._centers_with_ghost for dim in self.dimensions]):
+            self._c_centers_with_ghost[num_ghost] = _broadcast_coordinates(
+                [dim.centers_with_ghost(num_ghost) for dim in self.dimensions])
+            self._p_centers_with_ghost.pop(num_ghost,None)
+        return self._c_centers_with_ghost[num_ghost]
 
     def c_nodes_with_ghost(self, num_ghost):
         r"""
@@ -383,18 +542,128 @@ class Grid(object):
         :Input:
          - *num_ghost* - (int) Number of ghost cell layers
         """
-        index = np.indices(n+2*num_ghost+1 for n in self.num_cells)
-        nodes = []
-        for i,dim in enumerate(self.dimensions):
-            edge_array = dim.nodes_with_ghost(num_ghost)
-            nodes.append(edge_array[index[i,...]])
-        return nodes
+        if num_ghost not in self._c_nodes_with_ghost or \
+           any([num_ghost not in dim._nodes_with_ghost for dim in self.dimensions]):
+            self._c_nodes_with_ghost[num_ghost] = _broadcast_coordinates(
+                [dim.nodes_with_ghost(num_ghost) for dim in self.dimensions])
+            self._p_nodes_with_ghost.pop(num_ghost,None)
+        return self._c_nodes_with_ghost[num_ghost]
 
     def p_centers_with_ghost(self,num_ghost):
-        return self.mapc2p(*self.c_centers_with_ghost(num_ghost))
+        centers = self.c_centers_with_ghost(num_ghost)
+        if num_ghost not in self._p_centers_with_ghost:
+            self._p_centers_with_ghost[num_ghost] = \
+                mapc2p_memo.map(self,'centers',num_ghost,centers)
+        return self._p_centers_with_ghost[num_ghost]
 
     def p_nodes_with_ghost(self,num_ghost):
-        return self.mapc2p(*self.c_nodes_with_ghost(num_ghost))
+        nodes = self.c_nodes_with_ghost(num_ghost)
+        if num_ghost not in self._p_nodes_with_ghost:
+            self._p_nodes_with_ghost[num_ghost] = \
+                mapc2p_memo.map(self,'nodes',num_ghost,nodes)
+        return self._p_nodes_with_ghost[num_ghost]
+
+    def locate_cells(self,*p):
+        r"""
+        Return the indices of the cells containing the physical points with
+        coordinates p (arrays of the same shape, one per dimension), as one
+        integer array per dimension.  Points outside the grid have index -1
+        in every dimension.
+        """
+        c = self.mapp2c(*p)
+        indices = []
+        outside = np.zeros(np.shape(p[0]),dtype=bool)
+        for ci,dim in zip(c,self.dimensions):
+            ci = np.asarray(ci,dtype=float)
+            with np.errstate(invalid='ignore'):
+                index = np.floor((ci-dim.lower)/dim.delta)
+                outside |= ~((index >= 0) & (index < dim.num_cells))
+            indices.append(index)
+        return [np.where(outside,-1,index).astype(int) for index in indices]
+
+    def _solve_mapp2c(self,*p,**kwargs):
+        r"""
+        Invert :attr:`mapc2p` numerically for a batch of physical points
+        with coordinates p (arrays of the same shape, one per dimension).
+
+        Each point is seeded with the nearest point of a coarse lookup table
+        of mapped computational nodes, which is cached with the grid, and
+        then refined by Newton iterations on all points at once, with
+        Jacobians from finite differences.  Points for which Newton's method
+        does not converge (within `tol` times the extent of the mapped grid,
+        after `max_iter` iterations) are returned as NaN.
+
+        :Examples:
+
+            >>> from griddle.geometry import Dimension, Grid
+            >>> grid = Grid((Dimension(1.,2.,10,name='r'),
+            ...              Dimension(0.,np.pi/2,10,name='theta')))
+            >>> grid.mapc2p = lambda r,t: (r*np.cos(t), r*np.sin(t))
+            >>> r, theta = grid.mapp2c(np.array([0.,1.5]), np.array([1.2,1.5]))
+            >>> np.round(r,6).tolist(), np.round(theta,6).tolist()
+            ([1.2, 2.12132], [1.570796, 0.785398])
+        """
+        tol = kwargs.get('tol',1.e-10)
+        max_iter = kwargs.get('max_iter',20)
+        shape = np.shape(p[0])
+        num_dim = self.num_dim
+        points = np.stack([np.asarray(pi,dtype=float).ravel() for pi in p],axis=1)
+        c_table, p_table = self._lookup_table()
+        scale = max(np.max(np.ptp(p_table,axis=0)),np.finfo(float).tiny)
+        step = 1.e-7*(np.array(self.upper)-np.array(self.lower))
+
+        # Seed each point with its nearest neighbour in the lookup table,
+        # with squared distances |p|^2 - 2 p.t + |t|^2 (|p|^2 is the same
+        # for all entries) for chunks of points, bounding the temporaries
+        c = np.empty_like(points)
+        table_norms = (p_table**2).sum(axis=1)
+        chunk_size = max(1,2**18//len(p_table))
+        for start in range(0,len(points),chunk_size):
+            chunk = points[start:start+chunk_size]
+            distance = table_norms - 2*np.dot(chunk,p_table.T)
+            c[start:start+chunk_size] = c_table[distance.argmin(axis=1)]
+
+        active = np.arange(len(points))
+        for iteration in range(max_iter+1):
+            mapped = self._map_points(c[active])
+            residual = mapped - points[active]
+            converged = np.abs(residual).max(axis=1) <= tol*scale
+            active, residual = active[~converged], residual[~converged]
+            if len(active) == 0 or iteration == max_iter:
+                break
+            jacobian = np.empty((len(active),num_dim,num_dim))
+            mapped = mapped[~converged]
+            for d in range(num_dim):
+                shifted = c[active].copy()
+                shifted[:,d] += step[d]
+                jacobian[:,:,d] = (self._map_points(shifted)-mapped)/step[d]
+            update = np.matmul(np.linalg.pinv(jacobian),residual[:,:,np.newaxis])
+            c[active] -= update[:,:,0]
+        c[active] = np.nan
+        return [c[:,d].reshape(shape) for d in range(num_dim)]
+
+    def _map_points(self,c):
+        r"""Map computational points of shape (num_points, num_dim)."""
+        mapped = self.mapc2p(*c.T)
+        if self.num_dim == 1 and np.ndim(mapped) == 1:
+            mapped = (mapped,)
+        return np.stack([np.asarray(m,dtype=float) for m in mapped],axis=1)
+
+    def _lookup_table(self):
+        r"""
+        Return the computational and mapped coordinates of a coarse grid of
+        nodes spanning the grid, with at most about 4096 points in all, used
+        to seed :meth:`_solve_mapp2c`.  The table is cached until the mapping
+        or the extent of the grid changes.
+        """
+        key = tuple((dim.lower,dim.upper,dim.num_cells) for dim in self.dimensions)
+        if self._inverse_table is None or self._inverse_table[0] != key:
+            samples = max(2,int(round(4096**(1./self.num_dim))))
+            axes = [np.linspace(dim.lower,dim.upper,min(dim.num_cells+1,samples))
+                    for dim in self.dimensions]
+            c_table = np.stack([a.ravel() for a in np.meshgrid(*axes,indexing='ij')],axis=1)
+            self._inverse_table = (key,c_table,self._map_points(c_table))
+        return self._inverse_table[1:]
 
     def plot(self,num_ghost=0,mapped=True,mark_nodes=False,mark_centers=False,ax=None):
         r"""Make a plot of the grid.
@@ -495,21 +764,19 @@ class Dimension(object):
     @property
     def nodes(self):
         r"""(ndarrary(:)) - Location of all cell edge coordinates
-        for this dimension"""
+        for this dimension (read-only; see :func:`interned_coordinates`)"""
         if self._nodes is None:
-            self._nodes = np.empty(self.num_cells+1)
-            for i in range(0,self.num_cells+1):
-                self._nodes[i] = self.lower + i*self.delta
+            self._nodes = interned_coordinates('nodes',self.lower,self.upper,
+                                               self.num_cells)
         return self._nodes
 
     @property
     def centers(self):
         r"""(ndarrary(:)) - Location of all cell center coordinates
-        for this dimension"""
+        for this dimension (read-only; see :func:`interned_coordinates`)"""
         if self._centers is None:
-            self._centers = np.empty(self.num_cells)
-            for i in range(0,self.num_cells):
-                self._centers[i] = self.lower + (i+0.5)*self.delta
+            self._centers = interned_coordinates('centers',self.lower,self.upper,
+                                                 self.num_cells)
         return self._centers
 
     @property
@@ -519,8 +786,7 @@ class Dimension(object):
     @lower.setter
     def lower(self,lower):
         self._lower = float(lower)
-        self._centers = None  # Reset cached arrays
-        self._nodes = None
+        self._clear_cached_values()
         self._check_validity()
 
     @property
@@ -530,8 +796,7 @@ class Dimension(object):
     @upper.setter
     def upper(self,upper):
         self._upper = float(upper)
-        self._centers = None  # Reset cached arrays
-        self._nodes = None
+        self._clear_cached_values()
         self._check_validity()
 
     @property
@@ -541,25 +806,41 @@ class Dimension(object):
     @num_cells.setter
     def num_cells(self,num_cells):
         self._num_cells = int(num_cells)
+        self._clear_cached_values()
+        self._check_validity()
+
+    def _clear_cached_values(self):
         self._centers = None  # Reset cached arrays
         self._nodes = None
-        self._check_validity()
+        self._centers_with_ghost = {}
+        self._nodes_with_ghost = {}
+        _geometry_changed()
 
     def centers_with_ghost(self,num_ghost):
         r"""(ndarrary(:)) - Location of all cell center coordinates
-        for this dimension, including centers of ghost cells."""
-        centers = self.centers
-        pre = self.lower+(np.arange(-num_ghost,0)+0.5)*self.delta
-        post = self.upper + self.delta * (np.arange(num_ghost) + 0.5)
-        return np.hstack((pre,centers,post))
+        for this dimension, including centers of ghost cells (read-only,
+        cached for each num_ghost)."""
+        if num_ghost not in self._centers_with_ghost:
+            centers = self.centers
+            pre = self.lower+(np.arange(-num_ghost,0)+0.5)*self.delta
+            post = self.upper + self.delta * (np.arange(num_ghost) + 0.5)
+            array = np.hstack((pre,centers,post))
+            array.flags.writeable = False
+            self._centers_with_ghost[num_ghost] = array
+        return self._centers_with_ghost[num_ghost]
 
     def nodes_with_ghost(self,num_ghost):
         r"""(ndarrary(:)) - Location of all edge coordinates
-        for this dimension, including nodes of ghost cells."""
-        nodes   = self.nodes
-        pre  = np.linspace(self.lower-num_ghost*self.delta,self.lower-self.delta,num_ghost)
-        post = np.linspace(self.upper+self.delta, self.upper+num_ghost*self.delta,num_ghost)
-        return np.hstack((pre,nodes,post))
+        for this dimension, including nodes of ghost cells (read-only,
+        cached for each num_ghost)."""
+        if num_ghost not in self._nodes_with_ghost:
+            nodes   = self.nodes
+            pre  = np.linspace(self.lower-num_ghost*self.delta,self.lower-self.delta,num_ghost)
+            post = np.linspace(self.upper+self.delta, self.upper+num_ghost*self.delta,num_ghost)
+            array = np.hstack((pre,nodes,post))
+            array.flags.writeable = False
+            self._nodes_with_ghost[num_ghost] = array
+        return self._nodes_with_ghost[num_ghost]
 
     def __init__(self, lower, upper, num_cells, name='x',
                  on_lower_boundary=None,on_upper_boundary=None, units=None):
@@ -574,8 +855,8 @@ class Dimension(object):
 
         self._nodes = None
         self._centers = None
-        self._centers_with_ghost = None
-        self._nodes_with_ghost = None
+        self._centers_with_ghost = {}  # num_ghost -> array
+        self._nodes_with_ghost = {}
 
         self._lower = float(lower)
         self._upper = float(upper)
@@ -651,11 +932,29 @@ class Patch(object):
         r"""(list) - List of names of each dimension"""
         return self._dimensions
 
-    def __init__(self,dimensions):
-        self.level = 1
+    @property
+    def level(self):
         r"""(int) - AMR level this patch belongs to, ``default = 1``"""
-        self.patch_index = 1
-        r"""(int) - Patch number of current patch, ``default = 0``"""
+        return self._level
+
+    @level.setter
+    def level(self,level):
+        self._level = level
+        _geometry_changed()
+
+    @property
+    def patch_index(self):
+        r"""(int) - Patch number of current patch, ``default = 1``"""
+        return self._patch_index
+
+    @patch_index.setter
+    def patch_index(self,patch_index):
+        self._patch_index = patch_index
+        _geometry_changed()
+
+    def __init__(self,dimensions):
+        self._level = 1
+        self._patch_index = 1
 
         if isinstance(dimensions,Dimension):
             dimensions = [dimensions]
@@ -692,10 +991,9 @@ class Patch(object):
         """
         return [getattr(getattr(self,name),attr) for name in self._dimensions]
 
-    def __deepcopy__(self,memo={}):
+    def __deepcopy__(self,memo=None):
         import copy
-        result = self.__class__(copy.deepcopy(self.dimensions))
-        result.__init__(copy.deepcopy(self.dimensions))
+        result = self.__class__(copy.deepcopy(self.dimensions,memo))
         result.grid.mapc2p = self.grid.mapc2p
 
         for attr in ('level','patch_index'):
@@ -708,6 +1006,224 @@ class Patch(object):
         output += '\n'.join((str(getattr(self,dim)) for dim in self._dimensions))
         return output
 
+# ============================================================================
+#  Patch tables
+# ============================================================================
+dimension_names = ('x','y','z')
+
+def patch_table_dtype(num_dim):
+    r"""
+    Return the structured dtype of a patch table for patches of dimension
+    num_dim: one row (patch_index, level, num_cells, lower, upper, delta)
+    per patch.
+    """
+    return np.dtype([('patch_index','i8'),('level','i8'),
+                     ('num_cells','i8',(num_dim,)),
+                     ('lower','f8',(num_dim,)),('upper','f8',(num_dim,)),
+                     ('delta','f8',(num_dim,))])
+
+def patch_table(patches):
+    r"""
+    Return the patch table (see :func:`patch_table_dtype`) of a list of
+    patches.
+    """
+    lower = np.array([patch.lower_global for patch in patches],dtype=float)
+    table = np.zeros(len(patches),dtype=patch_table_dtype(lower.shape[1]))
+    table['level'] = [getattr(patch,'level',1) for patch in patches]
+    table['patch_index'] = [getattr(patch,'patch_index',1) for patch in patches]
+    table['lower'] = lower
+    table['upper'] = [patch.upper_global for patch in patches]
+    table['num_cells'] = [patch.num_cells_global for patch in patches]
+    table['delta'] = (table['upper']-table['lower'])/table['num_cells']
+    return table
+
+
+class PatchView(object):
+    r"""
+    Lightweight, read-only view of one row of a patch table, with the
+    global attributes of a :class:`Patch`.  A full Patch (with its
+    Dimensions and Grid) is created by :meth:`patch` when needed.
+
+    :Examples:
+
+        >>> from griddle.geometry import Domain, PatchView
+        >>> domain = Domain((0.,0.),(1.,2.),(10,20))
+        >>> view = PatchView(domain.table,0)
+        >>> view.level, view.num_cells_global, view.delta
+        (1, [10, 20], [0.1, 0.1])
+        >>> print(view.patch().y)
+        Dimension y:  (num_cells,delta,[lower,upper]) = (20,0.1,[0.0,2.0])
+    """
+    __slots__ = ('table','row')
+
+    def __init__(self,table,row):
+        self.table = table
+        self.row = row
+
+    @property
+    def level(self):
+        return int(self.table['level'][self.row])
+
+    @property
+    def patch_index(self):
+        return int(self.table['patch_index'][self.row])
+
+    @property
+    def lower_global(self):
+        return self.table['lower'][self.row].tolist()
+
+    @property
+    def upper_global(self):
+        return self.table['upper'][self.row].tolist()
+
+    @property
+    def num_cells_global(self):
+        return self.table['num_cells'][self.row].tolist()
+
+    @property
+    def num_dim(self):
+        return self.table.dtype['lower'].shape[0]
+
+    @property
+    def delta(self):
+        row = self.table[self.row]
+        return ((row['upper']-row['lower'])/row['num_cells']).tolist()
+
+    def patch(self,mapc2p=None):
+        r"""Return a new :class:`Patch` with the geometry of this row."""
+        row = self.table[self.row]
+        patch = Patch([Dimension(lower,upper,int(n),name=name) for lower,upper,n,name
+                       in zip(row['lower'],row['upper'],row['num_cells'],dimension_names)])
+        patch.level = int(row['level'])
+        patch.patch_index = int(row['patch_index'])
+        if mapc2p is not None:
+            patch.grid.mapc2p = mapc2p
+        return patch
+
+    def __str__(self):
+        return "Patch %s (view): level %s, %s cells, [%s, %s]" % \
+            (self.patch_index,self.level,self.num_cells_global,
+             self.lower_global,self.upper_global)
+
+# ============================================================================
+#  Spatial index of patches
+# ============================================================================
+class PatchIndex(object):
+    r"""
+    Spatial index of a list of patches, for locating points and finding the
+    patches that intersect a box without testing every patch.
+
+    The bounding box of all patches is divided into a uniform grid of bins,
+    whose size is that of a typical patch on the finest level.  Each bin
+    holds the patches that overlap it, finest level first, so that the
+    first patch found to contain a point is the finest one.  Queries are
+    vectorized over points.
+
+    Any objects with attributes :attr:`lower_global`, :attr:`upper_global`
+    and (optionally) :attr:`level` may be indexed, including PyClaw patches.
+
+    :Examples:
+
+        >>> from griddle.geometry import Dimension, Patch, PatchIndex
+        >>> coarse = Patch([Dimension(0.,1.,10,name='x'),Dimension(0.,1.,10,name='y')])
+        >>> fine = Patch([Dimension(0.,0.5,10,name='x'),Dimension(0.,0.5,10,name='y')])
+        >>> fine.level = 2
+        >>> index = PatchIndex([coarse,fine])
+        >>> index.locate([[0.25,0.25],[0.75,0.75],[2.,2.]]).tolist()
+        [1, 0, -1]
+        >>> index.query_box([0.6,0.],[0.9,0.1]).tolist()
+        [0]
+        >>> index.query_box([0.4,0.4],[0.6,0.6]).tolist()
+        [0, 1]
+    """
+
+    def __init__(self,patches,bins_per_patch=4):
+        self.lower = np.array([patch.lower_global for patch in patches],dtype=float)
+        self.upper = np.array([patch.upper_global for patch in patches],dtype=float)
+        self.levels = np.array([getattr(patch,'level',1) for patch in patches])
+        num_patches, num_dim = self.lower.shape
+
+        self.origin = self.lower.min(axis=0)
+        extent = self.upper.max(axis=0) - self.origin
+        finest = self.levels == self.levels.max()
+        size = np.median((self.upper-self.lower)[finest],axis=0)
+        max_bins = int(np.ceil((bins_per_patch*num_patches)**(1./num_dim)))
+        self.num_bins = np.clip(np.ceil(extent/size).astype(int),1,max_bins)
+        self.bin_size = extent/self.num_bins
+
+        # List the (bin, patch) pairs, finest patches first
+        lower_bins = self._bin_coordinates(self.lower)
+        upper_bins = self._bin_coordinates(self.upper)
+        bins = []
+        members = []
+        for j in np.argsort(-self.levels,kind='stable'):
+            ranges = [np.arange(lo,hi+1) for lo, hi in zip(lower_bins[j],upper_bins[j])]
+            overlapped = np.ravel_multi_index(np.meshgrid(*ranges,indexing='ij'),
+                                              self.num_bins).ravel()
+            bins.append(overlapped)
+            members.append(np.full(overlapped.size,j))
+        bins = np.concatenate(bins)
+        members = np.concatenate(members)
+        order = np.argsort(bins,kind='stable')
+        bins, members = bins[order], members[order]
+
+        # Store the patches of each bin in a row of a table padded with -1
+        counts = np.bincount(bins,minlength=int(np.prod(self.num_bins)))
+        starts = np.cumsum(counts) - counts
+        self.table = -np.ones((len(counts),counts.max()),dtype=int)
+        self.table[bins,np.arange(len(bins))-starts[bins]] = members
+
+    def locate(self,points):
+        r"""
+        Return the index of the finest patch containing each point, or -1
+        for points outside all patches.  `points` has shape
+        (num_points, num_dim); for 1D patches, a list of x values is accepted.
+        """
+        points = self._as_points(points)
+        bins = np.ravel_multi_index(self._bin_coordinates(points).T,self.num_bins)
+        candidates = self.table[bins]
+        valid = candidates >= 0
+        safe = np.where(valid,candidates,0)
+        inside = valid & np.all((points[:,np.newaxis,:] >= self.lower[safe]) &
+                                (points[:,np.newaxis,:] <= self.upper[safe]),axis=2)
+        first = inside.argmax(axis=1)
+        return np.where(inside.any(axis=1),
+                        candidates[np.arange(len(points)),first],-1)
+
+    def query_box(self,lower,upper):
+        r"""
+        Return the indices of the patches that intersect the box with corners
+        `lower` and `upper`, sorted by level (coarsest first) and then by
+        index.
+        """
+        lower = np.asarray(lower,dtype=float).ravel()
+        upper = np.asarray(upper,dtype=float).ravel()
+        if np.any(upper < self.origin) or \
+           np.any(lower > self.origin + self.num_bins*self.bin_size):
+            return np.zeros(0,dtype=int)
+        lower_bins = self._bin_coordinates(lower[np.newaxis,:])[0]
+        upper_bins = self._bin_coordinates(upper[np.newaxis,:])[0]
+        ranges = [np.arange(lo,hi+1) for lo, hi in zip(lower_bins,upper_bins)]
+        bins = np.ravel_multi_index(np.meshgrid(*ranges,indexing='ij'),
+                                    self.num_bins).ravel()
+        candidates = np.unique(self.table[bins])
+        candidates = candidates[candidates >= 0]
+        hit = np.all(self.lower[candidates] <= upper,axis=1) & \
+              np.all(self.upper[candidates] >= lower,axis=1)
+        candidates = candidates[hit]
+        return candidates[np.lexsort((candidates,self.levels[candidates]))]
+
+    def _as_points(self,points):
+        points = np.asarray(points,dtype=float)
+        if points.ndim == 1:
+            points = points.reshape(-1,self.lower.shape[1])
+        return points
+
+    def _bin_coordinates(self,points):
+        r"""Return the (clipped) bin coordinates of each point."""
+        coordinates = np.floor((points-self.origin)/self.bin_size).astype(int)
+        return np.clip(coordinates,0,self.num_bins-1)
+
 # ============================================================================
 #  Domain object definition
 # ============================================================================
@@ -715,7 +1231,8 @@ class Domain(object):
     r"""
     A Domain is a list of Patches.
 
-    A Domain may be initialized in the following ways:
+    A Domain may be initialized in the following ways, or from a patch
+    table with :meth:`from_table`:
 
         1. Using 3 arguments, which are in order
             - A list of the lower boundaries in each dimension
@@ -734,12 +1251,82 @@ class Domain(object):
         2
         >>> print(domain.grid.num_cells)
         [100, 100]
+
+    The geometry of all patches is also held in a NumPy structured array,
+    :attr:`table` (see :func:`patch_table_dtype`), so that queries over
+    patches are vectorized.  A Domain created from a table holds only the
+    table, and creates its :attr:`patches` on first access:
+
+        >>> table = griddle.geometry.patch_table(domain.patches*3)
+        >>> table['level'] = [1, 2, 2]
+        >>> domain = griddle.geometry.Domain.from_table(table)
+        >>> domain.patches_on_level(2).tolist(), domain.total_num_cells
+        ([1, 2], 30000)
+        >>> print(domain.views[2].level)
+        2
     """
     @property
     def num_dim(self):
         r"""(int) - :attr:`Patch.num_dim` of base patch"""
+        if self._patches is None:
+            return self._table.dtype['lower'].shape[0]
         return self._get_base_patch_attribute('num_dim')
 
+    @property
+    def patches(self):
+        r"""(list) - List of :class:`Patch` objects; for a Domain created
+        with :meth:`from_table`, they are created on first access"""
+        if self._patches is None:
+            self._patches = [view.patch(self._mapc2p) for view in self.views]
+            self._table_key = _geometry_version
+        return self._patches
+
+    @patches.setter
+    def patches(self,patches):
+        self._patches = patches
+        self._table = None
+        self._spatial_index = None
+
+    @property
+    def table(self):
+        r"""(ndarray) - Patch table of the patches, see :func:`patch_table`;
+        rebuilt if :attr:`patches` is set or the geometry of a patch
+        changes (a list of patches changed in place must be set again)"""
+        if self._patches is not None:
+            key = _geometry_version
+            if self._table is None or self._table_key != key:
+                self._table = patch_table(self._patches)
+                self._table_key = key
+        return self._table
+
+    @property
+    def views(self):
+        r"""(list) - :class:`PatchView` of each row of :attr:`table`"""
+        table = self.table
+        return [PatchView(table,row) for row in range(len(table))]
+
+    @property
+    def total_num_cells(self):
+        r"""(int) - Number of cells in all patches"""
+        return int(np.prod(self.table['num_cells'],axis=1).sum())
+
+    def patches_on_level(self,level):
+        r"""Return the indices of the patches on AMR level `level`."""
+        return np.nonzero(self.table['level'] == level)[0]
+
+    @classmethod
+    def from_table(cls,table,mapc2p=None):
+        r"""
+        Create a Domain from a patch table, without creating its patches
+        until they are needed.  The patches are given the mapping `mapc2p`,
+        if any.
+        """
+        domain = cls.__new__(cls)
+        domain._init_caches()
+        domain._table = table
+        domain._mapc2p = mapc2p
+        return domain
+
     @property
     def patch(self):
         r"""(:class:`Patch`) - First patch is returned"""
@@ -750,7 +1337,98 @@ class Domain(object):
         r"""(list) - :attr:`Patch.grid` of base patch"""
         return self._get_base_patch_attribute('grid')
 
+    @property
+    def spatial_index(self):
+        r"""(:class:`PatchIndex`) - Spatial index of the patches, built on
+        first use and rebuilt when :attr:`table` is"""
+        if self._patches is None:
+            key, patches = id(self._table), self.views
+        else:
+            key, patches = _geometry_version, self._patches
+        if self._spatial_index is None or self._spatial_index_key != key:
+            self._spatial_index = PatchIndex(patches)
+            self._spatial_index_key = key
+        return self._spatial_index
+
+    def locate_points(self,points):
+        r"""
+        Return the index in :attr:`patches` of the finest patch containing
+        each point, or -1; see :meth:`PatchIndex.locate`.
+        """
+        return self.spatial_index.locate(points)
+
+    def patches_in_box(self,lower,upper):
+        r"""
+        Return the indices in :attr:`patches` of the patches intersecting a
+        box, coarsest first; see :meth:`PatchIndex.query_box`.
+        """
+        return self.spatial_index.query_box(lower,upper)
+
+    def mapped_centers(self,num_ghost=0):
+        r"""
+        Return the list of the physical cell centers of each patch (as
+        :attr:`Grid.p_centers`, or :meth:`Grid.p_centers_with_ghost` if
+        num_ghost > 0), mapping all patches at once; see
+        :meth:`_map_patches`.
+        """
+        return self._map_patches('centers',num_ghost)
+
+    def mapped_nodes(self,num_ghost=0):
+        r"""
+        Return the list of the physical nodes of each patch (as
+        :attr:`Grid.p_nodes`, or :meth:`Grid.p_nodes_with_ghost` if
+        num_ghost > 0), mapping all patches at once; see
+        :meth:`_map_patches`.
+        """
+        return self._map_patches('nodes',num_ghost)
+
+    def _map_patches(self,kind,num_ghost):
+        r"""
+        Map the computational 'centers' or 'nodes' of all patches with one
+        call to each distinct mapc2p function: the coordinates of the patches
+        sharing a mapping are concatenated into one flat array per dimension,
+        mapped, and split into per-patch views of the result.
+
+        The result is cached on the Domain until the patches, their extents
+        or their mappings change, and is also stored in each patch's Grid.
+        """
+        grids = [patch.grid for patch in self.patches]
+        key = [(id(grid),grid.mapc2p,
+                tuple((dim.lower,dim.upper,dim.num_cells) for dim in grid.dimensions))
+               for grid in grids]
+        cached = self._mapped.get((kind,num_ghost))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        groups = collections.OrderedDict()
+        for i,grid in enumerate(grids):
+            groups.setdefault(grid.mapc2p,[]).append(i)
+        mapped = [None]*len(grids)
+        for mapc2p,members in groups.items():
+            if num_ghost == 0:
+                coordinates = [getattr(grids[i],'c_'+kind) for i in members]
+            else:
+                coordinates = [getattr(grids[i],'c_%s_with_ghost' % kind)(num_ghost)
+                               for i in members]
+            shapes = [c[0].shape for c in coordinates]
+            stops = np.cumsum([int(np.prod(shape)) for shape in shapes])
+            flat = [np.concatenate([c[d].ravel() for c in coordinates])
+                    for d in range(len(coordinates[0]))]
+            result = mapc2p(*flat)
+            if len(flat) == 1 and np.ndim(result) == 1:
+                result = (result,)
+            for i,shape,stop in zip(members,shapes,stops):
+                start = stop - int(np.prod(shape))
+                mapped[i] = [np.asarray(r)[start:stop].reshape(shape) for r in result]
+                if num_ghost == 0:
+                    setattr(grids[i],'_p_'+kind,mapped[i])
+                else:
+                    getattr(grids[i],'_p_%s_with_ghost' % kind)[num_ghost] = mapped[i]
+        self._mapped[(kind,num_ghost)] = (key,mapped)
+        return mapped
+
     def __init__(self,*arg):
+        self._init_caches()
         if len(arg)>1:
             lower = arg[0]
             upper = arg[1]
@@ -770,6 +1448,15 @@ class Domain(object):
             elif isinstance(geom[0],Dimension):
                 self.patches = [Patch(geom)]
 
+    def _init_caches(self):
+        self._patches = None
+        self._table = None
+        self._table_key = None
+        self._mapc2p = None
+        self._spatial_index = None
+        self._spatial_index_key = None
+        self._mapped = {}  # (kind, num_ghost) -> (key, mapped coordinates)
+
     def _get_base_patch_attribute(self, name):
         r"""
         Return base patch attribute name
@@ -779,12 +1466,11 @@ class Domain(object):
         """
         return getattr(self.patches[0],name)
 
-    def __deepcopy__(self,memo={}):
+    def __deepcopy__(self,memo=None):
         import copy
-        result = self.__class__(copy.deepcopy(self.patches))
-        result.__init__(copy.deepcopy(self.patches))
-
-        return result
+        if self._patches is None:
+            return self.__class__.from_table(self._table.copy(),self._mapc2p)
+        return self.__class__(copy.deepcopy(self.patches,memo))
 
 
 if __name__ == "__main__":
@@ -77,7 +77,17 @@ class Iplot(cmd.Cmd):
         self.restart = False
         self.prevframeno = 0
 
-        self.frames = {}
+    @property
+    def frames(self):
+        r"""List of the TimeSeries (frame caches) of all plot items."""
+        return [item['frames'] for item in self.plot_spec]
+
+    def clear_frame(self,frameno):
+        r"""Remove frame `frameno` from the cache of every plot item.
+            Returns True if any cached data was removed.
+        """
+        popped = [ts.pop(frameno,None) for ts in self.frames]
+        return any(frame is not None for frame in popped)
 
     def plot_frame(self,frame):
         plot_objects = griddle.plot_frame(self.plot_spec,frame)
@@ -108,7 +118,7 @@ class Iplot(cmd.Cmd):
                     reload = raw_input('    Reload data for frame %s [no] ? '
                                        % self.frameno)
                     if reload in ('y','yes','Y'):
-                        self.frames.pop(str(self.frameno))
+                        self.clear_frame(self.frameno)
         else:
             try:
                 self.frameno = int(startframeno)
@@ -172,6 +182,9 @@ class Iplot(cmd.Cmd):
                 newframeno = int(newframeno)
             except ValueError:
                 print('\n    *** Error: frameno must be an integer, n, or p')
+            # Frames being read ahead of the old position are not needed
+            for ts in self.frames:
+                ts.cancel_prefetch()
             self.frameno = newframeno
             self.plot_frame(self.frameno)
 
@@ -187,11 +200,26 @@ class Iplot(cmd.Cmd):
     def help_r(self):
         print('r: redraw the current frame,  rr: reload and redraw\n')
 
-    def do_rr(self, rest):
+    def do_f(self, rest):
+        previous = [item.get('full_resolution') for item in self.plot_spec]
+        for item in self.plot_spec:
+            item['full_resolution'] = True
         try:
-            self.frames.pop(str(self.frameno))
+            self.plot_frame(self.frameno)
+        finally:
+            for item, value in zip(self.plot_spec, previous):
+                if value is None:
+                    item.pop('full_resolution', None)
+                else:
+                    item['full_resolution'] = value
+
+    def help_f(self):
+        print('f: redraw the current frame at full resolution (for preview plots)\n')
+
+    def do_rr(self, rest):
+        if self.clear_frame(self.frameno):
             print('Cleared data for frame ',self.frameno)
-        except KeyError:
+        else:
             print('No frame data to clear for frame ',self.frameno)
         self.plot_frame(self.frameno)
 
@@ -202,7 +230,8 @@ class Iplot(cmd.Cmd):
     # ---------
     def do_clearframes(self, rest):
         if rest=='':
-            self.frames.clear()
+            for ts in self.frames:
+                ts.clear()
             print('Cleared all frames')
         else:
             for framestr in rest.split():
@@ -210,8 +239,8 @@ class Iplot(cmd.Cmd):
                     frameno = int(framestr)
                 except ValueError:
                     print('Error in clearframes: unrecognized input')
-                popped_frame = self.frames.pop(str(frameno),None)
-                if popped_frame is None:
+                    continue
+                if not self.clear_frame(frameno):
                     print('No frame data to clear for frame ',frameno)
                 else:
                     print('Cleared data for frame ',frameno)
@@ -6,10 +6,17 @@ import os
 import numpy as np
 import griddle
 
-def plot_frame(plot_spec,frame_num=0):
+def plot_frame(plot_spec,frame_num=0,frames=None):
     r"""
     Plot a list of items, specified in plot_spec, using `frame[frame_num]`.
 
+    If `frames` is given, it is a list of already loaded frames, one per
+    plot_item (as yielded by TimeSeries.iter_frames), to use instead.
+
+    Patches outside the axis limits of all items sharing a TimeSeries
+    (plot_item['axis_settings'] 'xlim' and 'ylim') or above their
+    plot_item['max_level'] are not loaded.
+
     Returns: `all_plot_objects`, a list of lists of plot objects.
     `all_plot_objects[i][j]` is a handle to the plot object for plot_item
     `plot_spec[i]` on patch j.
@@ -19,18 +26,23 @@ def plot_frame(plot_spec,frame_num=0):
     # Most of this should happen somewhere else
     # probably in PlotItem.__init__().
     for plot_item in plot_spec:
-        _set_up_time_series(plot_item)
+        _set_up_time_series(plot_item,refresh=False)
         _set_plot_item_defaults(plot_item)
         assert _valid_plot_item(plot_item)
         if 'yt' not in plot_item['plot_type']:
             _clear_item_axes(plot_item)
+    _require_fields(plot_spec)
+    if frames is None:
+        # Streamed frames were loaded with the windows set by _stream_frames
+        _apply_loading_windows(plot_spec)
 
     all_plot_objects = []
 
     # Now do the actual plots
-    for plot_item in plot_spec:
+    for i, plot_item in enumerate(plot_spec):
+        gridded_data = None if frames is None else frames[i]
 
-        plot_objects = plot_item_frame(plot_item,frame_num)
+        plot_objects = plot_item_frame(plot_item,frame_num,gridded_data)
 
         plot_item['plot_objects'] = plot_objects
 
@@ -40,7 +52,7 @@ def plot_frame(plot_spec,frame_num=0):
             plot_item['axes'] = plot_objects[0].axes
 
         plot_item['axes'].set(**plot_item['axis_settings'])
-        _set_axis_title(plot_item,frame_num)
+        _set_axis_title(plot_item,frame_num,gridded_data)
         plot_item['axes'].figure.set_tight_layout(True)
 
         if (plot_item['plot_type'] in ['pcolor']) and not ('colorbar' in plot_item):
@@ -51,7 +63,7 @@ def plot_frame(plot_spec,frame_num=0):
     return all_plot_objects
 
 
-def plot_item_frame(plot_item,frame_num):
+def plot_item_frame(plot_item,frame_num,gridded_data=None):
     r"""
     Plot a single plot_item (typically one field of one gridded_data) on a specified
     axes.
@@ -59,12 +71,16 @@ def plot_item_frame(plot_item,frame_num):
     Inputs:
         - plot_item : a plot_spec plot_item
         - frame num : an integer
+        - gridded_data : the frame to plot, if it is already loaded
 
     Returns a list of handles to the plot objects (e.g., line) on each patch.
     """
-    gridded_data = plot_item['frames'][str(frame_num)]
-    field = plot_item['field']
     plot_type = plot_item['plot_type']
+    if plot_type == 'gauge':
+        return _plot_gauge(plot_item,frame_num)
+    if gridded_data is None:
+        gridded_data = plot_item['frames'][str(frame_num)]
+    field = plot_item['field']
     axes = plot_item.get('axes')
     plot_objects = plot_item.get('plot_objects')
     plot_args = plot_item.get('plot_args',{})
@@ -96,15 +112,22 @@ def plot_item_frame(plot_item,frame_num):
     # ==========================================
     # non-yt plotting - AMR patches handled here
     # ==========================================
+    if plot_type == 'pcolor' and plot_item.get('preview'):
+        return _plot_preview(plot_item,frame_num,gridded_data)
+    if plot_type == 'pcolor' and plot_item.get('composite'):
+        return _plot_composite(plot_item,gridded_data)
+
+    # Expressions are evaluated for all patches at once
+    field = griddle.expressions.as_field(field)
+    griddle.expressions.precompute(gridded_data.states,field,
+                                   griddle.data.derived_fields)
     patch_values = []
     for state in gridded_data.states:
         q = _get_field_values_on_all_patches(state,field)
         patch_values.append(q)
 
     if plot_type == 'pcolor':
-        # Get color range
-        zmin = min([v.min() for v in patch_values])
-        zmax = max([v.max() for v in patch_values])
+        zmin, zmax = _color_limits(plot_item,patch_values)
 
     if axes is None:
         figure = plt.figure()
@@ -136,6 +159,102 @@ def plot_item_frame(plot_item,frame_num):
 
     return plot_objects
 
+def _color_limits(plot_item,values):
+    r"""Return the color range of a pcolor plot of the list of arrays
+        `values` (or of the whole series, if plot_item['series_limits'] is
+        set).
+    """
+    field = plot_item['field']
+    if plot_item.get('series_limits') and type(field) is int:
+        series = plot_item['frames'].reductions()['series']
+        return series['min'][field], series['max'][field]
+    return min([np.nanmin(v) for v in values]), max([np.nanmax(v) for v in values])
+
+def _plot_composite(plot_item,gridded_data):
+    r"""Plot a 2D frame as a single image, resampled onto a uniform grid
+        of plot_item['composite'] pixels (see griddle.resample.composite)
+        covering the axis limits or, if they are not set, all patches.
+        Mapped grids are not supported.
+    """
+    axes = plot_item.get('axes')
+    if axes is None:
+        figure = plt.figure()
+        axes = figure.add_subplot(111)
+    axis_settings = plot_item.get('axis_settings',{})
+    lower = [None, None]
+    upper = [None, None]
+    for d, key in enumerate(('xlim','ylim')):
+        if axis_settings.get(key) is not None:
+            lower[d], upper[d] = axis_settings[key]
+    if None in lower + upper:
+        patches = [state.patch for state in gridded_data.states]
+        for d in range(2):
+            if lower[d] is None:
+                lower[d] = min(patch.lower_global[d] for patch in patches)
+                upper[d] = max(patch.upper_global[d] for patch in patches)
+    values, levels = griddle.resample.composite(gridded_data,
+                                                plot_item['composite'],
+                                                lower,upper,
+                                                plot_item['field'])
+    zmin, zmax = _color_limits(plot_item,[values])
+    image = axes.imshow(values.T,origin='lower',vmin=zmin,vmax=zmax,
+                        extent=(lower[0],upper[0],lower[1],upper[1]),
+                        interpolation='nearest',**plot_item.get('plot_args',{}))
+    axes.axis('image')
+    return [image]
+
+def _plot_preview(plot_item,frame_num,gridded_data):
+    r"""Plot a 2D frame as a single image, taken from the coarsest level of
+        its preview pyramid (see TimeSeries.preview) that has at least as
+        many pixels as the axes show, or from the finest level if
+        plot_item['full_resolution'] is set.
+    """
+    axes = plot_item.get('axes')
+    if axes is None:
+        figure = plt.figure()
+        axes = figure.add_subplot(111)
+    preview = plot_item['frames'].preview(frame_num,plot_item['field'],
+                                          frame=gridded_data)
+    lower, upper = preview['lower'], preview['upper']
+    levels = preview['levels']
+    if plot_item.get('full_resolution'):
+        level = 0
+    else:
+        window = axes.get_window_extent()
+        pixels = [window.width, window.height]
+        # Only part of the frame is visible if the axis limits are set
+        axis_settings = plot_item.get('axis_settings',{})
+        for d, key in enumerate(('xlim','ylim')):
+            if axis_settings.get(key) is not None:
+                visible = abs(axis_settings[key][1] - axis_settings[key][0])
+                pixels[d] *= (upper[d] - lower[d])/visible
+        level = griddle.resample.choose_level(preview['shapes'],pixels)
+    values = levels[level]
+    zmin, zmax = _color_limits(plot_item,[values])
+    image = axes.imshow(values.T,origin='lower',vmin=zmin,vmax=zmax,
+                        extent=(lower[0],upper[0],lower[1],upper[1]),
+                        interpolation='nearest',**plot_item.get('plot_args',{}))
+    axes.axis('image')
+    return [image]
+
+def _plot_gauge(plot_item,frame_num):
+    r"""Plot the time series of component plot_item['field'] of q at gauge
+        plot_item['gauge'], with a vertical line at the time of frame_num.
+        Gauge data is read from the fort.gauge file in plot_item['data_path'].
+    """
+    if plot_item.get('gauges') is None:
+        plot_item['gauges'] = griddle.fileio.gauges.read(plot_item['data_path'])
+    gauge = plot_item['gauges'][plot_item['gauge']]
+    axes = plot_item.get('axes')
+    if axes is None:
+        figure = plt.figure()
+        axes = figure.add_subplot(111)
+    t = plot_item['frames'].frame_time(frame_num)
+    line = axes.plot(gauge['t'],gauge['q'][plot_item['field']],
+                     **plot_item.get('plot_args',{}))[0]
+    marker = axes.axvline(t,color='k',linestyle=':')
+    return [line, marker]
+
 def write_plots(plot_spec,path='./_plots/',file_format='png'):
     r"""
     Write image files to disk.  Multiple figures are written to different
@@ -144,11 +263,10 @@ def write_plots(plot_spec,path='./_plots/',file_format='png'):
     if path[-1] != '/': path = path + '/'
     if not os.path.exists(path):
         os.mkdir(path)
-    # This assumes all items have the same number of frames:
     for plot_item in plot_spec:
         _set_up_time_series(plot_item)
-    for frame_num in plot_spec[0]['frames'].list_frames:
-        plot_objects = plot_frame(plot_spec,frame_num)
+    for frame_num, frames in _stream_frames(plot_spec):
+        plot_objects = plot_frame(plot_spec,frame_num,frames)
 
         figures = _get_figures(plot_objects)
         for figure in figures:
@@ -167,13 +285,42 @@ def _set_up_time_series(plot_item,refresh=True):
     r"""Take a plot_item and set the 'frames' key based on either
         'data' or 'data_path'.
     """
-    if refresh or not plot_item.get('frames'):
+    if refresh or plot_item.get('frames') is None:
+        options = plot_item.get('time_series_options',{})
         if plot_item.get('data'):
-            plot_item['frames'] = griddle.data.TimeSeries(plot_item['data'])
+            plot_item['frames'] = griddle.data.TimeSeries(plot_item['data'],
+                                                          **options)
         else:
             plot_item['frames'] = \
                 griddle.data.TimeSeries(plot_item['data_path'],
-                                        file_format=plot_item.get('data_format'))
+                                        file_format=plot_item.get('data_format'),
+                                        **options)
+
+
+def _stream_frames(plot_spec,prefetch=2):
+    r"""Yield pairs `(frame_num, frames)`, where frames holds the frame of
+        each plot_item, in order.  Frames are streamed with
+        TimeSeries.iter_frames, so they are not kept in memory once plotted.
+    """
+    streams = {}  # Items may share a TimeSeries
+    for plot_item in plot_spec:
+        _set_plot_item_defaults(plot_item)
+    # The windows are fixed before any frames are loaded in the background
+    _require_fields(plot_spec)
+    _apply_loading_windows(plot_spec)
+    for time_series, items in _items_by_series(plot_spec):
+        streams[id(time_series)] = time_series.iter_frames(prefetch=prefetch)
+    if not streams:
+        for frame_num in plot_spec[0]['frames'].list_frames:
+            yield frame_num, [None]*len(plot_spec)
+        return
+    # This assumes all items have the same frames:
+    for loaded in zip(*streams.values()):
+        frame_num = loaded[0][0]
+        frames = dict(zip(streams, (frame for n, frame in loaded)))
+        yield frame_num, [None if plot_item['plot_type'] == 'gauge'
+                          else frames[id(plot_item['frames'])]
+                          for plot_item in plot_spec]
 
 
 def _get_figure_items(plot_spec,figure):
@@ -210,17 +357,21 @@ def animate(plot_spec):
         _set_plot_item_defaults(plot_item)
         assert _valid_plot_item(plot_item)
 
-    plot_objects = plot_frame(plot_spec)
+    frame_numbers = plot_spec[0]['frames'].list_frames
+    plot_objects = plot_frame(plot_spec,frame_numbers[0])
     if plot_spec[0]['plot_type'] == 'yt_slice':
         fig = plot_objects[0][0].plots['Density'].figure
     else:
         fig = plot_objects[0][0].figure
 
-    def fplot(frame_number):
-        plot_objects = plot_frame(plot_spec,frame_number)
+    def fplot(loaded):
+        frame_number, frames = loaded
+        plot_objects = plot_frame(plot_spec,frame_number,frames)
         return plot_objects[0]
 
-    anim = animation.FuncAnimation(fig, fplot, frames=len(plot_spec[0]['frames'].list_frames))
+    anim = animation.FuncAnimation(fig, fplot,
+                                   frames=lambda: _stream_frames(plot_spec),
+                                   save_count=len(frame_numbers))
     plt.close()
     return HTML(anim.to_jshtml())
 
@@ -253,7 +404,7 @@ def _get_field_values_on_all_patches(state,field):
     r"""This is just a wrapper around _get_field_values.  It iterates
         over multiple fields if field is a list.
     """
-    if hasattr(field, '__getitem__'):
+    if hasattr(field, '__getitem__') and not isinstance(field, str):
         return [_get_field_values(state,f) for f in field]
     else:
         return _get_field_values(state,field)
@@ -262,18 +413,109 @@ def _get_field_values(state,field):
     r"""
     Inputs:
         state : a pyclaw.State object
-        field : either an integer or a function.
+        field : either an integer or a function (including expressions).
                 If an integer, then return state.q[field,...].
                 If a function, then return field(state).
+                Strings are converted to griddle.expressions.Expression.
     """
+    field = griddle.expressions.as_field(field)
     if type(field) is int:
         q = state.q[field,...]
     elif hasattr(field, '__call__'):
-        q = field(state)
+        # Derived fields are computed once per state, even if several
+        # items plot them
+        q = griddle.data.derived_fields.get(state,field)
     else:
         raise Exception('Unrecognized field argument in plot_item: ', field)
     return q
 
+def _required_fields(plot_item):
+    r"""Return the indices of the components of q used by plot_item, or None
+        if it may use any of them (e.g. if its field is a function).
+    """
+    field = griddle.expressions.as_field(plot_item.get('field'))
+    fields = field if isinstance(field,(list,tuple)) else [field]
+    required = set()
+    for f in fields:
+        if type(f) is int:
+            required.add(f)
+        elif isinstance(f,griddle.expressions.Expression) and f.fields is not None:
+            required.update(f.fields)
+        else:
+            return None
+    return sorted(required)
+
+def _items_by_series(plot_spec):
+    r"""Group the items of plot_spec that plot frame data by the TimeSeries
+        they use, as a list of (time_series, items) pairs in order.
+    """
+    groups = {}
+    for plot_item in plot_spec:
+        if plot_item['plot_type'] == 'gauge':
+            continue  # Gauge plots do not use frame data
+        time_series = plot_item['frames']
+        groups.setdefault(id(time_series),(time_series,[]))[1].append(plot_item)
+    return list(groups.values())
+
+def _require_fields(plot_spec):
+    r"""Load only the components of q used by the items of plot_spec.  Items
+        sharing a TimeSeries load the union of their components.
+    """
+    for time_series, items in _items_by_series(plot_spec):
+        required = set()
+        for plot_item in items:
+            fields = _required_fields(plot_item)
+            if fields is None:
+                required = None
+                break
+            required.update(fields)
+        time_series.require_fields(None if required is None else sorted(required))
+
+def _loading_window(plot_item):
+    r"""Return the bounding box and maximum AMR level of the patches that
+        are visible in plot_item, for use with TimeSeries.set_window.
+    """
+    axis_settings = plot_item.get('axis_settings',{})
+    limits = [axis_settings.get('xlim')]
+    if plot_item['plot_type'] == 'pcolor':
+        # For 1D plots, ylim refers to the data values rather than to space
+        limits.append(axis_settings.get('ylim'))
+    while limits and limits[-1] is None:
+        limits.pop()
+    bbox = limits if limits else None
+    return bbox, plot_item.get('max_level')
+
+def _apply_loading_windows(plot_spec):
+    r"""Restrict loading of each TimeSeries of plot_spec to the patches
+        visible in any of its items, within the window set by the user (see
+        TimeSeries.narrow_window).  yt plots need all patches, and frames
+        held in memory are not windowed.
+    """
+    for time_series, items in _items_by_series(plot_spec):
+        if not time_series.from_file:
+            continue
+        windows = [(None, None) if 'yt' in plot_item['plot_type']
+                   else _loading_window(plot_item) for plot_item in items]
+        time_series.narrow_window(*_combine_windows(windows))
+
+def _combine_windows(windows):
+    r"""Return the smallest window `(bbox, max_level)` containing all of
+        `windows`.
+    """
+    levels = [max_level for bbox, max_level in windows]
+    max_level = None if None in levels else max(levels)
+    boxes = [bbox for bbox, max_level in windows]
+    if None in boxes:
+        return None, max_level
+    bbox = []
+    for d in range(max(len(box) for box in boxes)):
+        limits = [box[d] if d < len(box) else None for box in boxes]
+        if None in limits:
+            bbox.append(None)
+        else:
+            bbox.append((min(min(l) for l in limits), max(max(l) for l in limits)))
+    return bbox, max_level
+
 def _get_figures(plot_object_list_list):
     """
     Given a list of lists of `plot_objects`, return a list of figures containing them
@@ -303,6 +545,9 @@ def _valid_plot_item(plot_item):
         raise Exception('A field must be specified for each plot_item.')
     if 'plot_type' not in plot_item:
         raise Exception('A plot_type must be specified for each plot_item.')
+    if plot_item['plot_type'] == 'gauge':
+        if 'gauge' not in plot_item or 'data_path' not in plot_item:
+            raise Exception('Gauge plots require a "gauge" number and a "data_path".')
     return True
 
 def _set_plot_item_defaults(plot_item):
@@ -337,11 +582,17 @@ def _clear_item_axes(plot_item):
         #        del plot_object
 
 
-def _set_axis_title(plot_item,frame_num):
+def _set_axis_title(plot_item,frame_num,gridded_data=None):
+    if gridded_data is None:
+        t = plot_item['frames'].frame_time(frame_num)
+    else:
+        t = gridded_data.t
     if 'name' in plot_item:
-        title = '%s at t = %s' % (str(plot_item['name']),plot_item['frames'][frame_num].t)
+        title = '%s at t = %s' % (str(plot_item['name']),t)
+    elif plot_item['plot_type'] == 'gauge':
+        title = 'Gauge %s at t = %s' % (str(plot_item['gauge']),t)
     else:
-        title = 'Field %s at t = %s' % (str(plot_item['field']),plot_item['frames'][frame_num].t)
+        title = 'Field %s at t = %s' % (str(plot_item['field']),t)
     plot_item['axes'].set_title(title)
 
 def _solution_to_yt_ds(sol):
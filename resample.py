@@ -0,0 +1,172 @@
+r"""
+griddle.resample: flattening multi-patch (AMR) frames onto uniform grids.
+
+A composite of a frame is an array of values on a uniform grid of pixels,
+in which each pixel takes the value of the finest cell containing its
+center.  Patches are painted coarsest first, so finer levels overwrite
+coarser ones, and each patch is painted with a single indexing operation:
+
+    >>> import griddle
+    >>> ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/')
+    >>> values, levels = griddle.resample.composite(ts[5], (200, 100))
+    >>> values.shape
+    (200, 100)
+    >>> sorted(set(levels.ravel().tolist()))
+    [2, 3]
+
+For quick previews, a composite can be reduced to a pyramid of coarser
+arrays by averaging blocks of 2, 4, 8, ... pixels:
+
+    >>> [level.shape for level in griddle.resample.pyramid(values, 3)]
+    [(200, 100), (100, 50), (50, 25), (25, 13)]
+    >>> griddle.resample.choose_level(griddle.resample.pyramid(values, 3), (80, 40))
+    1
+
+A `Pyramid` knows the shapes of its levels before it composites anything;
+when a level is first used, the frame is composited once at the resolution
+of its finest cells and the coarser levels are block averages of that:
+
+    >>> preview = griddle.resample.Pyramid(ts[5], [-1., -1.], [1., 1.])
+    >>> preview.shapes
+    [(200, 200), (100, 100), (50, 50), (25, 25)]
+    >>> preview[griddle.resample.choose_level(preview.shapes, (80, 40))].shape
+    (100, 100)
+"""
+import numpy as np
+from . import expressions
+from . import geometry
+
+
+def composite(solution, shape, lower=None, upper=None, field=0):
+    r"""Resample a frame onto a uniform grid of `shape` pixels covering the
+        box from `lower` to `upper` (by default, the extent of all patches).
+
+        `field` is the index of a component of q, a function that takes a
+        State and returns the values to plot, or an expression (as for plot
+        items; see griddle.expressions).
+
+        Returns the array of composite values, of shape `shape`, and an
+        array of the same shape holding the AMR level each pixel was taken
+        from.  Pixels outside all patches have value NaN and level 0.
+        Mapped grids are not supported.
+    """
+    states = solution.states
+    if not geometry.is_identity_map(states[0].grid.mapc2p):
+        raise Exception('Composites of mapped grids are not supported.')
+    patches = [state.patch for state in states]
+    index = geometry.PatchIndex(patches)
+    if lower is None:
+        lower = index.lower.min(axis=0)
+    if upper is None:
+        upper = index.upper.max(axis=0)
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    shape = tuple(int(n) for n in shape)
+    pixel_size = (upper - lower)/np.array(shape)
+
+    values = np.full(shape, np.nan)
+    levels = np.zeros(shape, dtype=int)
+    for j in index.query_box(lower, upper):
+        patch = patches[j]
+        # The pixels whose centers lie in the patch, and the cells they lie in
+        pixels = []
+        cells = []
+        for d in range(len(shape)):
+            first = (patch.lower_global[d] - lower[d])/pixel_size[d] - 0.5
+            last = (patch.upper_global[d] - lower[d])/pixel_size[d] - 0.5
+            p = np.arange(max(int(np.ceil(first)), 0),
+                          min(int(np.ceil(last)), shape[d]))
+            centers = lower[d] + (p + 0.5)*pixel_size[d]
+            c = np.floor((centers - patch.lower_global[d])/patch.delta[d]).astype(int)
+            pixels.append(p)
+            cells.append(np.clip(c, 0, patch.num_cells_global[d] - 1))
+        if any(len(p) == 0 for p in pixels):
+            continue
+        pixel_index = np.ix_(*pixels)
+        values[pixel_index] = _field_values(states[j], field)[np.ix_(*cells)]
+        levels[pixel_index] = index.levels[j]
+    return values, levels
+
+
+def full_resolution_shape(solution, lower, upper):
+    r"""Return the shape of a composite of the box from `lower` to `upper`
+        whose pixels are the size of the finest cells of `solution`.
+    """
+    delta = np.min([state.patch.delta for state in solution.states], axis=0)
+    extent = np.asarray(upper, dtype=float) - np.asarray(lower, dtype=float)
+    return tuple(int(n) for n in np.maximum(np.round(extent/delta), 1))
+
+
+def block_average(values, factor=2):
+    r"""Average `values` over blocks of `factor` pixels in each direction,
+        ignoring NaNs.  The last block is partial if the shape is not a
+        multiple of `factor`.
+    """
+    pad = [(0, -n % factor) for n in values.shape]
+    values = np.pad(values, pad, mode='constant', constant_values=np.nan)
+    shape = sum(((n//factor, factor) for n in values.shape), ())
+    blocks = values.reshape(shape)
+    axes = tuple(range(1, 2*values.ndim, 2))
+    valid = ~np.isnan(blocks)
+    count = valid.sum(axis=axes)
+    total = np.where(valid, blocks, 0.).sum(axis=axes)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total/np.maximum(count, 1), np.nan)
+
+
+def pyramid(values, num_levels=3):
+    r"""Return the list of `values` and its block averages over 2, 4, ...,
+        2**num_levels pixels.
+    """
+    levels = [values]
+    for i in range(num_levels):
+        levels.append(block_average(levels[-1], 2))
+    return levels
+
+
+class Pyramid(object):
+    r"""A preview pyramid of a field of a frame over the box from `lower` to
+        `upper`: level 0 is the composite at the resolution of the finest
+        cells (see `full_resolution_shape`), and level k its average over
+        blocks of 2**k pixels in each direction, for k up to `num_levels`
+        (see `pyramid`).  Nothing is composited until a level is first
+        indexed; all levels are then kept.
+    """
+    def __init__(self, solution, lower, upper, field=0, num_levels=3):
+        self.solution = solution
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        self.field = field
+        full_shape = full_resolution_shape(solution, self.lower, self.upper)
+        self.shapes = [tuple(-(-n//2**k) for n in full_shape)
+                       for k in range(num_levels + 1)]
+        self._levels = None
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def __getitem__(self, level):
+        if self._levels is None:
+            values = composite(self.solution, self.shapes[0], self.lower,
+                               self.upper, self.field)[0]
+            self._levels = pyramid(values, len(self.shapes) - 1)
+        return self._levels[level]
+
+
+def choose_level(levels, pixels):
+    r"""Return the index of the coarsest array of a pyramid that has at
+        least as many values as `pixels` in each direction (or 0 if there
+        is none).  `levels` may also be the shapes of the arrays.
+    """
+    for i in range(len(levels) - 1, 0, -1):
+        shape = getattr(levels[i], 'shape', levels[i])
+        if all(n >= p for n, p in zip(shape, pixels)):
+            return i
+    return 0
+
+
+def _field_values(state, field):
+    field = expressions.as_field(field)
+    if hasattr(field, '__call__'):
+        return np.asarray(field(state))
+    return state.q[field, ...]
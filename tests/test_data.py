@@ -1,6 +1,518 @@
 import griddle
+import numpy as np
 from clawpack import pyclaw
 
 def test_time_series():
     ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/')
     assert type(ts['1']) == pyclaw.Solution
+
+def test_time_series_cache_limits():
+    ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/',
+                                 max_frames=2)
+    ts.pin(0)
+    for frame_num in [1, 2, 2]:
+        ts[frame_num]
+    assert sorted(ts.keys(), key=int) == ['0', '2']
+    assert ts.evictions == 1
+    assert ts.hits == 1
+    nbytes = ts.nbytes
+    assert nbytes == sum(griddle.data._frame_nbytes(ts[k]) for k in ts.keys())
+
+    ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/',
+                                 max_bytes=1)
+    ts[1]
+    ts[2]
+    assert list(ts.keys()) == ['2']
+    assert ts.cache_info()['evictions'] == 1
+
+    # Frames stored directly go through the same cache
+    frame = ts[3]
+    ts[4] = frame
+    ts.update({5: frame})
+    ts.setdefault(6, frame)
+    assert list(ts.keys()) == ['6']
+    assert ts.nbytes == griddle.data._frame_nbytes(frame)
+
+def test_time_series_prefetch():
+    import time
+    ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/',
+                                 prefetch=2, max_frames=1)
+    loaded = []
+    get_frame = ts._get_frame
+    ts._get_frame = lambda frame_num: loaded.append(frame_num) or get_frame(frame_num)
+    def wait_for(frames):
+        for i in range(500):
+            if set(frames) <= set(loaded):
+                return
+            time.sleep(0.01)
+    with ts:
+        frame = ts[5]
+        wait_for([6, 7])
+        # Finished background loads do not evict the frame in use
+        assert sorted(loaded) == [5, 6, 7]
+        assert list(ts.keys()) == ['5'] and ts[5] is frame
+        ts[6]
+        assert ts.prefetched == 1
+        assert loaded.count(6) == 1
+        # Stepping backwards reverses the direction of the read-ahead
+        ts[5]
+        wait_for([3, 4])
+        assert 4 in loaded and 3 in loaded
+        # A jump cancels loads outside the new window
+        ts[15]
+        assert ts.cache_info()['pending'] == ['16', '17']
+    assert ts.cache_info()['pending'] == []
+    assert ts._executor is None
+
+def test_ascii_reader_matches_pyclaw():
+    import numpy as np
+    from griddle.fileio import ascii
+    path = './test_data/_amrclaw_2d_acoustics/'
+    sol = ascii.read(5, path=path)
+    ref = pyclaw.Solution(5, path=path, file_format='ascii')
+    assert sol.t == ref.t
+    assert len(sol.states) == len(ref.states)
+    for state, ref_state in zip(sol.states, ref.states):
+        assert state.patch.level == ref_state.patch.level
+        assert state.patch.patch_index == ref_state.patch.patch_index
+        assert state.patch.lower_global == ref_state.patch.lower_global
+        assert state.patch.num_cells_global == ref_state.patch.num_cells_global
+        assert np.array_equal(state.q, ref_state.q)
+
+def test_frame_index(tmp_path):
+    import os, shutil
+    import numpy as np
+    from griddle.fileio import ascii
+    for name in ['fort.q0005', 'fort.t0005']:
+        shutil.copy(os.path.join('./test_data/_amrclaw_2d_acoustics/', name),
+                    str(tmp_path))
+    ts = griddle.data.TimeSeries(str(tmp_path), persist_index=True)
+    index = ts.frame_index(5)
+    assert len(index['patches']) == 20
+    assert os.path.exists(os.path.join(str(tmp_path), '_griddle',
+                                       'fort.q0005.index.npz'))
+    sol = ts[5]
+    for i, state in enumerate(sol.states):
+        assert index['patches'][i]['level'] == state.patch.level
+        assert np.array_equal(ascii.read_patch(index, i), state.q)
+    stored = ascii.read_index(5, path=str(tmp_path), persist=True)
+    assert np.array_equal(stored['patches'], index['patches'])
+    assert stored['t'] == index['t']
+
+def test_sidecars(tmp_path):
+    import os, shutil
+    import numpy as np
+    from griddle.fileio import sidecar
+    for name in ['fort.q0005', 'fort.t0005']:
+        shutil.copy(os.path.join('./test_data/_amrclaw_2d_acoustics/', name),
+                    str(tmp_path))
+    ref = griddle.data.TimeSeries(str(tmp_path))[5]
+    ts = griddle.data.TimeSeries(str(tmp_path), sidecars=True)
+    ts[5]
+    meta_fname, q_fname, aux_fname = sidecar.file_names(5, str(tmp_path))
+    assert os.path.exists(meta_fname) and os.path.exists(q_fname)
+    ts.clear()
+    sol = ts[5]
+    assert isinstance(sol.states[0].q, np.memmap)
+    for state, ref_state in zip(sol.states, ref.states):
+        assert state.patch.level == ref_state.patch.level
+        assert np.array_equal(state.q, ref_state.q)
+    assert np.array_equal(sidecar.read_field(5, str(tmp_path), 2, 1),
+                          ref.states[2].q[1])
+    # Touching the source invalidates the sidecar
+    with open(os.path.join(str(tmp_path), 'fort.t0005'), 'a') as f:
+        f.write('\n')
+    sources = griddle.fileio.ascii.source_files(5, str(tmp_path))
+    assert sidecar.read(5, str(tmp_path), sources) is None
+
+def test_field_selective_loading():
+    import numpy as np
+    path = './test_data/_pyclaw_3d_shocktube/'
+    full = griddle.data.TimeSeries(path)[3]
+    ts = griddle.data.TimeSeries(path, fields=[0])
+    sol = ts[3]
+    assert np.array_equal(sol.q[0], full.q[0])
+    assert np.isnan(sol.q[1]).all()
+    # Requesting another field drops frames that lack it
+    ts.require_fields([0, 4])
+    assert len(ts) == 0
+    assert np.array_equal(ts[3].q[4], full.q[4])
+
+    path = './test_data/_amrclaw_2d_acoustics/'
+    full = griddle.data.TimeSeries(path)[5]
+    sol = griddle.data.TimeSeries(path, fields=[2])[5]
+    for state, ref_state in zip(sol.states, full.states):
+        assert np.array_equal(state.q[2], ref_state.q[2])
+        assert np.isnan(state.q[0]).all()
+
+def test_loading_window(tmp_path):
+    import os, pickle, shutil
+    import pytest
+    import numpy as np
+    path = './test_data/_amrclaw_2d_acoustics/'
+    full = griddle.data.TimeSeries(path)[5]
+    ts = griddle.data.TimeSeries(path, max_level=1)
+    assert [s.patch.level for s in ts[5].states] == [1]
+
+    bbox = [(0.9, 1.0), (-1.0, 1.0)]
+    def inside(patch):
+        return patch.upper_global[0] > 0.9
+    expected = [s for s in full.states if inside(s.patch)]
+    ts.set_window(bbox)
+    assert len(ts) == 0
+    sol = ts[5]
+    assert len(sol.states) == len(expected) < len(full.states)
+    for state, ref_state in zip(sol.states, expected):
+        assert state.patch.patch_index == ref_state.patch.patch_index
+        assert np.array_equal(state.q, ref_state.q)
+
+    for name in ['fort.q0005', 'fort.t0005']:
+        shutil.copy(os.path.join(path, name), str(tmp_path))
+    for i in range(2):  # Write, then read the sidecar
+        sol = griddle.data.TimeSeries(str(tmp_path), sidecars=True,
+                                      bbox=bbox)[5]
+        assert len(sol.states) == len(expected)
+
+    sol = griddle.data.TimeSeries('./test_data/_pyclaw_3d_shocktube/',
+                                  bbox=[(0., 0.5)])[3]
+    assert len(sol.states) == 1
+
+    # An empty window is an error, not a missing frame
+    ts.set_window([(2., 3.)])
+    with pytest.raises(IOError):
+        ts[5]
+    assert ts[99] is None
+    with pytest.raises(Exception):
+        griddle.data.TimeSeries([full]).set_window(bbox)
+
+    # The bounding box is physical, so it does not cull mapped patches
+    with open(os.path.join(str(tmp_path), 'fort.pkl0005'), 'wb') as f:
+        pickle.dump({'mapc2p': _shifted_map}, f)
+    for sidecars in [False, True]:
+        sol = griddle.data.TimeSeries(str(tmp_path), sidecars=sidecars,
+                                      bbox=bbox)[5]
+        assert len(sol.states) == len(full.states)
+
+def _shifted_map(xc, yc):
+    return xc + 1., yc
+
+def test_frame_discovery_and_time_lookup(tmp_path):
+    import os, shutil
+    import pytest
+    path = './test_data/_amrclaw_2d_acoustics/'
+    for frame_num in [3, 5, 10]:
+        for kind in 'qt':
+            shutil.copy(os.path.join(path, 'fort.%s%04d' % (kind, frame_num)),
+                        str(tmp_path))
+    ts = griddle.data.TimeSeries(str(tmp_path), prefetch=1)
+    assert ts.list_frames == [3, 5, 10]
+    assert list(ts.times) == [0.15, 0.25, 0.5]
+    assert len(ts) == 0  # No frames were loaded to get the times
+    assert ts.at_time(0.21) == 5
+    assert ts.at_time(10.) == 10
+    assert ts.between(0.2, 0.5) == [5, 10]
+    assert ts.between(0.6, 0.7) == []
+    ts[5]
+    assert ts.cache_info()['pending'] == ['10']
+
+    # HDF5 frames are read from the discovered files, whatever their prefix
+    path = './test_data/_pyclaw_3d_shocktube/'
+    hdf_path = tmp_path / 'hdf'
+    hdf_path.mkdir()
+    shutil.copy(os.path.join(path, 'claw0003.hdf'),
+                str(hdf_path / 'foo0003.hdf'))
+    ts = griddle.data.TimeSeries(str(hdf_path), file_format='hdf5')
+    assert ts.list_frames == [3]
+    assert ts.at_time(0.) == 3
+    assert ts[3].t == griddle.data.TimeSeries(path)[3].t
+
+    ts = griddle.data.TimeSeries([])
+    with pytest.raises(ValueError):
+        ts.at_time(0.)
+    with pytest.raises(ValueError):
+        ts.between(0., 1.)
+    with pytest.raises(Exception):
+        ts.frame_file(0)
+
+def test_follow(tmp_path):
+    import os, shutil
+    path = './test_data/_amrclaw_2d_acoustics/'
+    def copy(name, size=None):
+        with open(os.path.join(path, name), 'rb') as f:
+            data = f.read()
+        with open(os.path.join(str(tmp_path), name), 'wb') as f:
+            f.write(data[:size])
+    for name in ['fort.q0000', 'fort.t0000']:
+        copy(name)
+    ts = griddle.data.TimeSeries(str(tmp_path))
+    assert ts.list_frames == [0]
+
+    # A partially written frame is not reported
+    copy('fort.t0001')
+    copy('fort.q0001', size=1000)
+    assert list(ts.follow(interval=0.01, timeout=0.05)) == []
+    copy('fort.q0001')
+    new_frames = []
+    ts.watch(new_frames.append, interval=0.01, timeout=0.05)
+    assert new_frames == [1]
+    assert ts.list_frames == [0, 1]
+    assert ts[1].t == 0.05
+
+def test_load_all():
+    path = './test_data/_amrclaw_2d_acoustics/'
+    ts = griddle.data.TimeSeries(path)
+    stats = ts.load_all(frames=[0, 1, 2], workers=2)
+    assert stats['frames'] == 3
+    assert stats['mb_per_second'] > 0
+    assert sorted(ts.keys()) == ['0', '1', '2']
+    expected = griddle.data.TimeSeries(path)[2]
+    for state, expected_state in zip(ts[2].states, expected.states):
+        assert (state.q == expected_state.q).all()
+        assert state.patch.level == expected_state.patch.level
+    # The values arrive in memory-mapped temporary files
+    assert isinstance(ts[2].states[0].q, np.memmap)
+    assert ts.load_all(frames=[1, 2])['frames'] == 0
+
+    # Bytes are counted for frames evicted during loading
+    ts = griddle.data.TimeSeries(path, max_frames=1)
+    stats = ts.load_all(frames=[0, 1], workers=1)
+    frames = griddle.data.TimeSeries(path)
+    assert stats['bytes'] == sum(griddle.data._frame_nbytes(frames[n])
+                                 for n in [0, 1])
+
+def test_iter_frames_memory_bound():
+    ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/')
+    loaded = []
+    get_frame = ts._get_frame
+    ts._get_frame = lambda frame_num: loaded.append(frame_num) or get_frame(frame_num)
+    for frame_num, frame in ts.iter_frames(0, 10, prefetch=3):
+        # The frames in memory are this one and the two that follow it
+        assert len(loaded) <= frame_num + 3
+        assert frame.t == ts.frame_time(frame_num)
+    assert loaded == list(range(10))
+    assert len(ts) == 0
+
+def test_archive(tmp_path):
+    path = './test_data/_amrclaw_2d_acoustics/'
+    fname = str(tmp_path / 'acoustics.griddle.h5')
+    griddle.fileio.archive.write(griddle.data.TimeSeries(path), fname,
+                                 start=2, stop=8, stride=2)
+    assert griddle.data._get_data_format(str(tmp_path)) == 'archive'
+    for source in (str(tmp_path), fname):
+        ts = griddle.data.TimeSeries(source)
+        assert ts.list_frames == [2, 4, 6]
+        assert ts.frame_time(4) == 0.2
+    expected = griddle.data.TimeSeries(path)[6]
+    for state, expected_state in zip(ts[6].states, expected.states):
+        assert (state.q == expected_state.q).all()
+        assert state.patch.lower_global == expected_state.patch.lower_global
+
+    # The problem data and mapping are archived, and bbox does not cull
+    # mapped patches
+    for state in expected.states:
+        state.problem_data = {'rho': 2.}
+        state.grid.mapc2p = _shifted_map
+    griddle.fileio.archive.append(fname, 6, expected)
+    sol = griddle.fileio.archive.read(6, fname, bbox=[(0.9, 1.)])
+    assert len(sol.states) == len(expected.states)
+    assert sol.states[0].problem_data == {'rho': 2.}
+    assert sol.states[0].grid.mapc2p is _shifted_map
+
+def test_reductions_cache(tmp_path):
+    import os, shutil
+    path = './test_data/_amrclaw_2d_acoustics/'
+    for frame_num in range(3):
+        for kind in 'qt':
+            shutil.copy(path + 'fort.%s000%s' % (kind, frame_num), str(tmp_path))
+    ts = griddle.data.TimeSeries(str(tmp_path))
+    reductions = ts.reductions(workers=2)
+    assert reductions['max'].shape == (3, 3)
+    frame = griddle.data.TimeSeries(path)[2]
+    assert reductions['max'][2, 0] == max(state.q[0].max() for state in frame.states)
+    assert os.path.exists(ts._reductions_file(2))
+
+    # A second series reads the reductions from the cache
+    cached = griddle.data.TimeSeries(str(tmp_path))
+    cached._get_frame = None
+    assert (cached.reductions(workers=1)['mean'] == reductions['mean']).all()
+
+    # Rewriting fort.t invalidates the cached reductions
+    with open(os.path.join(str(tmp_path), 'fort.t0002'), 'a') as f:
+        f.write('\n')
+    assert griddle.fileio.cache.load(ts._reductions_file(2),
+                                     ts._source_files(2)) is None
+
+    # Cells are weighted by their physical volume on mapped grids
+    unmapped = griddle.data.TimeSeries([frame]).reductions()
+    for state in frame.states:
+        state.grid.mapc2p = _stretched_map
+    mapped = griddle.data.TimeSeries([frame]).reductions()
+    assert np.allclose(mapped['integral'], 2*unmapped['integral'])
+    assert np.allclose(mapped['mean'], unmapped['mean'])
+
+def _stretched_map(xc, yc):
+    return 2*xc, yc
+
+def test_gauge_cache(tmp_path):
+    import shutil
+    shutil.copy('./test_data/_amrclaw_2d_acoustics/fort.gauge', str(tmp_path))
+    gauges = griddle.fileio.gauges.read(str(tmp_path))
+    cached = griddle.fileio.gauges.read(str(tmp_path))
+    assert (tmp_path / '_griddle' / 'fort.gauge.npz').exists()
+    for gauge_id in gauges:
+        assert (cached[gauge_id]['q'] == gauges[gauge_id]['q']).all()
+        assert (cached[gauge_id]['t'][1:] >= cached[gauge_id]['t'][:-1]).all()
+
+    # Header lines are skipped
+    fname = str(tmp_path / 'fort.gauge')
+    with open(fname) as f:
+        lines = f.readlines()
+    with open(fname, 'w') as f:
+        f.writelines(['# gauge_id= 1 level= 3\n', '# Columns: level t q\n'] + lines)
+    with_header = griddle.fileio.gauges.read(str(tmp_path), persist=False)
+    assert (with_header[1]['q'] == gauges[1]['q']).all()
+
+def test_probe():
+    ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/')
+    frame = ts[5]
+    finest = max(frame.states, key=lambda state: state.patch.level)
+    patch = finest.patch
+    # At a cell center of the finest patch, the value is that of the cell
+    x = patch.lower_global[0] + 2.5*patch.delta[0]
+    y = patch.lower_global[1] + 3.5*patch.delta[1]
+    values = ts.probe([[x, y], [5., 5.]], start=5, stop=6)
+    assert values.shape == (1, 2, 3)
+    assert np.allclose(values[0, 0], finest.q[:, 2, 3])
+    assert np.isnan(values[0, 1]).all()
+
+    points, line = ts.line_out([-1., 0.], [1., 0.], num_points=11, fields=[0], stop=2)
+    assert points.shape == (11, 2)
+    assert line.shape == (2, 11, 1)
+    assert not np.isnan(line).any()
+
+    # Probes ignore the loading restrictions of the series
+    restricted = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/',
+                                         max_level=1, fields=[0])
+    restricted[5]
+    values = restricted.probe([[x, y]], fields=[1], start=5, stop=6)
+    assert np.allclose(values[0, 0], finest.q[1, 2, 3])
+
+    # On mapped grids, points are physical coordinates
+    for state in frame.states:
+        state.grid.mapc2p = _shifted_map
+    values = griddle.data.TimeSeries([frame]).probe([[x + 1., y], [-0.5, 0.]])
+    assert np.allclose(values[0, 0], finest.q[:, 2, 3])
+    assert np.isnan(values[0, 1]).all()
+
+def test_preview_cache():
+    ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/', max_frames=1)
+    preview = ts.preview(5)
+    assert [level.shape for level in preview['levels']] == \
+        [(200, 200), (100, 100), (50, 50), (25, 25)]
+    assert ts.preview(5) is preview
+    # Previews are dropped with their frame
+    ts[6]
+    assert ts.preview(5) is not preview
+
+def test_derived_fields_invalidated_on_eviction():
+    calls = []
+    def energy(state):
+        calls.append(state)
+        return state.q[0]**2
+    ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/', max_frames=1)
+    cache = griddle.data.derived_fields
+    states = ts[1].states
+    for i in range(2):
+        for state in states:
+            cache.get(state, energy)
+    assert len(calls) == len(states)
+    ts[2]  # Evicts frame 1
+    assert not any(state in cache._values for state in states)
+
+    # Removing a frame that is not cached keeps the other derived fields
+    for state in ts[2].states:
+        cache.get(state, energy)
+    ts.pop(7, None)
+    try:
+        del ts[7]
+    except KeyError:
+        pass
+    assert all(state in cache._values for state in ts[2].states)
+
+def test_expressions_match_functions():
+    from griddle.expressions import Expression
+    frame = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/')[5]
+    expression = Expression('p*x + dy*exp(-t) + sqrt(q[1]**2 + q[2]**2)',
+                            names={'p': 0})
+    def function(state):
+        x, y = state.grid.p_centers
+        return state.q[0]*x + state.patch.delta[1]*np.exp(-state.t) + \
+            np.sqrt(state.q[1]**2 + state.q[2]**2)
+    for state, values in zip(frame.states, expression.evaluate(frame)):
+        assert np.allclose(values, function(state))
+        assert np.allclose(expression(state), values)
+    assert expression.fields == [0, 1, 2]
+    assert Expression('q[0] + q[:, 0].sum()').fields is None
+
+    # Expressions with different names are cached separately
+    cache = griddle.data.derived_fields
+    state = frame.states[0]
+    u = Expression('w', names={'w': 1})
+    v = Expression('w', names={'w': 2})
+    assert np.array_equal(cache.get(state, u), state.q[1])
+    assert np.array_equal(cache.get(state, v), state.q[2])
+
+def test_frame_index_layout_check(tmp_path):
+    from griddle.fileio import ascii
+    # One cell per line, but with lines of different lengths, so that the
+    # position computed from the first line falls before a data line that
+    # has the shape of a header line
+    lines = ['1 grid_number', '1 AMR_level', '8 mx', '0.0 xlow', '0.125 dx', '']
+    lines += ['1 -2'] + ['100 -200']*7 + ['']
+    with open(str(tmp_path / 'fort.q0000'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    with open(str(tmp_path / 'fort.t0000'), 'w') as f:
+        f.write('0.0 time\n2 meqn\n1 ngrids\n0 naux\n1 ndim\n')
+    index = ascii.read_index(0, path=str(tmp_path))
+    assert ascii.read_patch(index, 0).ravel(order='F').tolist() == \
+        [1., -2.] + [100., -200.]*7
+
+    frames = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/')
+    listed = griddle.data.TimeSeries([frames[5]])
+    assert (listed.frame_index(0)['patches']['level'] ==
+            frames.frame_index(5)['patches']['level']).all()
+
+def test_sidecar_metadata_and_aux(tmp_path):
+    import os, pickle, shutil
+    import pytest
+    from griddle.fileio import ascii, sidecar
+    path = str(tmp_path)
+    shutil.copy('./test_data/_amrclaw_2d_acoustics/fort.q0005', path)
+    # Use a copy of q as aux data
+    shutil.copy('./test_data/_amrclaw_2d_acoustics/fort.q0005',
+                os.path.join(path, 'fort.a0005'))
+    with open('./test_data/_amrclaw_2d_acoustics/fort.t0005') as f:
+        lines = f.readlines()
+    lines[3] = '    3                 naux\n'
+    with open(os.path.join(path, 'fort.t0005'), 'w') as f:
+        f.writelines(lines)
+    mapc2p = griddle.geometry.identity_map_2d
+    with open(os.path.join(path, 'fort.pkl0005'), 'wb') as f:
+        pickle.dump({'problem_data': {'rho': 2.}, 'mapc2p': mapc2p}, f)
+
+    # Aux values that were not read are not stored in the sidecar
+    sol = ascii.read(5, path=path, sidecar=True, read_aux=False)
+    assert np.isnan(sol.states[0].aux).all()
+    sol = ascii.read(5, path=path, sidecar=True)
+    assert (sol.states[3].aux == sol.states[3].q).all()
+    sol = ascii.read(5, path=path, sidecar=True)
+    assert isinstance(sol.states[3].aux, np.memmap)
+    assert (sol.states[3].aux == sol.states[3].q).all()
+    assert sol.states[0].problem_data == {'rho': 2.}
+    assert sol.states[0].grid.mapc2p is mapc2p
+
+    # Stale sidecars are not used to read single fields
+    with open(os.path.join(path, 'fort.q0005'), 'a') as f:
+        f.write('\n')
+    with pytest.raises(IOError):
+        sidecar.read_field(5, path, 3, 0)
@@ -28,4 +28,211 @@ class test_patch_properties(unittest.TestCase):
         g = griddle.geometry.Patch(x)
         with self.assertRaises(Exception):
             g.add_dimension(x)
+
+class test_spatial_index(unittest.TestCase):
+    def test_matches_brute_force(self):
+        import numpy as np
+        rng = np.random.RandomState(0)
+        patches = []
+        for level in (1, 2, 3):
+            for i in range(4**(level-1)):
+                lower = rng.uniform(0., 0.8, 2)
+                size = rng.uniform(0.05, 0.2, 2)
+                x = griddle.Dimension(lower[0], lower[0]+size[0], 4, name='x')
+                y = griddle.Dimension(lower[1], lower[1]+size[1], 4, name='y')
+                patch = griddle.geometry.Patch([x, y])
+                patch.level = level
+                patches.append(patch)
+        domain = griddle.geometry.Domain(patches)
+        points = rng.uniform(-0.1, 1.1, (500, 2))
+        located = domain.locate_points(points)
+        for point, j in zip(points, located):
+            containing = [k for k, p in enumerate(patches)
+                          if all(np.asarray(p.lower_global) <= point) and
+                             all(point <= np.asarray(p.upper_global))]
+            if containing:
+                assert patches[j].level == max(patches[k].level for k in containing)
+                assert j in containing
+            else:
+                assert j == -1
+        found = domain.patches_in_box([0.2, 0.3], [0.5, 0.4])
+        expected = [k for k, p in enumerate(patches)
+                    if p.lower_global[0] <= 0.5 and p.upper_global[0] >= 0.2 and
+                       p.lower_global[1] <= 0.4 and p.upper_global[1] >= 0.3]
+        assert sorted(found) == expected
+        assert list(np.diff([patches[k].level for k in found]) >= 0) == [True]*(len(found)-1)
+# ===================================
+
+class test_coordinates(unittest.TestCase):
+    def test_shared_and_broadcast(self):
+        import numpy as np
+        x1 = griddle.Dimension(0., 1., 10, name='x')
+        x2 = griddle.Dimension(0., 1., 10, name='x')
+        assert x1.centers is x2.centers
+        assert np.allclose(x1.centers, [0.05 + 0.1*i for i in range(10)])
+        assert x1.nodes[-1] == 1.0
+        y = griddle.Dimension(-1., 1., 4, name='y')
+        grid = griddle.geometry.Grid((x1, y))
+        xc, yc = grid.c_centers
+        assert xc.shape == (10, 4)
+        assert np.shares_memory(xc, x1.centers)
+        assert (xc[:, 2] == x1.centers).all() and (yc[3, :] == y.centers).all()
+        xe, ye = grid.c_nodes
+        assert xe.shape == (11, 5)
+
+    def test_ghost_coordinates_cached(self):
+        import numpy as np
+        x = griddle.Dimension(0., 1., 10, name='x')
+        y = griddle.Dimension(0., 2., 5, name='y')
+        grid = griddle.geometry.Grid((x, y))
+        xc, yc = grid.c_centers_with_ghost(2)
+        assert xc.shape == (14, 9)
+        assert np.allclose(xc[:, 0], [0.05 + 0.1*i for i in range(-2, 12)])
+        assert grid.c_centers_with_ghost(2) is grid.c_centers_with_ghost(2)
+        assert grid.c_nodes_with_ghost(1)[1].shape == (13, 8)
+        x.upper = 2.
+        assert np.isclose(grid.c_centers_with_ghost(2)[0][-1, 0], 2.3)
+
+    def test_mapc2p_memo(self):
+        import numpy as np
+        calls = []
+        def mapc2p(xc, yc):
+            calls.append(1)
+            return xc + yc, xc - yc
+        memo = griddle.geometry.mapc2p_memo
+        memo.enabled = True
+        try:
+            grids = []
+            for i in range(2):
+                x = griddle.Dimension(0., 1., 4, name='x')
+                y = griddle.Dimension(0., 1., 4, name='y')
+                grid = griddle.geometry.Grid((x, y))
+                grid.mapc2p = mapc2p
+                grids.append(grid)
+            assert grids[0].p_centers is grids[1].p_centers
+            assert len(calls) == 1
+            assert np.allclose(grids[1].p_centers_with_ghost(2)[0],
+                               sum(grids[1].c_centers_with_ghost(2)))
+        finally:
+            memo.enabled = False
+            memo.clear()
+# ===================================
+
+class test_batched_mapping(unittest.TestCase):
+    def test_matches_per_patch(self):
+        import numpy as np
+        calls = []
+        def mapc2p(xc, yc):
+            calls.append(1)
+            return xc*np.cos(yc), xc*np.sin(yc)
+        patches = []
+        for i in range(5):
+            x = griddle.Dimension(0.1*i, 0.1*i + 0.1, 3 + i, name='x')
+            y = griddle.Dimension(0., 1., 4, name='y')
+            patch = griddle.geometry.Patch((x, y))
+            patch.grid.mapc2p = mapc2p
+            patches.append(patch)
+        domain = griddle.geometry.Domain(patches)
+        centers = domain.mapped_centers()
+        nodes = domain.mapped_nodes(num_ghost=2)
+        assert len(calls) == 2
+        assert domain.mapped_centers() is centers
+        assert patches[3].grid.p_centers is centers[3]
+        for patch, c, n in zip(patches, centers, nodes):
+            expected = mapc2p(*patch.grid.c_centers)
+            assert np.allclose(c[0], expected[0]) and np.allclose(c[1], expected[1])
+            expected = mapc2p(*patch.grid.c_nodes_with_ghost(2))
+            assert np.allclose(n[1], expected[1]) and n[1].shape == expected[1].shape
+        patches[0].grid.dimensions[0].upper = 0.2
+        assert domain.mapped_centers() is not centers
+# ===================================
+
+class test_patch_table(unittest.TestCase):
+    def test_table_domain(self):
+        import copy
+        import numpy as np
+        table = np.zeros(4, dtype=griddle.geometry.patch_table_dtype(2))
+        table['level'] = [1, 2, 2, 3]
+        table['patch_index'] = [1, 2, 3, 4]
+        table['lower'] = [[0., 0.], [0., 0.], [0.5, 0.5], [0., 0.]]
+        table['upper'] = [[1., 1.], [0.5, 0.5], [1., 1.], [0.25, 0.25]]
+        table['num_cells'] = [[10, 10], [10, 10], [10, 10], [10, 10]]
+        domain = griddle.geometry.Domain.from_table(table)
+        assert domain.total_num_cells == 400
+        assert domain.patches_on_level(2).tolist() == [1, 2]
+        assert domain.locate_points([[0.1, 0.1], [0.7, 0.7]]).tolist() == [3, 2]
+        assert domain._patches is None
+        assert domain.num_dim == 2
+        patch = domain.patches[2]
+        assert patch.level == 2 and patch.lower_global == [0.5, 0.5]
+        assert (domain.table == table).all()
+
+        patch_copy = copy.deepcopy(patch)
+        assert patch_copy.x is not patch.x
+        assert patch_copy.upper_global == patch.upper_global
+        assert patch_copy.level == 2 and patch_copy.patch_index == 3
+        domain_copy = copy.deepcopy(domain)
+        assert domain_copy.patches[0] is not domain.patches[0]
+        assert domain_copy.total_num_cells == 400
+
+        # The table follows changes of the geometry of the patches
+        patch.level = 3
+        patch.x.upper = 0.75
+        assert domain.table['level'][2] == 3
+        assert domain.table['upper'][2].tolist() == [0.75, 1.]
+        assert domain.table['delta'][2].tolist() == [0.025, 0.05]
+        assert domain.locate_points([[0.8, 0.8]]).tolist() == [0]
+        # ... and is not rebuilt while nothing changes
+        assert domain.table is domain.table
+        assert domain.spatial_index is domain.spatial_index
+        domain.patches = domain.patches[:2]
+        assert len(domain.table) == 2
 # ===================================
+
+class test_inverse_mapping(unittest.TestCase):
+    def test_newton_and_analytic(self):
+        import numpy as np
+        grid = griddle.geometry.Grid((griddle.Dimension(1., 2., 20, name='r'),
+                                      griddle.Dimension(0., np.pi/2, 30, name='theta')))
+        grid.mapc2p = lambda r, t: (r*np.cos(t), r*np.sin(t))
+        rng = np.random.RandomState(0)
+        r = rng.uniform(1., 2., (50, 40))
+        theta = rng.uniform(0., np.pi/2, (50, 40))
+        rc, tc = grid.mapp2c(r*np.cos(theta), r*np.sin(theta))
+        assert rc.shape == (50, 40)
+        assert np.allclose(rc, r, atol=1e-8) and np.allclose(tc, theta, atol=1e-8)
+
+        i, j = grid.locate_cells(r*np.cos(theta), r*np.sin(theta))
+        assert (i == np.floor((r - 1.)/0.05)).all()
+        assert (grid.locate_cells(np.array([3.]), np.array([3.]))[0] == -1).all()
+
+        grid.mapp2c = lambda x, y: (np.hypot(x, y), np.arctan2(y, x))
+        rc, tc = grid.mapp2c(r*np.cos(theta), r*np.sin(theta))
+        assert np.allclose(rc, r) and np.allclose(tc, theta)
+        grid.mapc2p = lambda r, t: (r*np.cos(t), r*np.sin(t))
+        assert grid.mapp2c == grid._solve_mapp2c
+
+    def test_inverse_1d_and_3d(self):
+        import numpy as np
+        # In 1D, every kind of inverse returns a list of arrays
+        grid = griddle.geometry.Grid(griddle.Dimension(0., 1., 10, name='x'))
+        x = np.array([0.25, 0.5])
+        for mapc2p, mapp2c in [(None, None), (lambda x: 2*x, None),
+                               (lambda x: 2*x, lambda p: p/2)]:
+            if mapc2p is not None:
+                grid.mapc2p = mapc2p
+            if mapp2c is not None:
+                grid.mapp2c = mapp2c
+            c = grid.mapp2c(x)
+            assert len(c) == 1 and np.allclose(c[0], x/(1. if mapc2p is None else 2.))
+            assert grid.locate_cells(x)[0].tolist() == \
+                ([2, 5] if mapc2p is None else [1, 2])
+
+        # The lookup table seeding the solver stays small in 3D
+        grid = griddle.geometry.Grid([griddle.Dimension(0., 1., 100, name=name)
+                                      for name in 'xyz'])
+        grid.mapc2p = lambda x, y, z: (x + 0.1*y, y, z*(1. + x))
+        p = np.array([[0.5, 0.5, 0.5], [0.2, 0.7, 0.1]])
+        c = grid.mapp2c(*p.T)
+        assert np.allclose(np.stack(grid.mapc2p(*c), axis=1), p)
+        assert len(grid._lookup_table()[0]) <= 4096
@@ -184,6 +184,127 @@ def test_amr_plotting():
     assert type(plot_objects[0][0]) is matplotlib.collections.QuadMesh
     return fig
 
+def test_composite_pcolor():
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    item = {'data_path': './test_data/_amrclaw_2d_acoustics/',
+            'field': 0,
+            'composite': (100, 50),
+            'plot_type': 'pcolor',
+            'axes': ax}
+    plot_objects = griddle.plot_frame([item],frame_num=5)
+    assert len(plot_objects[0]) == 1
+    image = plot_objects[0][0]
+    assert image.get_array().shape == (50, 100)
+    frame = item['frames'][5]
+    zmax = max(state.q[0].max() for state in frame.states)
+    assert image.get_clim()[1] <= zmax
+
+    # A box covering one of the finest patches, with a pixel per cell,
+    # shows the values of that patch
+    finest = max(frame.states, key=lambda state: state.patch.level)
+    patch = finest.patch
+    item['axis_settings'] = {'xlim': (patch.lower_global[0], patch.upper_global[0]),
+                             'ylim': (patch.lower_global[1], patch.upper_global[1])}
+    item['composite'] = patch.num_cells_global
+    image = griddle.plot_frame([item],frame_num=5)[0][0]
+    assert np.array_equal(image.get_array(), finest.q[0].T)
+
+    for state in frame.states:
+        state.grid.mapc2p = lambda x, y: (x + y, y)
+    with pytest.raises(Exception):
+        griddle.resample.composite(frame, (10, 10))
+
+def test_preview_pcolor():
+    fig = plt.figure(figsize=(2, 2), dpi=50)
+    ax = fig.add_subplot(111)
+    item = {'data_path': './test_data/_amrclaw_2d_acoustics/',
+            'field': 0,
+            'preview': True,
+            'plot_type': 'pcolor',
+            'axes': ax}
+    image = griddle.plot_frame([item],frame_num=5)[0][0]
+    # The axes are less than 100 pixels wide, so the 2x average suffices
+    assert image.get_array().shape == (100, 100)
+    # Coarser levels are block averages of the full resolution composite
+    levels = item['frames'].preview(5)['levels']
+    assert np.allclose(levels[1], levels[0].reshape(100, 2, 100, 2).mean(axis=(1, 3)))
+    item['full_resolution'] = True
+    image = griddle.plot_frame([item],frame_num=5)[0][0]
+    assert image.get_array().shape == (200, 200)
+
+    # Redrawing at full resolution restores the previous setting
+    ip = griddle.Iplot([item])
+    ip.frameno = 5
+    ip.do_f('')
+    assert item['full_resolution'] is True
+    del item['full_resolution']
+    ip.do_f('')
+    assert 'full_resolution' not in item
+
+def test_items_sharing_time_series():
+    ts = griddle.data.TimeSeries('./test_data/_amrclaw_2d_acoustics/')
+    fig = plt.figure()
+    items = [{'frames': ts, 'data_path': './test_data/_amrclaw_2d_acoustics/',
+              'field': field, 'plot_type': 'pcolor',
+              'axes': fig.add_subplot(1, 2, field + 1)} for field in (0, 1)]
+    plot_objects = griddle.plot_frame(items, frame_num=5)
+    # Both components are loaded, once
+    assert ts.fields == {0, 1}
+    assert ts.cache_info()['misses'] == 1
+    for field, meshes in zip((0, 1), plot_objects):
+        for mesh, state in zip(meshes, ts[5].states):
+            assert np.allclose(mesh.get_array().ravel(), state.q[field].ravel())
+
+def test_loading_windows():
+    path = './test_data/_amrclaw_2d_acoustics/'
+    # A window set by the user is kept when the items have no limits
+    item = {'data_path': path, 'field': 0, 'plot_type': 'pcolor',
+            'time_series_options': {'max_level': 1}}
+    griddle.plot_frame([item], frame_num=5)
+    assert [state.patch.level for state in item['frames'][5].states] == [1]
+
+    # Items sharing a series load the patches visible in any of them, and
+    # plotting again uses the cached frame
+    ts = griddle.data.TimeSeries(path)
+    fig = plt.figure()
+    items = [{'frames': ts, 'data_path': path, 'field': 0, 'plot_type': 'pcolor',
+              'axis_settings': {'xlim': xlim}, 'axes': fig.add_subplot(1, 2, i + 1)}
+             for i, xlim in enumerate([(-1., -0.5), (0.5, 1.)])]
+    for i in range(2):
+        griddle.plot_frame(items, frame_num=5)
+    assert ts.bbox == [(-1., 1.)]
+    assert ts.cache_info()['misses'] == 1
+
+def test_expression_field():
+    item = {'data_path': './test_data/_amrclaw_2d_acoustics/',
+            'field': 'abs(q[0]) + 1.',
+            'plot_type': 'pcolor'}
+    plot_objects = griddle.plot_frame([item],frame_num=5)
+    frame = item['frames'][5]
+    for mesh, state in zip(plot_objects[0], frame.states):
+        assert np.allclose(mesh.get_array().ravel(), (abs(state.q[0]) + 1.).ravel())
+    # Only the component used by the expression is loaded
+    assert item['frames'].fields == {0}
+
+def test_gauge_plot(tmp_path):
+    import shutil
+    # The gauge records are cached next to the data, so use a copy
+    for name in ['fort.gauge', 'fort.q0005', 'fort.t0005']:
+        shutil.copy('./test_data/_amrclaw_2d_acoustics/' + name, str(tmp_path))
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    item = {'data_path': str(tmp_path),
+            'field': 0,
+            'gauge': 1,
+            'plot_type': 'gauge',
+            'axes': ax}
+    plot_objects = griddle.plot_frame([item],frame_num=5)
+    line, marker = plot_objects[0]
+    assert len(line.get_xdata()) == 141
+    assert marker.get_xdata()[0] == 0.25
+    assert len(item['frames']) == 0  # No frame data was loaded
+
 def test_yt_slice_plot():
     try:
         import yt